@@ -3,10 +3,18 @@ import os
 import pandas as pd
 from openpyxl import Workbook
 from openpyxl.styles import PatternFill
+from openpyxl.utils.exceptions import InvalidFileException
 import pdfplumber
 import io
+import shutil
+import tempfile
+import time
+import uuid
+import zipfile
 from datetime import timedelta
 
+import bom_merge
+
 # Flask-configuratie
 app = Flask(__name__)
 UPLOAD_FOLDER = "uploads"
@@ -33,7 +41,7 @@ def allowed_file(filename):
 # Middleware om te controleren of de intro bekeken is
 @app.before_request
 def require_intro():
-    if "intro_viewed" not in session and request.endpoint not in ["intro", "static"]:
+    if "intro_viewed" not in session and request.endpoint not in ["intro", "static", "merge_boms", "download_merge"]:
         return redirect(url_for("intro"))
 
 
@@ -136,11 +144,8 @@ def process_single_pdf(pdf_file):
     return new_df
 
 
-def process_multiple_pdfs(pdf_files):
-    """Verwerkt meerdere PDF-bestanden en combineert ze in één Excel-bestand."""
-    workbook = Workbook()
-    workbook.remove(workbook.active)
-
+def add_bom_sheet(workbook, processed_df, filename):
+    """Schrijft één geconverteerde BOM (uit process_single_pdf) als sheet in de workbook."""
     # Kleurinstellingen
     yellow_fill = PatternFill(
         start_color="FFFFCC", end_color="FFFFCC", fill_type="solid"
@@ -150,47 +155,56 @@ def process_multiple_pdfs(pdf_files):
         start_color="FFFF00", end_color="FFFF00", fill_type="solid"
     )
 
+    # Stel de naam van de sheet in
+    sheet_name = os.path.splitext(os.path.basename(filename))[0][:31]
+    sheet_name = sheet_name.replace("volvo", "").strip()  # Verwijder volvo
+    sheet_name = sheet_name[:31]  # 31 tekens max
+
+    ws = workbook.create_sheet(title=sheet_name)
+
+    # Kolom A startwaarden
+    value_in_a = 10
+
+    # Schrijf gegevens naar de sheet
+    for r_idx, row in enumerate(processed_df.itertuples(index=False), start=1):
+        # Kolom A: Schrijf waarde en pas kleur toe
+        ws.cell(row=r_idx, column=1, value=value_in_a)
+        if r_idx == 1:
+            ws.cell(row=r_idx, column=1).fill = yellow_fill  # Eerste rij geel
+        else:
+            ws.cell(row=r_idx, column=1).fill = blue_fill  # Andere rijen blauw
+
+        if r_idx > 1:
+            value_in_a += 10  # Verhoog met 10 na de eerste rij
+
+        # Kolommen H tot Z
+        ws.cell(row=r_idx, column=8, value=row[0])  # H
+        ws.cell(row=r_idx, column=9, value=row[1])  # I
+        ws.cell(row=r_idx, column=16, value=row[2])  # P
+        ws.cell(row=r_idx, column=26, value=row[3])  # Z
+        ws.cell(row=r_idx, column=13, value=row[4])  # M
+        ws.cell(row=r_idx, column=14, value=row[5])  # N
+        ws.cell(row=r_idx, column=17, value=row[6])  # Q
+        ws.cell(row=r_idx, column=18, value=row[7])  # R
+        ws.cell(row=r_idx, column=25, value=row[8])  # Y
+        ws.cell(row=r_idx, column=19, value=row[9])  # S
+
+        # Kleur kolommen Y en Z geel
+        ws.cell(row=r_idx, column=25).fill = highlight_fill  # Y
+        ws.cell(row=r_idx, column=26).fill = highlight_fill  # Z
+    return ws
+
+
+def process_multiple_pdfs(pdf_files):
+    """Verwerkt meerdere PDF-bestanden en combineert ze in één Excel-bestand."""
+    workbook = Workbook()
+    workbook.remove(workbook.active)
+
     # Verwerk elk bestand
     for pdf_file in pdf_files:
         processed_df = process_single_pdf(pdf_file)
         if not processed_df.empty:
-            # Stel de naam van de sheet in
-            sheet_name = os.path.splitext(os.path.basename(pdf_file.filename))[0][:31]
-            sheet_name = sheet_name.replace("volvo", "").strip()  # Verwijder volvo
-            sheet_name = sheet_name[:31]  # 31 tekens max
-
-            ws = workbook.create_sheet(title=sheet_name)
-
-            # Kolom A startwaarden
-            value_in_a = 10
-
-            # Schrijf gegevens naar de sheet
-            for r_idx, row in enumerate(processed_df.itertuples(index=False), start=1):
-                # Kolom A: Schrijf waarde en pas kleur toe
-                ws.cell(row=r_idx, column=1, value=value_in_a)
-                if r_idx == 1:
-                    ws.cell(row=r_idx, column=1).fill = yellow_fill  # Eerste rij geel
-                else:
-                    ws.cell(row=r_idx, column=1).fill = blue_fill  # Andere rijen blauw
-
-                if r_idx > 1:
-                    value_in_a += 10  # Verhoog met 10 na de eerste rij
-
-                # Kolommen H tot Z
-                ws.cell(row=r_idx, column=8, value=row[0])  # H
-                ws.cell(row=r_idx, column=9, value=row[1])  # I
-                ws.cell(row=r_idx, column=16, value=row[2])  # P
-                ws.cell(row=r_idx, column=26, value=row[3])  # Z
-                ws.cell(row=r_idx, column=13, value=row[4])  # M
-                ws.cell(row=r_idx, column=14, value=row[5])  # N
-                ws.cell(row=r_idx, column=17, value=row[6])  # Q
-                ws.cell(row=r_idx, column=18, value=row[7])  # R
-                ws.cell(row=r_idx, column=25, value=row[8])  # Y
-                ws.cell(row=r_idx, column=19, value=row[9])  # S
-
-                # Kleur kolommen Y en Z geel
-                ws.cell(row=r_idx, column=25).fill = highlight_fill  # Y
-                ws.cell(row=r_idx, column=26).fill = highlight_fill  # Z
+            add_bom_sheet(workbook, processed_df, pdf_file.filename)
 
     # Sla het bestand op in een BytesIO-buffer
     output = io.BytesIO()
@@ -214,6 +228,87 @@ def download_file():
     )
 
 
+# ===========================================
+# Equipment/main-BOM merge (engine in bom_merge.py)
+# ===========================================
+MERGE_FOLDER = os.path.join(UPLOAD_FOLDER, "merged")
+MERGE_MAX_AGE = int(os.getenv("BOM_MERGE_MAX_AGE", "3600"))   # sec, daarna wordt een resultaat opgeruimd
+
+# Resultaten staan op schijf, niet in het geheugen: met meerdere gunicorn-workers
+# kan de download op een andere worker binnenkomen dan de merge.
+os.makedirs(MERGE_FOLDER, exist_ok=True)
+
+
+def merge_path(merge_id):
+    return os.path.join(MERGE_FOLDER, f"{merge_id}.xlsx")
+
+
+def cleanup_merges(max_age=MERGE_MAX_AGE):
+    """Verwijder gemergde bestanden ouder dan max_age seconden."""
+    cutoff = time.time() - max_age
+    for name in os.listdir(MERGE_FOLDER):
+        path = os.path.join(MERGE_FOLDER, name)
+        try:
+            if os.path.getmtime(path) < cutoff:
+                os.remove(path)
+        except FileNotFoundError:
+            pass   # al opgeruimd door een andere worker
+
+
+@app.route("/bom-merge", methods=["POST"])
+def merge_boms():
+    """Merge equipment + geconverteerde BOMs in de main BOM; JSON-resultaat per machine."""
+    equipment = request.files.get("equipment")
+    main = request.files.get("main")
+    converted = [f for f in request.files.getlist("converted[]") if f and f.filename]
+    if not (equipment and main and converted):
+        return {"error": "equipment, converted[] en main zijn verplicht"}, 400
+
+    cleanup_merges()
+    merge_id = uuid.uuid4().hex
+    with tempfile.TemporaryDirectory() as tmp:
+        equipment_path = os.path.join(tmp, "equipment.xlsx")
+        main_path = os.path.join(tmp, "main.xlsx")
+        output_path = os.path.join(tmp, "merged.xlsx")
+        equipment.save(equipment_path)
+        main.save(main_path)
+        # Volgorde behouden: bij dubbele sheetnamen wint het eerste bestand
+        converted_paths = []
+        for i, file in enumerate(converted):
+            path = os.path.join(tmp, f"converted-{i}.xlsx")
+            file.save(path)
+            converted_paths.append(path)
+
+        try:
+            results = bom_merge.merge(equipment_path, converted_paths, main_path, output_path)
+        except (ValueError, zipfile.BadZipFile, InvalidFileException) as e:
+            # Fout in de geüploade bestanden (kolommen, geen xlsx, ...); al het andere wordt een gelogde 500
+            app.logger.warning("BOM-merge geweigerd: %s", e)
+            return {"error": f"Merge mislukt: {e}"}, 400
+        # Pas zichtbaar voor downloads als het bestand volledig is
+        shutil.move(output_path, merge_path(merge_id) + ".part")
+        os.replace(merge_path(merge_id) + ".part", merge_path(merge_id))
+
+    return {"machines": results, "download_url": url_for("download_merge", merge_id=merge_id)}
+
+
+@app.route("/bom-merge/<merge_id>")
+def download_merge(merge_id):
+    """Download van een eerder gemergde main BOM."""
+    # Enkel ids zoals merge_boms ze maakt (geen paden)
+    if len(merge_id) != 32 or not all(c in "0123456789abcdef" for c in merge_id):
+        return "Ongeldig merge-id", 400
+    path = merge_path(merge_id)
+    if not os.path.exists(path):
+        return "Geen gemergd bestand gevonden", 404
+
+    return send_file(
+        os.path.abspath(path),
+        as_attachment=True,
+        download_name="merged-bom.xlsx",
+        mimetype="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+    )
+
 if __name__ == "__main__":
     port = int(os.environ.get("PORT", 5000))  # Railway gebruikt de dynamische poort
     app.run(debug=False, host="0.0.0.0", port=port)
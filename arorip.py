@@ -1,12 +1,34 @@
-from flask import Flask, render_template, request, jsonify
+from flask import Flask, render_template, request, jsonify, Response, send_file
 from selenium import webdriver
 from selenium.webdriver.common.by import By
 from selenium.webdriver.support.ui import WebDriverWait
 from selenium.webdriver.support import expected_conditions as EC
+from selenium.common.exceptions import WebDriverException
 import os
+import atexit
+import base64
+import hashlib
+import io
+import json
+import queue
+import re
+import shutil
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from contextlib import contextmanager
+from datetime import datetime
+from fnmatch import fnmatchcase
+from html.parser import HTMLParser
+from urllib.parse import urljoin
 from zipfile import ZipFile, BadZipFile
 from pathlib import Path
 import requests
+from watchdog.events import FileSystemEventHandler
+from watchdog.observers import Observer
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 from flask import Flask, request, jsonify
 
 # Flask app setup
@@ -23,6 +45,221 @@ save_path = Path("/tmp/AroDocOnline")
 
 os.makedirs(save_path, exist_ok=True)
 
+ARO_URL = os.getenv("ARO_BASE_URL", "https://docs.arotechnologies.com").rstrip("/")
+download_path = Path.home() / "Downloads"      # bewaarde ZIP's (zonder uitpakken)
+# Werkmap per sessie: Firefox en de HTTP-download schrijven daar, nooit in een gedeelde map
+download_root = Path(os.getenv("ARO_DOWNLOAD_ROOT", "/tmp/AroDownloads"))
+
+# Sessiepool: warme, ingelogde browsers die tussen requests hergebruikt worden.
+# Per gunicorn-worker een eigen pool (dus max. workers x ARO_POOL_SIZE browsers).
+ARO_POOL_SIZE       = int(os.getenv("ARO_POOL_SIZE", "2"))
+ARO_LEASE_TIMEOUT   = int(os.getenv("ARO_LEASE_TIMEOUT", "120"))     # sec wachten op een vrije sessie
+ARO_SESSION_MAX_AGE = int(os.getenv("ARO_SESSION_MAX_AGE", "3600"))  # sec, daarna verse browser
+ARO_POOL_PREWARM    = int(os.getenv("ARO_POOL_PREWARM", "0"))        # sessies al openen bij opstart
+
+# Varianten parallel over meerdere sessies (effectief begrensd door ARO_POOL_SIZE)
+ARO_CONCURRENCY   = int(os.getenv("ARO_CONCURRENCY", str(ARO_POOL_SIZE)))
+ARO_RETRIES       = int(os.getenv("ARO_RETRIES", "2"))              # extra pogingen per variant
+ARO_RETRY_BACKOFF = float(os.getenv("ARO_RETRY_BACKOFF", "5"))      # sec, verdubbelt per poging
+
+# Achtergrondjobs (in het geheugen van dit proces -> Procfile2 draait met 1 worker)
+ARO_MAX_JOBS = int(os.getenv("ARO_MAX_JOBS", "2"))       # jobs die tegelijk lopen, de rest wacht
+ARO_JOB_TTL  = int(os.getenv("ARO_JOB_TTL", "3600"))     # sec dat een afgeronde job opvraagbaar blijft
+
+# "http": browser enkel voor login, ZIP rechtstreeks met de sessiecookies (terugval: browser)
+# "browser": klikken + wachten in ~/Downloads zoals vroeger
+ARO_DOWNLOAD_MODE  = os.getenv("ARO_DOWNLOAD_MODE", "http")
+ARO_HTTP_TIMEOUT   = (10, int(os.getenv("ARO_HTTP_READ_TIMEOUT", "60")))   # (connect, read) sec
+ARO_HTTP_RETRIES   = int(os.getenv("ARO_HTTP_RETRIES", "3"))               # hervattingen per ZIP
+ARO_HTTP_CHUNK     = 64 * 1024   # klein genoeg dat een afgebroken stream deels op schijf staat
+
+
+class PoolTimeout(Exception):
+    pass
+
+
+def new_driver(download_dir):
+    # Selenium WebDriver in headless mode, downloads zonder dialoog naar de werkmap van de sessie
+    options = webdriver.FirefoxOptions()
+    options.add_argument("--headless")
+    options.set_preference("browser.download.folderList", 2)
+    options.set_preference("browser.download.dir", str(download_dir))
+    options.set_preference("browser.download.useDownloadDir", True)
+    options.set_preference("browser.download.manager.showWhenStarting", False)
+    options.set_preference("browser.helperApps.neverAsk.saveToDisk",
+                           "application/zip,application/x-zip-compressed,application/octet-stream")
+    return webdriver.Firefox(options=options)
+
+
+class AroSession:
+    """Eén ingelogde browser. Logt opnieuw in als ARO de sessie heeft laten verlopen."""
+
+    def __init__(self, driver_factory=new_driver):
+        self.download_dir = download_root / f"session-{uuid.uuid4().hex[:12]}"
+        self.download_dir.mkdir(parents=True, exist_ok=True)
+        self.driver = driver_factory(self.download_dir)
+        self.created = time.monotonic()
+        self.logins = 0
+        self.uses = 0
+        self.http = None
+        self._http_logins = None
+        try:
+            self.login()
+        except Exception:
+            self.quit()
+            raise
+
+    def login(self):
+        driver = self.driver
+        driver.get(f"{ARO_URL}/index.php")
+        WebDriverWait(driver, 10).until(
+            EC.presence_of_element_located((By.NAME, "nomlogin"))
+        ).send_keys(username)
+        WebDriverWait(driver, 10).until(
+            EC.presence_of_element_located((By.NAME, "motpass"))
+        ).send_keys(password)
+        WebDriverWait(driver, 10).until(
+            EC.element_to_be_clickable((By.CSS_SELECTOR, "input[type='submit']"))
+        ).click()
+        self.logins += 1
+
+    def healthy(self):
+        try:
+            self.driver.current_url
+            return True
+        except WebDriverException:
+            return False
+
+    def expired(self):
+        return time.monotonic() - self.created > ARO_SESSION_MAX_AGE
+
+    def open_variant(self, variant):
+        """Variantpagina openen en naar de 'tableau' frame switchen."""
+        url = f"{ARO_URL}/menu.php?numvariante={variant}"
+        self.driver.switch_to.default_content()
+        self.driver.get(url)
+        # Sessie verlopen -> ARO toont opnieuw het loginformulier
+        if self.driver.find_elements(By.NAME, "nomlogin"):
+            self.login()
+            self.driver.get(url)
+
+        # Wachten op de frame en switchen
+        WebDriverWait(self.driver, 10).until(
+            EC.frame_to_be_available_and_switch_to_it((By.NAME, "tableau"))
+        )
+
+    def http_session(self):
+        """requests.Session met de cookies van de ingelogde browser (opnieuw gekopieerd na elke login)."""
+        if self.http is None:
+            self.http = requests.Session()
+            adapter = HTTPAdapter(pool_maxsize=max(ARO_CONCURRENCY, 1),
+                                  max_retries=Retry(connect=3, backoff_factor=0.5))
+            self.http.mount("https://", adapter)
+            self.http.mount("http://", adapter)
+            self.http.headers["User-Agent"] = self.driver.execute_script("return navigator.userAgent")
+        if self._http_logins != self.logins:
+            self.http.cookies.clear()
+            for c in self.driver.get_cookies():
+                self.http.cookies.set(c["name"], c["value"], domain=c.get("domain", ""), path=c.get("path", "/"))
+            self._http_logins = self.logins
+        return self.http
+
+    def quit(self):
+        try:
+            if self.http is not None:
+                self.http.close()
+            self.driver.quit()
+        except Exception:
+            pass
+        shutil.rmtree(self.download_dir, ignore_errors=True)
+
+
+class SessionPool:
+    """Begrensde pool van AroSessions; lease() leent er één uit met een timeout."""
+
+    def __init__(self, size=ARO_POOL_SIZE, factory=AroSession):
+        self.size = size
+        self.factory = factory
+        self._idle = queue.LifoQueue()   # laatst gebruikte (warmste) sessie eerst
+        self._lock = threading.Lock()
+        self._open = 0
+        self._closed = False
+
+    def _acquire(self, timeout):
+        deadline = time.monotonic() + timeout
+        while True:
+            try:
+                session = self._idle.get_nowait()
+            except queue.Empty:
+                with self._lock:
+                    create = self._open < self.size
+                    if create:
+                        self._open += 1
+                if create:
+                    try:
+                        return self.factory()
+                    except Exception:
+                        with self._lock:
+                            self._open -= 1
+                        raise
+                try:
+                    session = self._idle.get(timeout=max(deadline - time.monotonic(), 0))
+                except queue.Empty:
+                    raise PoolTimeout(f"Geen vrije ARO-sessie binnen {timeout}s ({self.size} in gebruik)")
+
+            if session.healthy() and not session.expired():
+                return session
+            self._discard(session)
+
+    def _discard(self, session):
+        session.quit()
+        with self._lock:
+            self._open -= 1
+
+    @contextmanager
+    def lease(self, timeout=ARO_LEASE_TIMEOUT):
+        session = self._acquire(timeout)
+        try:
+            yield session
+        except WebDriverException:
+            # Browser in onbekende staat: niet teruggeven
+            self._discard(session)
+            raise
+        except BaseException:
+            self._release(session)
+            raise
+        else:
+            self._release(session)
+
+    def _release(self, session):
+        session.uses += 1
+        if self._closed:
+            self._discard(session)
+        else:
+            self._idle.put(session)
+
+    def prewarm(self, n):
+        for _ in range(min(n, self.size)):
+            with self.lease():
+                pass
+
+    def close(self):
+        self._closed = True
+        while True:
+            try:
+                self._discard(self._idle.get_nowait())
+            except queue.Empty:
+                return
+
+    def stats(self):
+        return {"size": self.size, "open": self._open, "idle": self._idle.qsize()}
+
+
+pool = SessionPool()
+atexit.register(pool.close)
+if ARO_POOL_PREWARM:
+    threading.Thread(target=pool.prewarm, args=(ARO_POOL_PREWARM,), daemon=True).start()
+
 
 # Route voor de webpagina
 @app.route("/autobom")
@@ -30,6 +267,674 @@ def autobom_page():
     return render_template("autobom.html")
 
 
+# ==============================
+# Directe HTTP-download
+# ==============================
+class DirectDownloadUnavailable(Exception):
+    """Pagina ziet er anders uit dan verwacht: terugvallen op de browser."""
+
+
+class SessionExpired(Exception):
+    pass
+
+
+class IncompleteDownload(IOError):
+    pass
+
+
+class ChecksumMismatch(IOError):
+    pass
+
+
+class _PageParser(HTMLParser):
+    """Frames (name -> src) en formulieren (action, method, inputs) uit een pagina."""
+
+    def __init__(self):
+        super().__init__()
+        self.frames = {}
+        self.forms = []
+        self._form = None
+
+    def handle_starttag(self, tag, attrs):
+        a = dict(attrs)
+        if tag in ("frame", "iframe") and a.get("name"):
+            self.frames[a["name"]] = a.get("src") or ""
+        elif tag == "form":
+            self._form = {"action": a.get("action") or "", "method": (a.get("method") or "get").lower(), "inputs": []}
+            self.forms.append(self._form)
+        elif tag == "input" and self._form is not None:
+            self._form["inputs"].append(a)
+
+    def handle_endtag(self, tag):
+        if tag == "form":
+            self._form = None
+
+
+def _get_page(http, url):
+    resp = http.get(url, timeout=ARO_HTTP_TIMEOUT)
+    resp.raise_for_status()
+    page = _PageParser()
+    page.feed(resp.text)
+    if any(i.get("name") == "nomlogin" for f in page.forms for i in f["inputs"]):
+        raise SessionExpired(url)
+    return page
+
+
+def download_request(http, variant):
+    """
+    Zelfde request als de Download-knop: variantpagina -> 'tableau' frame -> formulier
+    met de Download-knop. Geeft (method, url, velden) terug.
+    """
+    menu_url = f"{ARO_URL}/menu.php?numvariante={variant}"
+    frame_src = _get_page(http, menu_url).frames.get("tableau")
+    if frame_src is None:
+        raise DirectDownloadUnavailable(f"geen 'tableau' frame op {menu_url}")
+    frame_url = urljoin(menu_url, frame_src)
+
+    for form in _get_page(http, frame_url).forms:
+        submit = next((i for i in form["inputs"] if i.get("value") == "Download"), None)
+        if submit is not None:
+            break
+    else:
+        raise DirectDownloadUnavailable(f"geen Download-formulier in {frame_url}")
+
+    fields = []
+    for i in form["inputs"]:
+        kind = (i.get("type") or "text").lower()
+        if not i.get("name"):
+            continue
+        if kind in ("submit", "button", "image") and i is not submit:
+            continue
+        if kind in ("checkbox", "radio") and "checked" not in i:
+            continue
+        fields.append((i["name"], i.get("value") or ""))
+    return form["method"], urljoin(frame_url, form["action"] or frame_url), fields
+
+
+def _expected_size(resp):
+    if resp.status_code == 206:
+        total = resp.headers.get("Content-Range", "").rpartition("/")[2]
+        return int(total) if total.isdigit() else None
+    length = resp.headers.get("Content-Length")
+    return int(length) if length and length.isdigit() else None
+
+
+def _expected_sha256(resp):
+    """sha256 (hex) van het volledige bestand als de server die meestuurt: X-Checksum-Sha256 of Digest."""
+    value = resp.headers.get("X-Checksum-Sha256")
+    if value:
+        return value.strip().lower()
+    for item in resp.headers.get("Digest", "").split(","):
+        algo, _, encoded = item.strip().partition("=")
+        if algo.lower() == "sha-256" and encoded:
+            try:
+                return base64.b64decode(encoded, validate=True).hex()
+            except ValueError:
+                return None
+    return None
+
+
+def stream_to_file(http, method, url, fields, dest, previous=None):
+    """
+    Download in chunks naar <dest>.part met sha256; bij een afgebroken verbinding
+    hervatten met een Range-request. Pas na een volledige download -> dest.
+    Stuurt de server een sha256 mee en klopt die niet, dan wordt <dest>.part gewist.
+    Met `previous` (manifest-item) een conditionele request: None bij 304 Not Modified.
+    """
+    part = dest.with_name(dest.name + ".part")
+    part.unlink(missing_ok=True)
+    sha = hashlib.sha256()
+    expected_sha = None
+    params, data = (fields, None) if method == "get" else (None, fields)
+    conditional = {}
+    if previous and previous.get("etag"):
+        conditional["If-None-Match"] = previous["etag"]
+    if previous and previous.get("last_modified"):
+        conditional["If-Modified-Since"] = previous["last_modified"]
+
+    for attempt in range(ARO_HTTP_RETRIES + 1):
+        have = part.stat().st_size if part.exists() else 0
+        headers = {"Range": f"bytes={have}-"} if have else conditional
+        try:
+            with http.request(method, url, params=params, data=data, headers=headers,
+                              stream=True, timeout=ARO_HTTP_TIMEOUT) as resp:
+                if resp.status_code == 304:
+                    return None
+                resp.raise_for_status()
+                if "html" in resp.headers.get("Content-Type", ""):
+                    if "nomlogin" in resp.text:
+                        raise SessionExpired(url)
+                    raise DirectDownloadUnavailable(f"HTML i.p.v. ZIP van {url}")
+                if have and resp.status_code != 206:
+                    # Server negeert Range: opnieuw vanaf 0
+                    have, sha = 0, hashlib.sha256()
+                expected = _expected_size(resp)
+                with open(part, "ab" if have else "wb") as f:
+                    for chunk in resp.iter_content(ARO_HTTP_CHUNK):
+                        f.write(chunk)
+                        sha.update(chunk)
+                size = part.stat().st_size
+                if expected is not None and size != expected:
+                    raise IncompleteDownload(f"{size} van {expected} bytes")
+                expected_sha = _expected_sha256(resp) or expected_sha
+                if expected_sha and sha.hexdigest() != expected_sha:
+                    # Corrupt (bv. verkeerd hervat): niet verder op bouwen, volgende poging van voor af aan
+                    part.unlink()
+                    raise ChecksumMismatch(f"sha256 {sha.hexdigest()[:12]} i.p.v. {expected_sha[:12]}")
+                meta = {"etag": resp.headers.get("ETag"), "last_modified": resp.headers.get("Last-Modified")}
+            break
+        except (requests.ConnectionError, requests.Timeout, requests.exceptions.ChunkedEncodingError,
+                IncompleteDownload, ChecksumMismatch):
+            if attempt == ARO_HTTP_RETRIES:
+                raise
+            # Wat al binnen is blijft staan; hash opnieuw opbouwen voor het hervatten
+            sha = hashlib.sha256()
+            if part.exists():
+                with open(part, "rb") as f:
+                    for block in iter(lambda: f.read(ARO_HTTP_CHUNK), b""):
+                        sha.update(block)
+            time.sleep(2 ** attempt)
+
+    os.replace(part, dest)
+    return dict(meta, size=size, sha256=sha.hexdigest())
+
+
+def http_download(session, variant, zip_path, previous=None):
+    """Variant-ZIP rechtstreeks ophalen; één keer opnieuw inloggen als de sessie verlopen is."""
+    for attempt in range(2):
+        http = session.http_session()
+        try:
+            method, url, fields = download_request(http, variant)
+            return stream_to_file(http, method, url, fields, zip_path, previous)
+        except SessionExpired:
+            if attempt:
+                raise
+            session.driver.switch_to.default_content()
+            session.login()
+
+
+# ==============================
+# Download-voltooiing (filesystem events)
+# ==============================
+ARO_DOWNLOAD_TIMEOUT = int(os.getenv("ARO_DOWNLOAD_TIMEOUT", "30"))      # sec tot de ZIP er moet zijn
+ARO_STABLE_SECONDS   = float(os.getenv("ARO_STABLE_SECONDS", "0.5"))    # zo lang geen wijziging = klaar
+
+_observer = None
+_observer_lock = threading.Lock()
+
+
+def _get_observer():
+    global _observer
+    with _observer_lock:
+        if _observer is None:
+            _observer = Observer()
+            _observer.daemon = True
+            _observer.start()
+        return _observer
+
+
+class _DirChanged(FileSystemEventHandler):
+    def __init__(self):
+        self.changed = threading.Event()
+
+    def on_any_event(self, event):
+        self.changed.set()
+
+
+class DownloadTimeout(Exception):
+    pass
+
+
+def wait_for_download(zip_path, timeout=ARO_DOWNLOAD_TIMEOUT, stable=ARO_STABLE_SECONDS):
+    """
+    Wacht (op inotify-events, niet pollen) tot Firefox zip_path volledig heeft geschreven:
+    het bestand bestaat en is niet leeg, er is geen <naam>.part meer en er is `stable`
+    seconden geen enkele wijziging in de map geweest.
+    """
+    part = zip_path.with_name(zip_path.name + ".part")
+    handler = _DirChanged()
+    observer = _get_observer()
+    watch = observer.schedule(handler, str(zip_path.parent), recursive=False)
+    try:
+        deadline = time.monotonic() + timeout
+        while True:
+            handler.changed.clear()
+            if zip_path.exists() and zip_path.stat().st_size > 0 and not part.exists():
+                # Kandidaat: alleen klaar als het rustig blijft
+                if not handler.changed.wait(stable):
+                    return zip_path.stat().st_size
+                continue
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise DownloadTimeout(f"{zip_path.name} niet binnen {timeout}s gedownload")
+            handler.changed.wait(remaining)
+    finally:
+        observer.unschedule(watch)
+
+
+def browser_download(session, variant, zip_path):
+    """Download-knop in de browser en wachten tot Firefox het bestand heeft weggeschreven."""
+    driver = session.driver
+    session.open_variant(variant)
+
+    # Wachten op de downloadknop en klikken
+    download_button = WebDriverWait(driver, 10).until(
+        EC.element_to_be_clickable((By.XPATH, "//input[@value='Download']"))
+    )
+    # Restant van een vorige (mislukte) poging: anders meteen "klaar" of "_<variant>(1).zip"
+    zip_path.unlink(missing_ok=True)
+    zip_path.with_name(zip_path.name + ".part").unlink(missing_ok=True)
+
+    download_button.click()
+
+    size = wait_for_download(zip_path)
+    return {"size": size, "sha256": file_sha256(zip_path)}
+
+
+# ==============================
+# Manifest: incrementele sync
+# ==============================
+# <save_path>/manifest.json, per variant: laatste download, grootte, sha256,
+# etag/last-modified van ARO en de uitgepakte bestanden (naam -> crc/grootte).
+manifest_path = save_path / "manifest.json"
+_manifest_lock = threading.Lock()
+
+
+def file_sha256(path):
+    sha = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(ARO_HTTP_CHUNK), b""):
+            sha.update(block)
+    return sha.hexdigest()
+
+
+def load_manifest():
+    try:
+        with open(manifest_path, encoding="utf-8") as f:
+            return json.load(f)
+    except (FileNotFoundError, ValueError):
+        return {}
+
+
+def update_manifest(variant, entry):
+    """Eén variant bijwerken; opnieuw inlezen + atomisch wegschrijven (andere threads/workers)."""
+    with _manifest_lock:
+        manifest = load_manifest()
+        manifest[variant] = entry
+        tmp = manifest_path.with_name(f"{manifest_path.name}.{os.getpid()}.tmp")
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(manifest, f, indent=1, sort_keys=True)
+        os.replace(tmp, manifest_path)
+
+
+# ==============================
+# Selectief uitpakken + BOM-conversie
+# ==============================
+# Enkel ZIP-leden die door de patronen komen worden uitgepakt (fnmatch op het pad in de
+# ZIP of de bestandsnaam, hoofdletterongevoelig, komma-gescheiden). Lege include = alles,
+# zoals de "uitpakken"-checkbox belooft; ARO_BOM_INCLUDE kiest welke PDF's convert_boms omzet.
+ARO_EXTRACT_INCLUDE = [p.strip().lower() for p in os.getenv("ARO_EXTRACT_INCLUDE", "").split(",") if p.strip()]
+ARO_EXTRACT_EXCLUDE = [p.strip().lower() for p in os.getenv("ARO_EXTRACT_EXCLUDE", "").split(",") if p.strip()]
+ARO_BOM_INCLUDE     = [p.strip().lower() for p in os.getenv("ARO_BOM_INCLUDE", "*bom*.pdf").split(",") if p.strip()]
+ARO_CONVERT_BOM     = os.getenv("ARO_CONVERT_BOM", "0") == "1"   # standaard voor "convert" in /download
+
+# Variantnamen komen in bestandsnamen en paden terecht (ZIP, uitpakmap, <variant>-bom.xlsx)
+VARIANT_NAME = re.compile(r"[A-Za-z0-9_-]+")
+
+
+def valid_variant(variant):
+    return bool(VARIANT_NAME.fullmatch(variant))
+
+
+def _matches(name, patterns):
+    name = name.lower()
+    base = name.rsplit("/", 1)[-1]
+    return any(fnmatchcase(name, p) or fnmatchcase(base, p) for p in patterns)
+
+
+def member_selected(name):
+    return (not ARO_EXTRACT_INCLUDE or _matches(name, ARO_EXTRACT_INCLUDE)) and not _matches(name, ARO_EXTRACT_EXCLUDE)
+
+
+def selected_members(zObject):
+    return [info for info in zObject.infolist() if not info.is_dir() and member_selected(info.filename)]
+
+
+def bom_members(zObject):
+    return [info for info in zObject.infolist()
+            if not info.is_dir() and _matches(info.filename, ARO_BOM_INCLUDE)
+            and not _matches(info.filename, ARO_EXTRACT_EXCLUDE)]
+
+
+def _stream_member(zObject, info, target):
+    # In blokken via een .part-bestand: nooit een half bestand onder de echte naam
+    target.parent.mkdir(parents=True, exist_ok=True)
+    tmp = target.with_name(target.name + ".part")
+    with zObject.open(info) as src, open(tmp, "wb") as dst:
+        shutil.copyfileobj(src, dst, ARO_HTTP_CHUNK)
+    os.replace(tmp, target)
+
+
+def sync_extract(zip_path, extract_path, previous_members):
+    """
+    Enkel geselecteerde, nieuwe/gewijzigde leden uitpakken (crc + grootte uit de ZIP-directory)
+    en bestanden die niet meer (geselecteerd) in de ZIP zitten verwijderen.
+    Geeft (leden, uitgepakt, verwijderd).
+    """
+    root = extract_path.resolve()
+    members, written = {}, 0
+    with ZipFile(zip_path, "r") as zObject:
+        for info in selected_members(zObject):
+            target = extract_path / info.filename
+            if root not in target.resolve().parents:
+                continue   # "../" in de ZIP: niet buiten de variantmap schrijven
+            members[info.filename] = [info.CRC, info.file_size]
+            if previous_members.get(info.filename) == members[info.filename] and target.exists():
+                continue
+            _stream_member(zObject, info, target)
+            written += 1
+
+    removed = 0
+    for name in set(previous_members) - set(members):
+        target = (extract_path / name).resolve()
+        if root in target.parents and target.exists():
+            target.unlink()
+            removed += 1
+            # Lege submappen mee opruimen
+            parent = target.parent
+            while parent != root and not any(parent.iterdir()):
+                parent.rmdir()
+                parent = parent.parent
+    return members, written, removed
+
+
+def convert_boms(zip_path, variant):
+    """
+    BOM-PDF's (ARO_BOM_INCLUDE) rechtstreeks uit de ZIP (zonder ze uit te pakken) door de
+    BOM-converter van app.py; één sheet per PDF. Geeft (pad, aantal sheets) of (None, 0).
+    """
+    if not valid_variant(variant):
+        raise ValueError(f"Ongeldige variantnaam: {variant!r}")
+    import app as bom_converter   # pdfplumber/openpyxl enkel nodig als er geconverteerd wordt
+
+    workbook = bom_converter.Workbook()
+    workbook.remove(workbook.active)
+    with ZipFile(zip_path, "r") as zObject:
+        for info in bom_members(zObject):
+            if not info.filename.lower().endswith(".pdf"):
+                continue
+            with zObject.open(info) as f:
+                processed_df = bom_converter.process_single_pdf(io.BytesIO(f.read()))
+            if not processed_df.empty:
+                bom_converter.add_bom_sheet(workbook, processed_df, info.filename)
+    if not workbook.sheetnames:
+        return None, 0
+
+    target = save_path / f"{variant}-bom.xlsx"
+    tmp = target.with_name(target.name + ".part")
+    workbook.save(tmp)
+    os.replace(tmp, target)
+    return target, len(workbook.sheetnames)
+
+
+def download_variant(session, variant, extract_zip, sync=True, convert=False):
+    """
+    Eén variant downloaden (en uitpakken) met een ingelogde sessie; geeft de logregel(s) terug.
+    Met sync: ongewijzigde varianten (304 of zelfde sha256) overslaan, enkel gewijzigde leden uitpakken.
+    Met convert: de BOM-PDF's uit de ZIP meteen omzetten naar <save_path>/<variant>-bom.xlsx.
+    """
+    zip_path = download_path / f"_{variant}.zip"           # bewaarde ZIP (zonder uitpakken)
+    scratch = session.download_dir / f"_{variant}.zip"     # waar de download binnenkomt
+    extract_path = save_path / variant
+    now = datetime.now().isoformat(timespec="seconds")
+    selection = {"include": ARO_EXTRACT_INCLUDE, "exclude": ARO_EXTRACT_EXCLUDE}
+
+    recorded = load_manifest().get(variant) if sync else None
+    previous = recorded
+    # Vorige resultaat moet er nog staan (uitgepakte map of bewaarde ZIP)
+    if previous:
+        if extract_zip:
+            # Andere patronen = andere leden: opnieuw uitpakken
+            still_there = (extract_path.is_dir() and previous.get("extracted")
+                           and previous.get("selection") == selection)
+        else:
+            still_there = zip_path.exists()
+        if convert and not (previous.get("converted") and Path(previous["converted"]).exists()):
+            still_there = False
+        if not still_there:
+            previous = None
+
+    log = ""
+    info = None
+    if ARO_DOWNLOAD_MODE == "http":
+        try:
+            info = http_download(session, variant, scratch, previous)
+            if info is None:
+                update_manifest(variant, dict(previous, checked_at=now))
+                return f"Variant {variant} ongewijzigd op ARO (304), overgeslagen.\n"
+            log += f"Variant {variant} rechtstreeks gedownload ({info['size'] / 1024:,.0f} kB, sha256 {info['sha256'][:12]}).\n"
+        except DirectDownloadUnavailable as e:
+            log += f"Directe download niet mogelijk ({e}), via de browser.\n"
+    if info is None:
+        info = browser_download(session, variant, scratch)
+
+    entry = {"downloaded_at": now, "checked_at": now, "size": info["size"], "sha256": info["sha256"],
+             "etag": info.get("etag"), "last_modified": info.get("last_modified"),
+             "extracted": False, "members": {}}
+    if previous and previous.get("sha256") == info["sha256"]:
+        if extract_zip:
+            scratch.unlink(missing_ok=True)
+        else:
+            shutil.move(scratch, zip_path)
+        update_manifest(variant, dict(entry, extracted=previous.get("extracted", False),
+                                      members=previous.get("members", {}),
+                                      selection=previous.get("selection"),
+                                      converted=previous.get("converted")))
+        return log + f"Variant {variant} ongewijzigd (zelfde sha256), niets uitgepakt.\n"
+
+    if convert:
+        try:
+            workbook_path, sheets = convert_boms(scratch, variant)
+        except BadZipFile:
+            scratch.unlink(missing_ok=True)
+            raise BadZipFile(f"Bestand voor variant {variant} is geen geldig ZIP-bestand.")
+        if workbook_path:
+            entry["converted"] = str(workbook_path)
+            log += f"BOM voor variant {variant} geconverteerd naar {workbook_path} ({sheets} sheet(s)).\n"
+        else:
+            log += f"Geen BOM-PDF's gevonden in variant {variant}.\n"
+
+    # ZIP-bestand uitpakken alleen als de checkbox is aangevinkt
+    if not extract_zip:
+        download_path.mkdir(parents=True, exist_ok=True)
+        shutil.move(scratch, zip_path)
+        update_manifest(variant, entry)
+        return log + f"ZIP-bestand voor variant {variant} gedownload naar {zip_path}.\n"
+    try:
+        # Ook bij gewijzigde patronen: wat vroeger uitgepakt is en nu niet meer geselecteerd, opruimen
+        old_members = (recorded or {}).get("members", {})
+        members, written, removed = sync_extract(scratch, extract_path, old_members)
+    except BadZipFile:
+        raise BadZipFile(f"Bestand voor variant {variant} is geen geldig ZIP-bestand.")
+    finally:
+        scratch.unlink(missing_ok=True)
+    update_manifest(variant, dict(entry, extracted=True, members=members, selection=selection))
+    return log + (f"Documenten voor variant {variant} uitgepakt naar {extract_path} "
+                  f"({written} van {len(members)} geselecteerde bestanden nieuw/gewijzigd, {removed} verwijderd).\n")
+
+
+def download_with_retry(variant, extract_zip, sync=True, convert=False, lease_timeout=ARO_LEASE_TIMEOUT,
+                        cancel=None):
+    """
+    Eén variant met een geleende sessie, met herhaalpogingen bij fouten (time-outs,
+    browser weg, half ZIP-bestand). Geeft de status van de variant terug.
+    """
+    t0 = time.monotonic()
+    cancel = cancel or threading.Event()
+    result = {"variant": variant, "status": "error", "attempts": 0, "seconds": 0.0, "message": ""}
+    for attempt in range(1, ARO_RETRIES + 2):
+        if cancel.is_set():
+            result.update(status="cancelled", message=f"Variant {variant} geannuleerd.\n")
+            break
+        result["attempts"] = attempt
+        try:
+            with pool.lease(lease_timeout) as session:
+                result["message"] = download_variant(session, variant, extract_zip, sync, convert)
+            result["status"] = "ok"
+            break
+        except PoolTimeout as e:
+            # Geen sessie vrij: zelfde backoff en aantal pogingen, intussen komt er mogelijk een vrij
+            result["message"] = f"Fout bij variant {variant} (poging {attempt}): {e}\n"
+        except Exception as e:
+            result["message"] = f"Fout bij variant {variant} (poging {attempt}): {type(e).__name__}: {e}\n"
+        if attempt <= ARO_RETRIES:
+            cancel.wait(ARO_RETRY_BACKOFF * 2 ** (attempt - 1))
+    result["seconds"] = round(time.monotonic() - t0, 1)
+    return result
+
+
+def download_variants(variant_list, extract_zip, sync=True, convert=False, cancel=None, on_event=None):
+    """
+    Alle varianten, max. ARO_CONCURRENCY tegelijk; resultaten in de volgorde van de invoer.
+    on_event(type, **velden) krijgt 'variant_start' / 'variant_done' zodra ze gebeuren.
+    """
+    on_event = on_event or (lambda kind, **fields: None)
+
+    def run(variant):
+        if not (cancel and cancel.is_set()):
+            on_event("variant_start", variant=variant)
+        result = download_with_retry(variant, extract_zip, sync, convert, cancel=cancel)
+        on_event("variant_done", **result)
+        return result
+
+    workers = max(1, min(ARO_CONCURRENCY, len(variant_list)))
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="aro-download") as executor:
+        futures = {executor.submit(run, v): i for i, v in enumerate(variant_list)}
+        results = [None] * len(variant_list)
+        for future in as_completed(futures):
+            results[futures[future]] = future.result()
+    return results
+
+
+def summary_log(results, seconds):
+    log = ""
+    for r in results:
+        log += f"Variant {r['variant']}: {r['status']} na {r['attempts']} poging(en), {r['seconds']}s\n"
+        log += r["message"]
+    failed = [r["variant"] for r in results if r["status"] == "error"]
+    cancelled = [r["variant"] for r in results if r["status"] == "cancelled"]
+    if failed:
+        log += f"{len(failed)} variant(en) mislukt: {', '.join(failed)}\n"
+    if cancelled:
+        log += f"{len(cancelled)} variant(en) geannuleerd.\n"
+    if not failed and not cancelled:
+        log += "Alle documenten zijn gedownload.\n"
+    return log + f"Totale duur: {seconds:.1f}s\n"
+
+
+# ==============================
+# Achtergrondjobs
+# ==============================
+class Job:
+    """
+    Eén downloadbatch. Events zijn genummerd (seq) zodat een client met
+    Last-Event-ID of ?after= verder kan lezen waar hij gebleven was.
+    """
+
+    def __init__(self, variants, extract_zip, sync, convert=False):
+        self.id = uuid.uuid4().hex
+        self.variants = variants
+        self.extract_zip = extract_zip
+        self.sync = sync
+        self.convert = convert
+        self.status = "queued"
+        self.created = time.time()
+        self.finished = None
+        self.results = {}
+        self.log = ""
+        self.events = []
+        self.cancel = threading.Event()
+        self._cond = threading.Condition()
+
+    def emit(self, kind, **fields):
+        with self._cond:
+            self.events.append(dict(fields, seq=len(self.events) + 1, type=kind, ts=time.time()))
+            self._cond.notify_all()
+
+    def events_after(self, seq, timeout):
+        """Events na `seq`; wacht max. `timeout` sec als er nog geen zijn."""
+        with self._cond:
+            if len(self.events) <= seq and not self.done:
+                self._cond.wait(timeout)
+            return self.events[seq:]
+
+    def finish(self, status, log):
+        """Done-event vóór de eindstatus, onder hetzelfde slot: wie `done` ziet, vindt ook het event."""
+        with self._cond:
+            self.log = log
+            self.finished = time.time()
+            self.emit("done", status=status, log=log)
+            self.status = status
+
+    @property
+    def done(self):
+        return self.status in ("done", "cancelled", "error")
+
+    def to_dict(self):
+        counts = {}
+        for r in self.results.values():
+            counts[r["status"]] = counts.get(r["status"], 0) + 1
+        return {"job_id": self.id, "status": self.status, "variants": len(self.variants),
+                "finished_variants": len(self.results), "counts": counts,
+                "results": [self.results[v] for v in self.variants if v in self.results],
+                "log": self.log, "events": len(self.events)}
+
+
+_jobs = {}
+_jobs_lock = threading.Lock()
+_job_executor = ThreadPoolExecutor(max_workers=ARO_MAX_JOBS, thread_name_prefix="aro-job")
+
+
+def run_job(job):
+    if job.cancel.is_set():
+        job.finish("cancelled", "Job geannuleerd voor de start.\n")
+        return
+    job.status = "running"
+    t0 = time.monotonic()
+    job.emit("start", variants=len(job.variants),
+             concurrency=min(ARO_CONCURRENCY, pool.size, len(job.variants)))
+
+    def on_event(kind, **fields):
+        if kind == "variant_done":
+            job.results[fields["variant"]] = fields
+        job.emit(kind, **fields)
+
+    try:
+        results = download_variants(job.variants, job.extract_zip, job.sync, job.convert, job.cancel, on_event)
+        log = summary_log(results, time.monotonic() - t0)
+    except Exception as e:
+        job.finish("error", f"Fout: {e}\n")
+        return
+    job.finish("cancelled" if job.cancel.is_set() else "done", log)
+
+
+def submit_job(variants, extract_zip, sync, convert=False):
+    now = time.time()
+    job = Job(variants, extract_zip, sync, convert)
+    with _jobs_lock:
+        for job_id in [j.id for j in _jobs.values() if j.finished and now - j.finished > ARO_JOB_TTL]:
+            del _jobs[job_id]
+        _jobs[job.id] = job
+    job.emit("queued", variants=len(variants))
+    _job_executor.submit(run_job, job)
+    return job
+
+
+def get_job(job_id):
+    with _jobs_lock:
+        return _jobs.get(job_id)
+
+
 # API route voor het verwerken van de downloadactie
 @app.route("/download", methods=["POST"])
 def download_action():
@@ -41,81 +946,106 @@ def download_action():
 
         variants = data.get("variants", "")
         extract_zip = data.get("extract", False)
+        sync = data.get("sync", True)   # ongewijzigde varianten overslaan (manifest)
+        convert = data.get("convert", ARO_CONVERT_BOM)   # BOM-PDF's meteen naar Excel
 
         if not variants.strip():
             return jsonify({"log": "Geen varianten opgegeven."})
 
-        variant_list = [v.strip() for v in variants.splitlines() if v.strip()]
+        # Dubbele varianten maar één keer (zelfde ZIP-bestandsnaam)
+        variant_list = list(dict.fromkeys(v.strip() for v in variants.splitlines() if v.strip()))
+        invalid = [v for v in variant_list if not valid_variant(v)]
+        if invalid:
+            return jsonify({"log": f"Ongeldige variantnaam (enkel letters, cijfers, _ en -): {', '.join(invalid)}\n"}), 400
 
-        log = "Inloggen op ARO DocOnline...\n"
+        if data.get("wait"):
+            # Oude gedrag: alles binnen deze request (scripts)
+            t0 = time.monotonic()
+            results = download_variants(variant_list, extract_zip, sync, convert)
+            return jsonify({"log": summary_log(results, time.monotonic() - t0), "results": results})
 
-        # Selenium WebDriver in headless mode
-        options = webdriver.FirefoxOptions()
-        options.add_argument("--headless")
-        driver = webdriver.Firefox(options=options)
+        job = submit_job(variant_list, extract_zip, sync, convert)
+        return jsonify({
+            "job_id": job.id,
+            "log": f"Job {job.id} gestart: {len(variant_list)} varianten.\n",
+            "status_url": f"/download/{job.id}",
+            "events_url": f"/download/{job.id}/events",
+        }), 202
 
-        driver.get("https://docs.arotechnologies.com/index.php")
-        WebDriverWait(driver, 10).until(
-            EC.presence_of_element_located((By.NAME, "nomlogin"))
-        ).send_keys(username)
-        WebDriverWait(driver, 10).until(
-            EC.presence_of_element_located((By.NAME, "motpass"))
-        ).send_keys(password)
-        WebDriverWait(driver, 10).until(
-            EC.element_to_be_clickable((By.CSS_SELECTOR, "input[type='submit']"))
-        ).click()
+    except Exception as e:
+        return jsonify({"log": f"Fout: {str(e)}"}), 500
 
-        log += "Succesvol ingelogd op ARO DocOnline.\n"
 
-        download_path = Path.home() / "Downloads"
+@app.get("/download/<job_id>")
+def download_status(job_id):
+    job = get_job(job_id)
+    if job is None:
+        return jsonify({"log": "Onbekende job."}), 404
+    return jsonify(job.to_dict())
 
-        for variant in variant_list:
-            log += f"Bezig met variant: {variant}\n"
-            driver.get(
-                f"https://docs.arotechnologies.com/menu.php?numvariante={variant}"
-            )
 
-            # Wachten op de frame en switchen
-            WebDriverWait(driver, 10).until(
-                EC.frame_to_be_available_and_switch_to_it((By.NAME, "tableau"))
-            )
+def event_cursor(raw):
+    """Last-Event-ID / ?after= als volgnummer; ongeldig of negatief = van voor af aan (0)."""
+    try:
+        return max(int(raw or 0), 0)
+    except (TypeError, ValueError):
+        return 0
 
-            # Wachten op de downloadknop en klikken
-            download_button = WebDriverWait(driver, 10).until(
-                EC.element_to_be_clickable((By.XPATH, "//input[@value='Download']"))
-            )
-            download_button.click()
 
-            zip_path = download_path / f"_{variant}.zip"
-            extract_path = save_path / variant
+@app.get("/download/<job_id>/events")
+def download_events(job_id):
+    """Server-Sent Events: één event per voortgangsstap, stopt na 'done'."""
+    job = get_job(job_id)
+    if job is None:
+        return jsonify({"log": "Onbekende job."}), 404
+    after = event_cursor(request.headers.get("Last-Event-ID") or request.args.get("after"))
 
-            # Wachten tot het bestand is gedownload
-            WebDriverWait(driver, 30).until(
-                lambda d: zip_path.exists() and zip_path.stat().st_size > 0
-            )
+    def stream(seq):
+        while True:
+            events = job.events_after(seq, timeout=15)
+            if not events and job.done:
+                # Klaar na de wachttijd: het done-event staat er al (zie Job.finish), nog meesturen
+                events = job.events_after(seq, timeout=0)
+                if not events:
+                    return
+            if not events:
+                yield ": keepalive\n\n"
+                continue
+            for event in events:
+                seq = event["seq"]
+                yield f"id: {seq}\nevent: {event['type']}\ndata: {json.dumps(event)}\n\n"
+                if event["type"] == "done":
+                    return
 
-            # ZIP-bestand uitpakken alleen als de checkbox is aangevinkt
-            if extract_zip:
-                try:
-                    with ZipFile(zip_path, "r") as zObject:
-                        zObject.extractall(path=extract_path)
-                    os.remove(zip_path)
-                    log += f"Documenten voor variant {variant} gedownload en uitgepakt naar {extract_path}.\n"
-                except BadZipFile:
-                    log += f"Fout: Bestand voor variant {variant} is geen geldig ZIP-bestand.\n"
-                    os.remove(zip_path)
-            else:
-                log += (
-                    f"ZIP-bestand voor variant {variant} gedownload naar {zip_path}.\n"
-                )
-
-        driver.quit()
-        log += "Alle documenten zijn gedownload.\n"
+    return Response(stream(after), mimetype="text/event-stream",
+                    headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
 
-        return jsonify({"log": log})
 
-    except Exception as e:
-        return jsonify({"log": f"Fout: {str(e)}"}), 500
+@app.post("/download/<job_id>/cancel")
+def download_cancel(job_id):
+    """Wachtende varianten vallen weg; een variant die al loopt wordt nog afgewerkt."""
+    job = get_job(job_id)
+    if job is None:
+        return jsonify({"log": "Onbekende job."}), 404
+    job.cancel.set()
+    job.emit("cancel_requested")
+    return jsonify({"job_id": job.id, "status": job.status}), 202
+
+
+@app.get("/bom/<variant>")
+def download_bom(variant):
+    """Geconverteerde BOM van een variant (zie convert_boms)."""
+    if not valid_variant(variant):
+        return jsonify({"log": "Ongeldige variantnaam."}), 400
+    converted = (load_manifest().get(variant) or {}).get("converted")
+    if not converted or not Path(converted).exists():
+        return jsonify({"log": f"Geen geconverteerde BOM voor variant {variant}."}), 404
+    return send_file(
+        converted,
+        as_attachment=True,
+        download_name=f"{variant}-bom.xlsx",
+        mimetype="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+    )
 
 
 
@@ -0,0 +1,193 @@
+// Client-side rendering van de PSF staafgrafiek.
+// Werkt op de compacte 'agg-store' (per timer/NPT/spot/kwaliteit/adaptief/switched cel,
+// zie spot_cells in psf_dashboard.py) en volgt dezelfde filters als update_chart.
+window.dash_clientside = Object.assign({}, window.dash_clientside, {
+    psf: {
+        renderChart: function (agg, timer, npt, nokOnly, adaptiefValue, tolband,
+                               minWelds, maxWelds, minPsf, maxPsf, sigmaThreshold, sigmaClicks, page) {
+            function message(title) {
+                var fig = {data: [], layout: {title: {text: title}}};
+                return [fig, 'figuur ' + Math.round(JSON.stringify(fig).length / 1024) + ' kB', {scalable: false}];
+            }
+            if (!agg || !agg.cells) {
+                return message('⚠️ Geen geldige data geladen');
+            }
+            var c = agg.cells;
+            if (!c.spot.length) {
+                return message('⚠️ Geen data gevonden');
+            }
+
+            var applySigma = (sigmaClicks || 0) % 2 === 1;
+            var thr = (sigmaThreshold !== null && sigmaThreshold !== undefined &&
+                       sigmaThreshold >= agg.min_thr) ? sigmaThreshold : agg.default_thr;
+            var nok = (nokOnly || []).indexOf('nok') >= 0;
+            var adaptief = (adaptiefValue || []).indexOf('adaptief') >= 0;
+            var wantActive = applySigma ? 1 : (adaptief ? 1 : 0);
+            var timerCode = timer ? agg.timers.indexOf(timer) : null;
+            var nptCode = npt ? agg.npts.indexOf(npt) : null;
+
+            // Rij-filters + her-stapelen per (spot, kwaliteit)
+            var groups = {};
+            var order = [];
+            var anyRow = false;
+            for (var i = 0; i < c.spot.length; i++) {
+                if (timerCode !== null && c.timer[i] !== timerCode) continue;
+                if (nptCode !== null && c.npt[i] !== nptCode) continue;
+                if (nok && c.ok[i] !== 0) continue;
+                if (c.active[i] !== wantActive) continue;
+                if (tolband === 'not_switched' && c.switched[i] !== 0) continue;
+                if (tolband === 'switched' && c.switched[i] !== 1) continue;
+                anyRow = true;
+                var spot = agg.spots[c.spot[i]];
+                var q = c.ok[i] === 1 ? 'ok' : 'nok';
+                var key = spot + '\u0000' + q;
+                var g = groups[key];
+                if (!g) {
+                    g = groups[key] = {spot: spot, q: q, count: 0, psfSum: 0, psfN: 0, sdSum: 0, sdN: 0,
+                                       cond: null, lower: null};
+                    order.push(key);
+                }
+                g.count += c.count[i];
+                g.psfSum += c.psf_sum[i];
+                g.psfN += c.psf_n[i];
+                g.sdSum += c.sd_sum[i];
+                g.sdN += c.sd_n[i];
+                if (g.cond === null) g.cond = c.cond[i];
+                if (g.lower === null) g.lower = c.lower[i];
+            }
+            if (!anyRow) {
+                return message('⚠️ Geen data na filters');
+            }
+
+            // Numerieke filters + sigma + aanbevolen band (zelfde logica als XML)
+            var minW = (minWelds !== null && minWelds !== undefined) ? minWelds : 0;
+            var maxW = (maxWelds !== null && maxWelds !== undefined) ? maxWelds : Infinity;
+            var minP = (minPsf !== null && minPsf !== undefined) ? minPsf : 0;
+            var maxP = (maxPsf !== null && maxPsf !== undefined) ? maxPsf : Infinity;
+            var rows = [];
+            order.forEach(function (key) {
+                var g = groups[key];
+                g.avg = g.psfN ? g.psfSum / g.psfN : 0;
+                g.sd = g.sdN ? g.sdSum / g.sdN : 0;
+                g.adj = g.avg - 6 * g.sd;
+                if (g.count < minW || g.count > maxW) return;
+                if (g.avg < minP || g.avg > maxP) return;
+                if (applySigma && !(g.adj > thr && g.q === 'nok')) return;
+                var band = null;
+                if (thr < g.adj && g.adj < agg.psf_hi) band = agg.low_band;
+                else if (agg.psf_hi <= g.adj && g.adj <= 100) band = agg.high_band;
+                g.label = band ? band.v9 + '/' + band.v11 : '—';
+                g.match = (band ? (g.lower === band.v9 && g.cond === band.v11)
+                                : (g.lower === null && g.cond === null)) ? 'match' : 'mismatch';
+                rows.push(g);
+            });
+            if (!rows.length) {
+                return message('ℹ️ Geen rijen na (extra) filters');
+            }
+
+            var spotStats = {};
+            rows.forEach(function (g) {
+                var s = spotStats[g.spot] || (spotStats[g.spot] = {nok: 0, adj: Infinity});
+                if (g.q === 'nok') s.nok += g.count;
+                s.adj = Math.min(s.adj, g.adj);
+            });
+            var spots = Object.keys(spotStats);
+            var scalable = spots.length > agg.max_spots;
+            var info;
+            if (scalable) {
+                // Worst-first: meeste NOK-lassen eerst, daarna laagste adjusted PSF
+                spots.sort(function (a, b) {
+                    return (spotStats[b].nok - spotStats[a].nok) || (spotStats[a].adj - spotStats[b].adj);
+                });
+                var pages = Math.ceil(spots.length / agg.page_size);
+                var p = Math.min(Math.max(parseInt(page || 1, 10), 1), pages);
+                info = spots.length + ' spots (slechtste eerst) — pagina ' + p + '/' + pages + ', hover voor details';
+                spots = spots.slice((p - 1) * agg.page_size, p * agg.page_size);
+                var shown = {};
+                spots.forEach(function (s) { shown[s] = true; });
+                rows = rows.filter(function (g) { return shown[g.spot]; });
+            } else {
+                spots.sort();
+                info = spots.length + ' spots';
+            }
+
+            var fmt = function (v) { return (v === null || v === undefined) ? '' : v; };
+            var traces = [['ok', 'green'], ['nok', 'red']].map(function (qc) {
+                var part = rows.filter(function (g) { return g.q === qc[0]; });
+                var trace = {
+                    type: 'bar', name: qc[0], marker: {color: qc[1]},
+                    x: part.map(function (g) { return g.spot; }),
+                    y: part.map(function (g) { return g.count; })
+                };
+                if (scalable) {
+                    trace.customdata = part.map(function (g) { return Math.round(g.adj * 10) / 10; });
+                    trace.hovertemplate = '%{x}<br>lassen: %{y}<br>adjusted PSF: %{customdata}<extra>%{fullData.name}</extra>';
+                } else {
+                    trace.text = trace.y;
+                    trace.textposition = 'outside';
+                    trace.textfont = {size: 14};
+                    trace.cliponaxis = false;
+                    trace.customdata = part.map(function (g) {
+                        return [g.avg, g.sd, g.adj, fmt(g.cond), fmt(g.lower), g.label, g.match];
+                    });
+                    trace.hovertemplate = 'Kwaliteit=' + qc[0] + '<br>SpotName=%{x}<br>Aantal lassen=%{y}' +
+                        '<br>avg_psf=%{customdata[0]:.2f}<br>stdev_psf=%{customdata[1]:.2f}' +
+                        '<br>adjusted_psf=%{customdata[2]:.2f}<br>cond_tol=%{customdata[3]}' +
+                        '<br>lower_tol=%{customdata[4]}<br>aanbevolen_label=%{customdata[5]}' +
+                        '<br>band_match=%{customdata[6]}<extra></extra>';
+                }
+                return trace;
+            });
+
+            var fig = {
+                data: traces,
+                layout: {
+                    barmode: 'stack',
+                    title: {text: 'Aantal lassen per SpotName (OK/NOK)' +
+                                  (applySigma ? ' — Sigma (NOK) actief, drempel ' + thr : '')},
+                    font: {family: 'Arial, sans-serif', size: 15, color: 'black'},
+                    xaxis: {categoryorder: 'array', categoryarray: spots, tickangle: 45,
+                            tickfont: {size: 12}, title: {text: 'SpotName'}},
+                    yaxis: {title: {text: 'Aantal lassen'}},
+                    margin: {l: 40, r: 40, t: 60, b: 160},
+                    legend: {title: {text: 'Kwaliteit'}},
+                    autosize: true
+                }
+            };
+            var kb = Math.round(JSON.stringify(fig).length / 1024);
+            return [fig, info + ' — figuur ' + kb + ' kB (client-side)', {scalable: scalable}];
+        },
+
+        // Opties voor timer/NPT uit de dropdown-index (NPT -> timer -> [spots, NOK-spots])
+        dropdownOptions: function (index, npt, timer) {
+            index = index || {};
+            var label = function (name, spots, nok) {
+                return name + '  (' + nok + ' NOK / ' + spots + ' spots)';
+            };
+            var nptOptions = Object.keys(index).filter(function (n) { return n !== ''; }).sort().map(function (n) {
+                var spots = 0, nok = 0;
+                Object.keys(index[n]).forEach(function (t) { spots += index[n][t][0]; nok += index[n][t][1]; });
+                return {label: label(n, spots, nok), value: n};
+            });
+
+            var scope = npt && index[npt] ? [npt] : Object.keys(index);
+            var perTimer = {};
+            scope.forEach(function (n) {
+                Object.keys(index[n]).forEach(function (t) {
+                    var c = perTimer[t] || (perTimer[t] = [0, 0]);
+                    c[0] += index[n][t][0];
+                    c[1] += index[n][t][1];
+                });
+            });
+            var timerOptions = Object.keys(perTimer).sort().map(function (t) {
+                return {label: label(t, perTimer[t][0], perTimer[t][1]), value: t};
+            });
+
+            var timerValue = window.dash_clientside.no_update;
+            if (timer && npt && !(index[npt] && index[npt][timer])) {
+                timerValue = null;
+            }
+            return [timerOptions, nptOptions, timerValue];
+        }
+    }
+});
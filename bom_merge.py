@@ -0,0 +1,547 @@
+"""
+Merge-engine voor equipment-lijst + geconverteerde BOMs -> main BOM.
+
+Zonder GUI en zonder globale toestand: alle invoer is expliciet en merge() geeft
+per machine een resultaat terug (zelfde velden als de JSONL-samenvatting).
+Gebruikt door test.py (Tkinter), de /bom-merge endpoint in app.py en de CLI:
+
+    python bom_merge.py --equipment equipment.xlsx --converted conv1.xlsx conv2.xlsx --main main.xlsx
+    python bom_merge.py ... --output merged.xlsx --log-level DEBUG --json
+"""
+import argparse
+import copy
+import json
+import os
+import sys
+import time
+import warnings
+import weakref
+from bisect import bisect_left, bisect_right
+from collections import defaultdict
+
+import pandas as pd
+from openpyxl import load_workbook
+from openpyxl.cell.cell import Cell, MergedCell
+from openpyxl.worksheet.cell_range import CellRange
+from openpyxl.styles import Color
+from openpyxl.styles.cell_style import StyleArray
+from openpyxl.styles.numbers import BUILTIN_FORMATS_MAX_SIZE, BUILTIN_FORMATS_REVERSE
+
+
+warnings.filterwarnings("ignore", category=UserWarning, module="openpyxl")
+
+# Constants
+MOVING_ARM_KEYWORD = "Moving Arm"
+FIXED_ARM_KEYWORD = "Fixed Arm"
+CONSOLE_KEYWORD = "Console"
+# Kolommen die de equipment-lijst minstens moet hebben
+EQUIPMENT_COLUMNS = ['MachineNumber', 'Completemov.Arm', 'Completefix.Arm', 'CONSOLE']
+# Tab color definitions
+TAB_COLOR_COMPLETE = Color(rgb="FF00FF00")  # Green for complete ALLE 3 SUCCESVOL
+TAB_COLOR_PARTIAL = Color(rgb="FF800080")   # PAARS GEDEELTELIJK (ARM)
+TAB_COLOR_MISSING = Color(rgb="FFFF0000")   # Red (CONSOLE ISSUE)
+
+LOG_FILE = "process_log.txt"
+SUMMARY_FILE = "process_summary.jsonl"   # één JSON-regel per machine
+# DEBUG = ook elke gekopieerde cel loggen (traag op grote merges)
+LOG_LEVELS = {"DEBUG": 10, "INFO": 20, "WARNING": 30}
+LOG_LEVEL = LOG_LEVELS.get(os.getenv("BOM_LOG_LEVEL", "INFO").upper(), 20)
+LOG_BUFFER_SIZE = 256 * 1024
+
+
+class MergeLog:
+    """
+    Log of one merge run. Keeps the file-like `write()` used by all merge helpers,
+    but filters on level and writes through one buffered file handle.
+    Per machine a structured summary goes to SUMMARY_FILE as a JSON line.
+    path/summary_path None = niet wegschrijven (bv. de webendpoint).
+    """
+
+    def __init__(self, path=LOG_FILE, summary_path=SUMMARY_FILE, level=LOG_LEVEL):
+        self.level = level
+        self._file = open(path, "w", buffering=LOG_BUFFER_SIZE, encoding="utf-8") if path else None
+        self._summary = (open(summary_path, "w", buffering=LOG_BUFFER_SIZE, encoding="utf-8")
+                         if summary_path else None)
+        self.machines = 0
+
+    def write(self, message, level=LOG_LEVELS["INFO"]):
+        if level >= self.level and self._file:
+            self._file.write(message)
+
+    def enabled(self, level):
+        return level >= self.level
+
+    def machine_summary(self, **fields):
+        if self._summary:
+            self._summary.write(json.dumps(fields, default=str) + "\n")
+        self.machines += 1
+
+    def close(self):
+        for f in (self._file, self._summary):
+            if f:
+                f.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class ConvertedBomIndex:
+    """
+    Sheet index over the converted BOM files.
+    Each file is opened once (read-only) for its sheet names; a workbook is only
+    fully loaded when one of its sheets is actually needed, and then only once.
+    """
+
+    def __init__(self, files):
+        self.files = list(files)
+        self._owner = {}       # sheet name -> file (first file wins, like the old loop)
+        self._workbooks = {}   # file -> fully loaded workbook
+        for path in self.files:
+            wb = load_workbook(path, read_only=True)
+            try:
+                for name in wb.sheetnames:
+                    self._owner.setdefault(name, path)
+            finally:
+                wb.close()
+
+    def __contains__(self, sheet_name):
+        return sheet_name in self._owner
+
+    def __len__(self):
+        return len(self._owner)
+
+    def source_file(self, sheet_name):
+        return self._owner.get(sheet_name)
+
+    def get(self, sheet_name):
+        """Worksheet for `sheet_name`, or None if no converted file has it."""
+        path = self._owner.get(sheet_name)
+        if path is None:
+            return None
+        if path not in self._workbooks:
+            # Volledig laden (geen read-only): merged cells en stijlen zijn nodig om te kopiëren
+            self._workbooks[path] = load_workbook(path)
+        return self._workbooks[path][sheet_name]
+
+
+class SectionMap:
+    """
+    Section boundaries of one main BOM sheet: every row with a value in column G
+    starts a section (Moving Arm, Fixed Arm, Console, ...) that runs until the next one.
+    Built in a single pass; rows inserted/deleted in the planned layout are reported
+    through rows_inserted / rows_deleted so the map keeps matching the plan.
+    """
+
+    def __init__(self, sheet, end_row=None):
+        self.sheet = sheet
+        self.end_row = end_row or (lambda: sheet.max_row)   # last row of the sheet
+        self.rows = []     # G rows, ascending
+        self.values = []   # G value per row in self.rows
+        self._found = {}   # keyword (lower) -> index in self.rows
+        for row_idx, (g_value,) in enumerate(sheet.iter_rows(min_col=7, max_col=7, values_only=True), start=1):
+            if g_value:
+                self.rows.append(row_idx)
+                self.values.append(g_value)
+
+    def find(self, section_keyword):
+        """First section whose G value contains the keyword (case-insensitive), or None."""
+        keyword = section_keyword.lower()
+        if keyword not in self._found:
+            self._found[keyword] = next(
+                (i for i, value in enumerate(self.values) if isinstance(value, str) and keyword in value.lower()),
+                None,
+            )
+        index = self._found[keyword]
+        return None if index is None else self.rows[index]
+
+    def next_boundary(self, row):
+        """First G row after `row`, or max_row + 1 if `row` is in the last section."""
+        i = bisect_right(self.rows, row)
+        return self.rows[i] if i < len(self.rows) else self.end_row() + 1
+
+    def rows_inserted(self, idx, amount=1):
+        i = bisect_left(self.rows, idx)
+        self.rows[i:] = [r + amount for r in self.rows[i:]]
+
+    def rows_deleted(self, idx, amount=1):
+        lo, hi = bisect_left(self.rows, idx), bisect_left(self.rows, idx + amount)
+        self.rows[hi:] = [r - amount for r in self.rows[hi:]]
+        if hi > lo:
+            del self.rows[lo:hi], self.values[lo:hi]
+            self._found.clear()
+
+    def refresh(self, first_row, last_row, g_values):
+        """New G values for rows first_row..last_row (copied data can contain G values)."""
+        lo, hi = bisect_left(self.rows, first_row), bisect_right(self.rows, last_row)
+        rows, values = [], []
+        for row_idx, g_value in enumerate(g_values, start=first_row):
+            if g_value:
+                rows.append(row_idx)
+                values.append(g_value)
+        if hi > lo or rows:
+            self.rows[lo:hi], self.values[lo:hi] = rows, values
+            self._found.clear()
+
+
+class _PlannedRow:
+    """One row of a planned layout: where its cells come from."""
+    __slots__ = ("old_row", "cleared", "source")
+
+    def __init__(self, old_row=None):
+        self.old_row = old_row   # row in the sheet as it is now (None = new row)
+        self.cleared = False     # values of the old row wiped, styles kept
+        self.source = None       # cells of a source row copied over it
+
+
+class SheetLayout:
+    """
+    Plan-then-rebuild writer for one target sheet.
+    Section replacements are applied to a row plan first; apply()
+    then rebuilds the sheet in one pass (cells, merged ranges, row heights), instead of
+    letting every insert_rows/delete_rows shift all cells below it.
+    """
+
+    def __init__(self, sheet):
+        self.sheet = sheet
+        self.rows = [_PlannedRow(r) for r in range(1, sheet.max_row + 1)]
+        self.sections = SectionMap(sheet, end_row=lambda: len(self.rows))
+        self.merges = []   # (top row, bottom row, min_col, max_col) as planned rows
+        for mcr in sheet.merged_cells.ranges:
+            self.merges.append((self.rows[mcr.min_row - 1], self.rows[mcr.max_row - 1], mcr.min_col, mcr.max_col))
+        self.changed = False
+
+    def replace_section(self, source_sheet, start_row, log):
+        """
+        Plan the rows under `start_row` up to the next G value to be replaced by the
+        rows of `source_sheet` (existing rows keep their styles, extra rows are added).
+        """
+        next_g_row = self.sections.next_boundary(start_row)
+        available_rows = next_g_row - start_row - 1
+        source_rows = list(source_sheet.iter_rows(min_row=1, max_row=source_sheet.max_row))
+        needed_rows = len(source_rows)
+        log.write(f"Available rows: {available_rows}, Needed rows: {needed_rows}.\n")
+
+        body = self.rows[start_row:start_row + min(available_rows, needed_rows)]
+        body += [_PlannedRow() for _ in range(needed_rows - len(body))]
+        for planned, source_row in zip(body, source_rows):
+            planned.cleared = True
+            planned.source = source_row
+        self.rows[start_row:next_g_row - 1] = body
+
+        if needed_rows > available_rows:
+            log.write(f"Adding {needed_rows - available_rows} extra rows to fit data.\n")
+            self.sections.rows_inserted(next_g_row, needed_rows - available_rows)
+        elif needed_rows < available_rows:
+            log.write(f"Removing {available_rows - needed_rows} excess rows.\n")
+            self.sections.rows_deleted(start_row + 1 + needed_rows, available_rows - needed_rows)
+        g_values = [next((c.value for c in row if c.column == 7), None) for row in source_rows]
+        self.sections.refresh(start_row + 1, start_row + needed_rows, g_values)
+
+        for mcr in source_sheet.merged_cells.ranges:
+            if mcr.max_row <= needed_rows:
+                self.merges.append((body[mcr.min_row - 1], body[mcr.max_row - 1], mcr.min_col, mcr.max_col))
+        self.changed = True
+
+    def apply(self, log=None):
+        """Rebuild the sheet from the plan in one sequential pass."""
+        if not self.changed:
+            return
+        ws = self.sheet
+        old_cells = defaultdict(list)
+        for (row_idx, _), cell in ws._cells.items():
+            if not isinstance(cell, MergedCell):   # worden hieronder opnieuw aangemaakt
+                old_cells[row_idx].append(cell)
+        old_dims = dict(ws.row_dimensions)
+        for mcr in list(ws.merged_cells.ranges):
+            ws.merged_cells.remove(mcr)
+
+        trace = log is not None and log.enabled(LOG_LEVELS["DEBUG"])
+        new_cells, new_row_of = {}, {}
+        ws.row_dimensions.clear()
+        for new_row, planned in enumerate(self.rows, start=1):
+            new_row_of[id(planned)] = new_row
+            for cell in old_cells.get(planned.old_row, ()):
+                cell.row = new_row
+                if planned.cleared:
+                    cell.value = None
+                new_cells[(new_row, cell.column)] = cell
+            if planned.old_row in old_dims:
+                dim = old_dims[planned.old_row]
+                dim.index = new_row
+                ws.row_dimensions[new_row] = dim
+            for source_cell in planned.source or ():
+                target_cell = new_cells.get((new_row, source_cell.column))
+                if target_cell is None:
+                    target_cell = new_cells[(new_row, source_cell.column)] = Cell(ws, row=new_row, column=source_cell.column)
+                target_cell.value = source_cell.value
+                if source_cell.has_style:
+                    copy_cell_style(source_cell, target_cell)
+                if trace:
+                    log.write(f"Copied cell ({source_cell.row}, {source_cell.column}) -> ({new_row}, {source_cell.column}). "
+                              f"Value: {source_cell.value}\n", LOG_LEVELS["DEBUG"])
+        ws._cells = new_cells
+
+        # Merged ranges meeverhuizen; ranges waarvan rijen weggevallen zijn vervallen
+        for top, bottom, min_col, max_col in self.merges:
+            new_top, new_bottom = new_row_of.get(id(top)), new_row_of.get(id(bottom))
+            if new_top is None or new_bottom is None or new_bottom < new_top:
+                continue
+            ws.merge_cells(CellRange(min_col=min_col, min_row=new_top, max_col=max_col, max_row=new_bottom).coord)
+        if log:
+            log.write(f"Rebuilt sheet '{ws.title}': {len(self.rows)} rows, {len(new_cells)} cells.\n")
+        self.changed = False
+
+
+def find_section_row(sections, section_keyword, log):
+    """
+    Find the start row of a section in the target sheet.
+    """
+    log.write(f"Searching for section start with keyword '{section_keyword}'.\n")
+    row = sections.find(section_keyword)  # Keyword staat in kolom G
+    if row:
+        log.write(f"Found section '{section_keyword}' start at row {row}.\n")
+        return row
+    log.write(f"Section '{section_keyword}' not found.\n")
+    return None
+
+
+class StyleMap:
+    """
+    Style ids of one source workbook translated to ids in one target workbook.
+    Each distinct source style is added to the target's style lists once; after that
+    copying a style is a dict lookup plus six integer assignments.
+    """
+    STYLE_LISTS = (("fontId", "_fonts"), ("fillId", "_fills"), ("borderId", "_borders"),
+                   ("protectionId", "_protections"), ("alignmentId", "_alignments"))
+
+    def __init__(self):
+        self._ids = {}   # tuple(source StyleArray) -> target ids
+
+    def target_ids(self, source_style, source_wb, target_wb):
+        key = tuple(source_style)
+        ids = self._ids.get(key)
+        if ids is None:
+            ids = {}
+            for attr, list_name in self.STYLE_LISTS:
+                style = getattr(source_wb, list_name)[getattr(source_style, attr)]
+                ids[attr] = getattr(target_wb, list_name).add(copy.copy(style))
+            # Zelfde regel als openpyxl's number_format setter
+            if source_style.numFmtId < BUILTIN_FORMATS_MAX_SIZE:
+                ids["numFmtId"] = source_style.numFmtId
+            else:
+                number_format = source_wb._number_formats[source_style.numFmtId - BUILTIN_FORMATS_MAX_SIZE]
+                ids["numFmtId"] = BUILTIN_FORMATS_REVERSE.get(number_format)
+                if ids["numFmtId"] is None:
+                    ids["numFmtId"] = target_wb._number_formats.add(number_format) + BUILTIN_FORMATS_MAX_SIZE
+            ids = self._ids[key] = tuple(ids.items())
+        return ids
+
+
+# target workbook -> source workbook -> StyleMap (vervalt mee met de workbooks)
+_style_maps = weakref.WeakKeyDictionary()
+
+
+def copy_cell_style(source_cell, target_cell):
+    """Copy the style of one cell (font, border, fill, number format, protection, alignment)."""
+    source_wb, target_wb = source_cell.parent.parent, target_cell.parent.parent
+    style_map = _style_maps.setdefault(target_wb, weakref.WeakKeyDictionary()).setdefault(source_wb, StyleMap())
+    if target_cell._style is None:   # nieuwe Cell() zonder stijl
+        target_cell._style = StyleArray()
+    for attr, style_id in style_map.target_ids(source_cell._style, source_wb, target_wb):
+        setattr(target_cell._style, attr, style_id)
+
+
+def is_na_value(value):
+    """
+    Controleer of een waarde gelijk is aan 'n/a' of vergelijkbare waarden.
+    """
+    NA_VALUES = {"n/a", "n-a", "niet beschikbaar", "nvt", "n.v.t.","N/A"}  # Voeg meer synoniemen toe
+    if value is None:
+        return False
+    if isinstance(value, str) and value.strip().lower() in NA_VALUES:
+        return True
+    return False
+
+
+def process_column(row, column_name, section_keyword, layout, converted_index, log):
+    """
+    Process and copy data for a specific column (section).
+    Handles both Arms and Console logic; the copy is planned on `layout`.
+    """
+    machine_number = str(row['MachineNumber']).strip()
+
+    # Get the value from the column
+    value = row[column_name]
+
+    # Skip empty or 'N/A' values
+    if pd.isna(value) or is_na_value(value):
+        log.write(f"Skipping {section_keyword}: Value is empty or marked as 'n/a' for Machine {machine_number}.\n")
+        return False
+
+    # Convert to string and clean up
+    if isinstance(value, float):
+        value = str(int(value))
+    else:
+        value = str(value).strip()
+
+    # Process valid values
+    log.write(f"Processing {section_keyword}: Looking for value {value}.\n")
+    source_sheet = converted_index.get(value)
+    if source_sheet is not None:
+        log.write(f"Match found for {section_keyword} in sheet {value} "
+                  f"({os.path.basename(converted_index.source_file(value))}).\n")
+
+        # Find the start of the section in the target sheet
+        section_start = find_section_row(layout.sections, section_keyword, log)
+        if not section_start:
+            log.write(f"No section start found for {section_keyword}. Skipping.\n")
+            return False
+
+        log.write(f"Adjusting rows and copying data for {section_keyword}.\n")
+        # Enkel plannen; de sheet wordt na alle secties in één keer herschreven
+        layout.replace_section(source_sheet, section_start, log)
+        return True
+
+    # Handle partial matches or no matches
+    log.write(f"Value {value} not found for {section_keyword}.\n")
+    return False
+
+
+# ===========================================
+# Engine
+# ===========================================
+def process_machine(row, main_wb, converted_index, log, notify):
+    """Merge één equipment-rij in zijn GA-sheet; geeft het resultaat voor die machine terug."""
+    machine_number = row['MachineNumber']
+    target_sheet_name = f"GA-{machine_number}"
+
+    if target_sheet_name not in main_wb.sheetnames:
+        log.write(f"Location {target_sheet_name}: Not found. Skipping.\n")
+        return {"machine": target_sheet_name, "status": "not_found"}
+    t0 = time.perf_counter()
+
+    target_sheet = main_wb[target_sheet_name]
+    layout = SheetLayout(target_sheet)  # Eén scan van kolom G, één rebuild per sheet
+
+    # Process each section and track results
+    success_moving = process_column(row, 'Completemov.Arm', MOVING_ARM_KEYWORD, layout, converted_index, log)
+    success_fixed = process_column(row, 'Completefix.Arm', FIXED_ARM_KEYWORD, layout, converted_index, log)
+    success_console = process_column(row, 'CONSOLE', CONSOLE_KEYWORD, layout, converted_index, log)
+    layout.apply(log)
+
+    # Summarize the results for this location
+    notify(f"Location {target_sheet_name}:\n")
+    notify(f"- Moving Arm: {'Processed' if success_moving else 'Skipped'}\n")
+    notify(f"- Fixed Arm: {'Processed' if success_fixed else 'Skipped'}\n")
+    notify(f"- Console: {'Processed' if success_console else 'Skipped'}\n\n")
+
+    # Tab color rules
+    if not success_console:
+        target_sheet.sheet_properties.tabColor = TAB_COLOR_MISSING
+        status = "missing"
+    elif success_moving and success_fixed and success_console:
+        target_sheet.sheet_properties.tabColor = TAB_COLOR_COMPLETE
+        status = "complete"
+    else:
+        target_sheet.sheet_properties.tabColor = TAB_COLOR_PARTIAL
+        status = "partial"
+    return {"machine": target_sheet_name, "status": status, "moving_arm": success_moving,
+            "fixed_arm": success_fixed, "console": success_console, "rows": target_sheet.max_row,
+            "seconds": round(time.perf_counter() - t0, 3)}
+
+
+def machine_label(value):
+    """MachineNumber als tekst; numerieke nummers uit Excel (5001 / 5001.0) zonder decimalen."""
+    if pd.isna(value):
+        return ""
+    if isinstance(value, float) and value.is_integer():
+        value = int(value)
+    return str(value).strip()
+
+
+def read_equipment(equipment_file):
+    """Equipment-lijst inlezen en controleren; enkel machines die met '5' beginnen."""
+    equipment_df = pd.read_excel(equipment_file)
+    missing = [column for column in EQUIPMENT_COLUMNS if column not in equipment_df.columns]
+    if missing:
+        raise ValueError(f"Ontbrekende kolom(men) in de equipment-lijst: {', '.join(missing)}")
+    equipment_df['MachineNumber'] = equipment_df['MachineNumber'].map(machine_label)
+    return equipment_df[equipment_df['MachineNumber'].str.startswith('5')]
+
+
+def merge(equipment_file, converted_files, main_file, output_file=None, log=None, on_message=None):
+    """
+    Merge de geconverteerde BOMs in de main BOM volgens de equipment-lijst.
+    Resultaat wordt opgeslagen in output_file (standaard main_file zelf).
+    Geeft een lijst met één dict per machine; ValueError bij een ongeldige equipment-lijst.
+    on_message krijgt de voortgangsregels (GUI); zonder callback gaan ze naar de log.
+    """
+    own_log = log is None
+    log = MergeLog(path=None, summary_path=None) if own_log else log
+    notify = on_message or (lambda message: log.write(message + "\n"))
+    try:
+        log.write("=== Processing Started ===\n")
+        equipment_df = read_equipment(equipment_file)
+        main_wb = load_workbook(main_file)
+        converted_index = ConvertedBomIndex(converted_files)
+        log.write(f"Indexed {len(converted_index)} sheets in {len(converted_index.files)} converted file(s).\n")
+
+        results = []
+        for _, row in equipment_df.iterrows():
+            result = process_machine(row, main_wb, converted_index, log, notify)
+            log.machine_summary(**result)
+            results.append(result)
+
+        main_wb.save(output_file or main_file)
+        return results
+    finally:
+        if own_log:
+            log.close()
+
+
+# ===========================================
+# CLI
+# ===========================================
+def parse_args(argv=None):
+    p = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    p.add_argument("--equipment", required=True, help="equipment-lijst (.xlsx, kolom MachineNumber)")
+    p.add_argument("--converted", required=True, nargs="+", help="geconverteerde BOM-bestanden (.xlsx)")
+    p.add_argument("--main", required=True, help="main BOM (.xlsx)")
+    p.add_argument("--output", help="resultaat wegschrijven naar dit pad i.p.v. --main te overschrijven")
+    p.add_argument("--log", default=LOG_FILE, help=f"logbestand (default: {LOG_FILE})")
+    p.add_argument("--summary", default=SUMMARY_FILE, help=f"JSONL-samenvatting per machine (default: {SUMMARY_FILE})")
+    p.add_argument("--log-level", default=None, choices=sorted(LOG_LEVELS, key=LOG_LEVELS.get),
+                   help="default: BOM_LOG_LEVEL of INFO")
+    p.add_argument("--json", action="store_true", help="resultaat als JSON")
+    return p.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    level = LOG_LEVELS[args.log_level] if args.log_level else LOG_LEVEL
+    t0 = time.perf_counter()
+    with MergeLog(args.log, args.summary, level) as log:
+        try:
+            results = merge(args.equipment, args.converted, args.main, args.output, log=log)
+        except ValueError as e:
+            print(f"Fout: {e}", file=sys.stderr)
+            return 2
+    wall = time.perf_counter() - t0
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+    else:
+        print(f"{len(results)} machines, {wall:.1f}s -> {args.output or args.main}")
+        print(f"{'machine':<16}{'status':<11}{'moving':>8}{'fixed':>8}{'console':>9}{'rows':>8}{'sec':>8}")
+        for r in results:
+            flags = ["ja" if r.get(k) else "-" for k in ("moving_arm", "fixed_arm", "console")]
+            print(f"{r['machine']:<16}{r['status']:<11}{flags[0]:>8}{flags[1]:>8}{flags[2]:>9}"
+                  f"{r.get('rows', ''):>8}{r.get('seconds', ''):>8}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
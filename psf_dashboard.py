@@ -1,15 +1,37 @@
-from flask import Flask, send_from_directory
+from flask import Flask, send_from_directory, request, Response
 import dash
-from dash import html, dcc, Input, Output, State
+from dash import html, dcc, Input, Output, State, ctx, no_update, ClientsideFunction
 import pandas as pd
 import plotly.express as px
+import plotly.graph_objects as go
 from dash.exceptions import PreventUpdate
 from xml.sax.saxutils import quoteattr
-from datetime import datetime
+from datetime import datetime, timedelta
 import os
-import pyodbc
+import base64
+import hashlib
+import json
+import re
+import threading
+import time
+import math
+import tempfile
+from collections import OrderedDict
+from contextlib import closing
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
 from io import StringIO
+from urllib.parse import urlencode
 import numpy as np
+import pyarrow as pa
+import pyarrow.parquet as pq
+import psf_history
+import psf_metrics
+import psf_sources
+
+try:
+    import pyodbc
+except ImportError:  # offline (synthetic/replay) zonder ODBC-driver manager
+    pyodbc = None
 
 # ==============================
 # Config / constants
@@ -25,16 +47,58 @@ PSF_THRESH_HI = 85             # grens voor keuze van export-banden
 LOW_BAND  = dict(v3=7, v4=1, v9=60, v10=100, v11=30)  # thr < psf < 85
 HIGH_BAND = dict(v3=7, v4=1, v9=40, v10=100, v11=20)  # 85 <= psf <= 100
 
+# Database / refresh (env-overridable)
+DB_QUERY_TIMEOUT      = int(os.getenv("DB_QUERY_TIMEOUT", "90"))       # sec, per query (0 = geen limiet)
+SNAPSHOT_WAIT_TIMEOUT = int(os.getenv("SNAPSHOT_WAIT_TIMEOUT", "100"))  # sec, max wachten zonder snapshot
+SNAPSHOT_MAX_AGE      = int(os.getenv("SNAPSHOT_MAX_AGE", "600"))       # sec, daarna achtergrond-refresh
+REFRESH_RETRY_DELAY   = int(os.getenv("REFRESH_RETRY_DELAY", "30"))     # sec, na mislukte refresh zonder snapshot
+# Gedeelde snapshot tussen gunicorn-workers (map moet door alle workers beschreven kunnen worden)
+SNAPSHOT_DIR          = os.getenv("PSF_SNAPSHOT_DIR", os.path.join(tempfile.gettempdir(), "psf_snapshot"))
+SNAPSHOT_KEEP         = int(os.getenv("PSF_SNAPSHOT_KEEP", "3"))        # versies bewaard (schijf + geheugen)
+
+# Lijnen/timers die bij een refresh opgehaald worden: "scope=timer_like;scope=timer_like"
+DB_SCOPES        = os.getenv("DB_SCOPES", "GA-5=%GA-5%")
+DB_FETCH_WORKERS = int(os.getenv("DB_FETCH_WORKERS", "4"))   # max. gelijktijdige scope-queries
+
+# Grafiek: boven CHART_MAX_SPOTS spots -> schaalbare modus (worst-first, gepagineerd, slanke hover)
+CHART_MAX_SPOTS = int(os.getenv("CHART_MAX_SPOTS", "300"))
+CHART_PAGE_SIZE = int(os.getenv("CHART_PAGE_SIZE", "100"))
+# Filters/her-stapelen in de browser (assets/psf_chart.js) i.p.v. update_chart op de server
+CLIENTSIDE_CHART = os.getenv("PSF_CLIENTSIDE_CHART", "1") == "1"
+
+# Drill-down: PSF-reeks per las voor één spot, server-side gedownsampled (LTTB)
+SERIES_MAX_HOURS  = int(os.getenv("SERIES_MAX_HOURS", "720"))      # max. bereik (30 dagen)
+SERIES_MAX_ROWS   = int(os.getenv("SERIES_MAX_ROWS", "200000"))    # TOP (n) in de query
+SERIES_POINTS     = int(os.getenv("SERIES_POINTS", "1000"))        # puntenbudget naar de browser
+SERIES_CACHE_TTL  = int(os.getenv("SERIES_CACHE_TTL", "300"))      # sec
+SERIES_CACHE_SIZE = int(os.getenv("SERIES_CACHE_SIZE", "128"))     # aantal (spot, timer, bereik) items
+
+# Bulk data-export (/api/export-data): rijen per CSV-chunk / Parquet row group
+EXPORT_CHUNK_ROWS = int(os.getenv("EXPORT_CHUNK_ROWS", "50000"))
+
+# Databron: "sql" (GADATA), "synthetic" of "replay:<pad>" -- zie psf_sources
+DATA_SOURCE = psf_sources.source_from_env()
+
 REQUIRED_COLUMNS = {
     'TimerName','NPTName','SpotName',
     'cnt_welds_lastShift','AVG_PSF_last_shift','STDEV_stabilisationFactor',
     'uirRegulationActive','Tol=OK','CondTol<40','LowerTol<60','TolBands_switched'
 }
 
+# Enkel deze kolommen gaan mee in df-store (alles wat filter_rows/aggregate_spots leest)
+STORE_COLUMNS = [
+    'TimerName', 'NPTName', 'SpotName', 'Tol=OK', 'uirRegulationActive', 'TolBands_switched',
+    'cnt_welds_lastShift', 'AVG_PSF_last_shift', 'STDEV_stabilisationFactor',
+    'uirPsfCondTol', 'uirPsfLowerTol',
+]
+STORE_CODEC = os.getenv("PSF_STORE_CODEC", "zstd")   # Arrow IPC compressie: zstd | lz4 | none
+
 # ==============================
 # Flask server & static
 # ==============================
 server = Flask(__name__)
+psf_metrics.install(server)   # /metrics + duur/payload per Dash callback
+
 @server.get("/healthz")
 def healthz():
     return {"status": "ok"}, 200
@@ -72,6 +136,10 @@ app.layout = html.Div([
                "display": "block", "marginLeft": "auto", "marginRight": "auto"}
     ),
     dcc.Interval(id="auto-refresh", interval=10*60*1000, n_intervals=0),
+    # Goedkope poll: haalt een nieuwe snapshot op zodra een achtergrond-refresh klaar is
+    dcc.Interval(id="snapshot-poll", interval=5*1000, n_intervals=0),
+    dcc.Store(id="snapshot-version"),
+    dcc.Store(id="dropdown-index"),
 
     html.Div(id='file-info'),
 
@@ -156,13 +224,49 @@ app.layout = html.Div([
                    "display": "block", "marginLeft": "auto", "marginRight": "auto"}
         ),
 
-        dcc.Download(id="download-xml")
+        dcc.Download(id="download-xml"),
+
+        # Bulk export met de huidige filters (uit de snapshot, geen extra DB-query)
+        html.Div([
+            html.A("⬇️ Data (CSV)", id='export-csv-link', href='', target='_blank'),
+            html.A("⬇️ Data (Parquet)", id='export-parquet-link', href='', target='_blank'),
+            html.A("⬇️ Ruwe rijen (Parquet)", id='export-raw-link', href='', target='_blank'),
+        ], style={'display':'flex','justifyContent':'center','gap':'20px','marginTop':'10px'})
     ], style={'textAlign': 'center', 'marginBottom': 30}),
 
+    html.Div([
+        html.Label('Pagina:', style={"fontWeight": "bold"}),
+        dcc.Input(id='chart-page', type='number', min=1, step=1, value=1, debounce=True,
+                  style={'width': '80px'}),
+        html.Span(id='chart-info', style={"color": "#555"}),
+    ], style={'display':'flex','justifyContent':'center','alignItems':'center','gap':'10px'}),
+    dcc.Store(id='chart-mode'),
+    dcc.Store(id='agg-store'),
+
     html.Div(
         dcc.Graph(id='bar-chart', style={'width': '100%', 'height': '900px'}),
         style={'display': 'flex', 'justifyContent': 'center', 'width': '100%'}
-    )
+    ),
+
+    # Details van de gefocuste spot (schaalbare modus laadt die pas bij hover)
+    html.Div(id='spot-detail', style={'display': 'flex', 'justifyContent': 'center', 'marginBottom': 30}),
+
+    # Drill-down: klik op een spot in de grafiek
+    html.Div([
+        html.Label('PSF-reeks per las, periode:', style={"fontWeight": "bold"}),
+        dcc.Dropdown(
+            id='series-hours',
+            options=[
+                {'label': 'Laatste shift (8u)', 'value': 8},
+                {'label': '24 uur',             'value': 24},
+                {'label': '7 dagen',            'value': 24 * 7},
+                {'label': '30 dagen',           'value': 24 * 30},
+            ],
+            value=24, clearable=False, style={'width': '200px'}
+        ),
+    ], style={'display':'flex','justifyContent':'center','alignItems':'center','gap':'10px'}),
+    dcc.Graph(id='spot-series', style={'width': '100%', 'height': '450px'},
+              figure=go.Figure(layout=dict(title="Klik op een spot in de grafiek voor de PSF-reeks")))
 ])
 
 # ============ Helpers ============
@@ -176,6 +280,8 @@ def normalize_tol_ok(value):
         return pd.NA
 
 def get_sql_connection():
+    if pyodbc is None:
+        raise RuntimeError("pyodbc is niet geïnstalleerd; gebruik PSF_DATA_SOURCE=synthetic of replay:<pad>.")
     server   = os.getenv("DB_SERVER", r"EQUI_DB_PROD.gen.volvocars.net\DBSQLEQVCGP")
     database = os.getenv("DB_DATABASE", "GADATA")
     user     = os.getenv("DB_USERNAME")  # zet deze env vars correct
@@ -247,11 +353,52 @@ WHERE t.Name LIKE ?
 ORDER BY t.Name ASC;
 """
 
+# Lopende cursors, zodat een trage query van buitenaf geannuleerd kan worden
+_active_cursors = set()
+_cursor_lock = threading.Lock()
+
+def cancel_running_queries():
+    """Annuleer alle lopende DB-queries van dit proces (pyodbc SQLCancel)."""
+    with _cursor_lock:
+        cursors = list(_active_cursors)
+    for cursor in cursors:
+        try:
+            cursor.cancel()
+        except pyodbc.Error:
+            pass
+    return len(cursors)
+
+def run_query(sql, params, timeout=None, source="sql"):
+    """Eén query op een gepoolde verbinding; annuleerbaar via cancel_running_queries()."""
+    t0 = time.perf_counter()
+    # closing(): verbinding terug naar de ODBC connection pool (pyodbc.pooling staat standaard aan)
+    with closing(get_sql_connection()) as conn:
+        t_connect = time.perf_counter()
+        conn.timeout = DB_QUERY_TIMEOUT if timeout is None else timeout
+        cursor = conn.cursor()
+        with _cursor_lock:
+            _active_cursors.add(cursor)
+        try:
+            cursor.execute(sql, params)
+            columns = [c[0] for c in cursor.description]
+            rows = [tuple(r) for r in cursor.fetchall()]
+        finally:
+            with _cursor_lock:
+                _active_cursors.discard(cursor)
+            cursor.close()
+    psf_metrics.observe_fetch(source, t_connect - t0, time.perf_counter() - t_connect, len(rows))
+    return pd.DataFrame.from_records(rows, columns=columns)
+
 def fetch_df_from_db(timer_like='%GA-5%', not_like1='%WB%', not_like2='%WN%',
-                      hours_back=17, spot_not_like='253'):
+                      hours_back=17, spot_not_like='253', timeout=None):
+    if DATA_SOURCE is not None:
+        t0 = time.perf_counter()
+        df = DATA_SOURCE.fetch(timer_like, not_like1, not_like2, hours_back, spot_not_like)
+        psf_metrics.observe_fetch(type(DATA_SOURCE).__name__, None, time.perf_counter() - t0, len(df))
+        return df
+
     params = (timer_like, not_like1, not_like2, -int(hours_back), spot_not_like)
-    with get_sql_connection() as conn:
-        df = pd.read_sql(SQL_TEXT, conn, params=params)
+    df = run_query(SQL_TEXT, params, timeout)
     df.columns = (
         df.columns.astype(str)
         .str.strip()
@@ -261,85 +408,333 @@ def fetch_df_from_db(timer_like='%GA-5%', not_like1='%WB%', not_like2='%WN%',
     return df
 
 # ==============================
-# Callbacks
+# Multi-scope fetch
 # ==============================
-@app.callback(
-    Output('file-info', 'children'),
-    Output('timer-dropdown', 'options'),
-    Output('npt-dropdown', 'options'),
-    Output('timer-dropdown', 'value'),
-    Output('npt-dropdown', 'value'),
-    Output('df-store', 'data'),
-    Input('refresh-db', 'n_clicks'),
-    Input('auto-refresh', 'n_intervals'),
-)
-def load_from_db(n_clicks, n_intervals):
+def parse_scopes(spec):
+    """'GA-5=%GA-5%;GA-4=%GA-4%' -> [{'scope': 'GA-5', 'timer_like': '%GA-5%'}, ...]"""
+    scopes = []
+    for part in spec.split(';'):
+        part = part.strip()
+        if not part:
+            continue
+        name, _, timer_like = part.partition('=')
+        name = name.strip()
+        scopes.append(dict(scope=name, timer_like=timer_like.strip() or f"%{name}%"))
+    return scopes
+
+SCOPES = parse_scopes(DB_SCOPES)
+
+_fetch_executor = ThreadPoolExecutor(max_workers=DB_FETCH_WORKERS, thread_name_prefix="psf-fetch")
+
+def _fetch_scope(scope, hours_back, spot_not_like):
+    t0 = time.perf_counter()
     try:
         df = fetch_df_from_db(
-            timer_like='%GA-5%',
-            not_like1='%WB%',
-            not_like2='%WN%',
-            hours_back=17,
-            spot_not_like='253'
+            timer_like=scope['timer_like'],
+            not_like1=scope.get('not_like1', '%WB%'),
+            not_like2=scope.get('not_like2', '%WN%'),
+            hours_back=hours_back,
+            spot_not_like=spot_not_like
         )
+        error = None
+    except Exception as e:
+        df, error = None, str(e)
+    return df, round(time.perf_counter() - t0, 2), error
+
+def fetch_scopes(scopes, hours_back=17, spot_not_like='253'):
+    """
+    Haal meerdere lijnen/timer-scopes gelijktijdig op (elk over een eigen verbinding)
+    en voeg ze samen tot één frame met een 'scope' kolom.
+    Een mislukte scope laat de andere niet vallen; zie het rapport per scope.
+    """
+    futures = [(scope, _fetch_executor.submit(_fetch_scope, scope, hours_back, spot_not_like))
+               for scope in scopes]
+
+    frames, report = [], []
+    for scope, future in futures:
+        df, seconds, error = future.result()
+        report.append(dict(scope=scope['scope'], rows=0 if df is None else len(df),
+                           seconds=seconds, error=error))
+        if df is not None:
+            frames.append(df.assign(scope=scope['scope']))
+
+    if not frames:
+        raise RuntimeError("; ".join(f"{r['scope']}: {r['error']}" for r in report))
+    return pd.concat(frames, ignore_index=True), report
+
+
+NUMERIC_COLUMNS = [
+    'cnt_welds_lastShift','AVG_PSF_last_shift','STDEV_stabilisationFactor',
+    'uirRegulationActive','Tol=OK','CondTol<40','LowerTol<60','TolBands_switched'
+]
+
+def prepare_df(df):
+    """Maak het ruwe DB-resultaat klaar voor de callbacks (numeriek + Tol=OK label)."""
+    missing = REQUIRED_COLUMNS - set(df.columns)
+    if missing:
+        raise ValueError(f"Ontbrekende kolommen in DB-resultaat: {', '.join(sorted(missing))}")
+
+    # Numeriek maken
+    for c in NUMERIC_COLUMNS:
+        if c in df.columns:
+            df[c] = pd.to_numeric(df[c], errors='coerce')
+
+    # Kwaliteit label zoals in de app
+    df['Tol=OK'] = df['Tol=OK'].map(normalize_tol_ok).astype('Int64')
+    df = df.dropna(subset=['Tol=OK']).astype({'Tol=OK':'int'})
+    return df
 
-        missing = REQUIRED_COLUMNS - set(df.columns)
-        if missing:
-            return (html.Div(f"❌ Ontbrekende kolommen in DB-resultaat: {', '.join(sorted(missing))}"),
-                    [], [], None, None, None)
-
-        # Numeriek maken
-        numeric_cols = [
-            'cnt_welds_lastShift','AVG_PSF_last_shift','STDEV_stabilisationFactor',
-            'uirRegulationActive','Tol=OK','CondTol<40','LowerTol<60','TolBands_switched'
-        ]
-        for c in numeric_cols:
-            if c in df.columns:
-                df[c] = pd.to_numeric(df[c], errors='coerce')
-
-        # Kwaliteit label zoals in de app
-        df['Tol=OK'] = df['Tol=OK'].map(normalize_tol_ok).astype('Int64')
-        df = df.dropna(subset=['Tol=OK']).astype({'Tol=OK':'int'})
-
-        timers = [{'label': t, 'value': t} for t in sorted(df['TimerName'].dropna().unique())]
-        npts   = [{'label': n, 'value': n} for n in sorted(df['NPTName'].dropna().unique())]
-
-        df_json = df.to_json(date_format='iso', orient='split')
-
-        return (
-            html.Div("✅ Data geladen uit database",
-                     style={"fontWeight":"bold","color":"green","textAlign":"Center"}),
-            timers, npts, None, None, df_json
-        )
+# ==============================
+# Server-side snapshot cache
+# ==============================
+# Laatste geladen dataset, per worker-proces in het geheugen. De versie is een hash
+# van de inhoud, zodat een refresh met identieke data dezelfde versie (en ETag) geeft.
+# Na een refresh wordt de snapshot in SNAPSHOT_DIR gepubliceerd; de andere workers
+# nemen die over (zie _adopt_shared), zodat alle workers dezelfde versie serveren.
+_snapshot_lock = threading.Lock()
+_snapshot = {"df": None, "version": None, "loaded_at": None, "scopes": [], "index": {}, "store": None}
+_recent = OrderedDict()   # versie -> snapshot, de laatste SNAPSHOT_KEEP versies
+
+def data_version(df):
+    digest = hashlib.sha1(pd.util.hash_pandas_object(df, index=False).values.tobytes())
+    digest.update(",".join(map(str, df.columns)).encode())
+    return digest.hexdigest()[:16]
+
+def dropdown_index(df):
+    """
+    NPT -> timer -> [aantal spots, aantal NOK-spots], één keer per refresh opgebouwd.
+    Timers zonder NPT staan onder de sleutel "".
+    """
+    d = df.dropna(subset=['TimerName']).assign(
+        NPTName=df['NPTName'].fillna(''),
+        SpotName=df['SpotName'].astype(str),
+        nok=df['Tol=OK'] == 0,
+    )
+    per_spot = d.groupby(['NPTName', 'TimerName', 'SpotName'])['nok'].any()
+    per_timer = per_spot.groupby(level=['NPTName', 'TimerName']).agg(['size', 'sum'])
+    index = {}
+    for (npt, timer), (spots, nok_spots) in per_timer.iterrows():
+        index.setdefault(npt, {})[timer] = [int(spots), int(nok_spots)]
+    return index
+
+def encode_store(df):
+    """
+    Snapshot -> df-store payload: enkel STORE_COLUMNS als gecomprimeerde Arrow IPC
+    stream, base64 zodat dcc.Store het als gewone string bewaart.
+    """
+    table = pa.Table.from_pandas(df[[c for c in STORE_COLUMNS if c in df.columns]], preserve_index=False)
+    codec = None if STORE_CODEC == "none" else STORE_CODEC
+    sink = pa.BufferOutputStream()
+    with pa.ipc.new_stream(sink, table.schema, options=pa.ipc.IpcWriteOptions(compression=codec)) as writer:
+        writer.write_table(table)
+    return "arrow:" + base64.b64encode(sink.getvalue()).decode("ascii")
+
+def decode_store(payload):
+    """df-store payload -> DataFrame. Oude JSON-payloads (open tabbladen van vóór de update) blijven werken."""
+    if not payload.startswith("arrow:"):
+        return pd.read_json(StringIO(payload), orient='split')
+    buf = pa.py_buffer(base64.b64decode(payload[len("arrow:"):]))
+    with pa.ipc.open_stream(buf) as reader:
+        table = reader.read_all()
+    # Numerieke kolommen zonder nulls worden zonder kopie omgezet
+    return table.to_pandas(split_blocks=True, self_destruct=True)
+
+def set_snapshot(df, scopes=None, version=None, loaded_at=None):
+    version = version or data_version(df)
+    with psf_metrics.stage('dropdown_index'):
+        index = dropdown_index(df)
+    with psf_metrics.stage('store_encode'):
+        store = encode_store(df)
+    with _snapshot_lock:
+        _snapshot.update(df=df, version=version, loaded_at=loaded_at or datetime.now(), scopes=scopes or [],
+                         index=index, store=store)
+        _recent[version] = dict(_snapshot)
+        _recent.move_to_end(version)
+        while len(_recent) > SNAPSHOT_KEEP:
+            _recent.popitem(last=False)
+        return dict(_snapshot)
+
+def get_snapshot():
+    _adopt_shared()
+    with _snapshot_lock:
+        return dict(_snapshot) if _snapshot["df"] is not None else None
+
+def snapshot_for_version(version):
+    """Snapshot van een bepaalde (recente) versie, ook als er intussen een nieuwere is; None als ze weg is."""
+    if not isinstance(version, str) or not re.fullmatch(r"[0-9a-f]{16}", version):
+        return None
+    get_snapshot()
+    with _snapshot_lock:
+        snap = _recent.get(version)
+    if snap is not None:
+        return snap
+    try:
+        df = pd.read_parquet(_shared_file(version))
+    except (OSError, ValueError):
+        return None
+    return {"df": df, "version": version}
 
-    except Exception as e:
-        return (html.Div(f"❌ DB-fout: {e}"), [], [], None, None, None)
+# ==============================
+# Gedeelde snapshot (alle workers)
+# ==============================
+_shared_lock = threading.Lock()
+_shared_seen = None   # mtime van het laatst verwerkte latest.json
 
-@app.callback(
-    Output('bar-chart', 'figure'),
-    Input('df-store', 'data'),
-    Input('timer-dropdown', 'value'),
-    Input('npt-dropdown', 'value'),
-    Input('nok-only', 'value'),
-    Input('adaptief-checkbox', 'value'),
-    Input('tolband-filter', 'value'),
-    Input('min-welds-input', 'value'),
-    Input('max-welds-input', 'value'),
-    Input('min-psf-input', 'value'),
-    Input('max-psf-input', 'value'),
-    Input('sigma-threshold', 'value'),
-    Input('sigma-button', 'n_clicks')
-)
-def update_chart(df_json, selected_timer, selected_npt, nok_only, adaptief_value, tolband_filter,
-                 min_welds, max_welds, min_psf, max_psf, sigma_threshold, sigma_click):
-    if not df_json:
-        return px.bar(title="⚠️ Geen geldige data geladen")
+def _shared_file(version):
+    return os.path.join(SNAPSHOT_DIR, f"{version}.parquet")
 
-    df = pd.read_json(StringIO(df_json), orient='split')
-    if df.empty:
-        return px.bar(title="⚠️ Geen data gevonden")
+def _read_latest():
+    try:
+        with open(os.path.join(SNAPSHOT_DIR, "latest.json"), encoding="utf-8") as f:
+            latest = json.load(f)
+        return dict(latest, loaded_at=datetime.fromisoformat(latest["loaded_at"]))
+    except (OSError, ValueError, KeyError):
+        return None
+
+def publish_snapshot(snap):
+    """Schrijf een ververste snapshot weg voor de andere workers (<versie>.parquet + latest.json)."""
+    os.makedirs(SNAPSHOT_DIR, exist_ok=True)
+    path = _shared_file(snap["version"])
+    if not os.path.exists(path):
+        tmp = f"{path}.{os.getpid()}.tmp"
+        snap["df"].to_parquet(tmp, index=False)
+        os.replace(tmp, path)
+
+    latest = _read_latest()
+    if latest is None or snap["loaded_at"] > latest["loaded_at"]:
+        target = os.path.join(SNAPSHOT_DIR, "latest.json")
+        tmp = f"{target}.{os.getpid()}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump({"version": snap["version"], "loaded_at": snap["loaded_at"].isoformat(),
+                       "scopes": snap["scopes"]}, f, default=str)
+        os.replace(tmp, target)
+
+    # Oude versies opruimen (de nieuwste SNAPSHOT_KEEP blijven voor snapshot_for_version)
+    files = [os.path.join(SNAPSHOT_DIR, n) for n in os.listdir(SNAPSHOT_DIR) if n.endswith(".parquet")]
+    files.sort(key=lambda p: os.stat(p).st_mtime if os.path.exists(p) else 0)
+    for old in files[:-SNAPSHOT_KEEP]:
+        try:
+            os.remove(old)
+        except FileNotFoundError:
+            pass
+
+def _adopt_shared():
+    """Neem de gedeelde snapshot over als een andere worker een nieuwere gepubliceerd heeft."""
+    global _shared_seen
+    try:
+        mtime = os.stat(os.path.join(SNAPSHOT_DIR, "latest.json")).st_mtime_ns
+    except OSError:
+        return
+    if mtime == _shared_seen:
+        return
+    with _shared_lock:
+        if mtime == _shared_seen:
+            return
+        latest = _read_latest()
+        if latest is None:
+            return
+        with _snapshot_lock:
+            version, loaded_at = _snapshot["version"], _snapshot["loaded_at"]
+            if latest["version"] == version and latest["loaded_at"] > loaded_at:
+                # Zelfde data, later ververst door een andere worker: enkel de leeftijd overnemen
+                _snapshot["loaded_at"] = latest["loaded_at"]
+        if latest["version"] != version and (loaded_at is None or latest["loaded_at"] > loaded_at):
+            try:
+                df = pd.read_parquet(_shared_file(latest["version"]))
+            except (OSError, ValueError):
+                return   # (nog) niet leesbaar: volgende aanroep opnieuw proberen
+            set_snapshot(df, latest["scopes"], latest["version"], latest["loaded_at"])
+        _shared_seen = mtime
+
+def snapshot_age(snap):
+    return (datetime.now() - snap["loaded_at"]).total_seconds()
+
+def refresh_snapshot():
+    """Haal de data opnieuw op uit GADATA en zet ze als huidige snapshot."""
+    df, report = fetch_scopes(SCOPES, hours_back=17, spot_not_like='253')
+    return set_snapshot(prepare_df(df), report)
 
-    df['kwaliteit'] = df['Tol=OK'].map({1: 'ok', 0: 'nok'})
+# ==============================
+# Stale-while-revalidate refresh
+# ==============================
+# Eén refresh tegelijk per proces: wie tijdens een refresh binnenkomt, krijgt
+# dezelfde future. Callbacks serveren ondertussen de laatste goede snapshot.
+_refresh_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="psf-refresh")
+_refresh_lock = threading.Lock()
+_refresh_future = None
+_last_refresh_error = None   # (tijdstip, melding) van de laatst mislukte refresh
+
+def _run_refresh():
+    global _last_refresh_error
+    try:
+        snap = refresh_snapshot()
+    except Exception as e:
+        _last_refresh_error = (datetime.now(), str(e))
+        raise
+    _last_refresh_error = None
+    try:
+        publish_snapshot(snap)
+    except Exception:
+        server.logger.exception("Snapshot niet gedeeld met de andere workers")
+    try:
+        psf_history.append_snapshot(snap["df"], snap["loaded_at"], snap["version"])
+    except Exception:
+        server.logger.exception("Snapshot niet bewaard in historiek")
+    return snap
+
+def request_refresh():
+    """Start een achtergrond-refresh, of geef de lopende terug."""
+    global _refresh_future
+    with _refresh_lock:
+        if _refresh_future is None or _refresh_future.done():
+            _refresh_future = _refresh_executor.submit(_run_refresh)
+        return _refresh_future
+
+def refresh_in_progress():
+    with _refresh_lock:
+        return _refresh_future is not None and not _refresh_future.done()
+
+def current_snapshot(wait=SNAPSHOT_WAIT_TIMEOUT):
+    """
+    Laatste goede snapshot, direct. Te oud -> refresh op de achtergrond.
+    Alleen zonder snapshot (koude start) wordt er max `wait` sec gewacht.
+    """
+    snap = get_snapshot()
+    if snap is not None:
+        if snapshot_age(snap) > SNAPSHOT_MAX_AGE:
+            request_refresh()
+        return snap
+    if _last_refresh_error and not refresh_in_progress():
+        when, msg = _last_refresh_error
+        if (datetime.now() - when).total_seconds() < REFRESH_RETRY_DELAY:
+            # Koude start en DB net mislukt: niet bij elke poll opnieuw proberen
+            raise RuntimeError(msg)
+    future = request_refresh()
+    try:
+        return future.result(timeout=wait)
+    except FutureTimeoutError:
+        raise TimeoutError(f"Geen data binnen {wait}s; database-refresh loopt nog.")
+
+# ==============================
+# Filters & aggregatie (gedeeld door grafiek, XML-export en REST)
+# ==============================
+def resolve_threshold(sigma_threshold):
+    if sigma_threshold is not None and sigma_threshold >= MIN_SIGMA_THRESHOLD:
+        return sigma_threshold
+    return DEFAULT_SIGMA_THRESHOLD
+
+def band_for_psf(psf, thr):
+    """Aanbevolen tolerantieband voor een adjusted PSF (None = geen aanpassing)."""
+    if thr < psf < PSF_THRESH_HI:
+        return LOW_BAND
+    elif PSF_THRESH_HI <= psf <= 100:
+        return HIGH_BAND
+    return None
+
+def filter_rows(df, selected_timer=None, selected_npt=None, nok_only=False,
+                adaptief=True, tolband_filter='all', apply_sigma=False):
+    """Rij-filters uit de UI. Geeft een nieuw frame terug (de snapshot blijft onaangeroerd)."""
+    df = df.assign(kwaliteit=df['Tol=OK'].map({1: 'ok', 0: 'nok'}))
 
     # UI-filters (Timer/NPT)
     if selected_timer:
@@ -348,15 +743,10 @@ def update_chart(df_json, selected_timer, selected_npt, nok_only, adaptief_value
         df = df[df['NPTName'] == selected_npt]
 
     # Alleen NOK?
-    if 'nok' in (nok_only or []):
+    if nok_only:
         df = df[df['kwaliteit'] == 'nok']
 
-    # Sigma toggle
-    apply_sigma = (sigma_click or 0) % 2 == 1
-    thr = sigma_threshold if (sigma_threshold is not None and sigma_threshold >= MIN_SIGMA_THRESHOLD) else DEFAULT_SIGMA_THRESHOLD
-
     # Adaptief: in sigma altijd ADAPTIEF; buiten sigma: volg checkbox
-    adaptief = 'adaptief' in (adaptief_value or [])
     if apply_sigma:
         df = df[df['uirRegulationActive'] == 1]
     else:
@@ -368,12 +758,12 @@ def update_chart(df_json, selected_timer, selected_npt, nok_only, adaptief_value
     elif tolband_filter == 'switched':
         df = df[df['TolBands_switched'] == 1]
 
-    if df.empty:
-        return px.bar(title="⚠️ Geen data na filters")
-
-    df['SpotName'] = df['SpotName'].astype(str)
+    return df.assign(SpotName=df['SpotName'].astype(str))
 
-    grouped = df.groupby(['SpotName', 'kwaliteit'], as_index=False).agg(
+def aggregate_spots(df, keys, min_welds=None, max_welds=None, min_psf=None, max_psf=None,
+                    apply_sigma=False, thr=DEFAULT_SIGMA_THRESHOLD):
+    """Groepeer per spot/kwaliteit en pas de numerieke UI-filters en sigma toe."""
+    grouped = df.groupby(keys, as_index=False).agg(
         count=('cnt_welds_lastShift', 'sum'),
         avg_psf=('AVG_PSF_last_shift', 'mean'),
         stdev_psf=('STDEV_stabilisationFactor', 'mean'),
@@ -398,33 +788,488 @@ def update_chart(df_json, selected_timer, selected_npt, nok_only, adaptief_value
     if apply_sigma:
         grouped = grouped[(grouped['adjusted_psf'] > thr) & (grouped['kwaliteit'] == 'nok')]
 
-    if grouped.empty:
-        return px.bar(title="ℹ️ Geen rijen na (extra) filters")
-
-    # === Aanbevolen tolerantieband (zelfde logica als XML) ===
-    def _aanbevolen_vals(psf):
-        if thr < psf < PSF_THRESH_HI:
-            return LOW_BAND
-        elif PSF_THRESH_HI <= psf <= 100:
-            return HIGH_BAND
-        else:
+    return grouped
+
+def export_grouping(df, selected_timer=None, selected_npt=None, nok_only=False, adaptief=True,
+                    tolband_filter='all', min_welds=None, max_welds=None, min_psf=None,
+                    max_psf=None, apply_sigma=False, sigma_threshold=None):
+    """Volledige filterketen van de XML-export; geeft (grouped, thr) terug."""
+    thr = resolve_threshold(sigma_threshold)
+    df = filter_rows(df, selected_timer, selected_npt, nok_only, adaptief, tolband_filter, apply_sigma)
+    # Ook zonder rijen groeperen: een lege export houdt zo dezelfde kolommen
+    with psf_metrics.stage('groupby'):
+        grouped = aggregate_spots(df, ['NPTName', 'TimerName', 'SpotName', 'kwaliteit'],
+                                  min_welds, max_welds, min_psf, max_psf, apply_sigma, thr)
+    return grouped, thr
+
+def build_tolband_xml(grouped, thr):
+    creation = datetime.now().strftime("%Y-%m-%d--%H:%M:%S.%f")[:-3]
+
+    xml_lines = [
+        '<?xml version="1.0" encoding="utf-8" standalone="yes"?>',
+        '<nwsXml:InternalTimerWeldingData xmlns:nwsXml="nwsXML">'
+    ]
+
+    for (npt, timer), group_df in grouped.groupby(['NPTName', 'TimerName']):
+        timer_q = quoteattr(str(timer))
+        npt_q   = quoteattr(str(npt))
+        creation_q = quoteattr(creation)
+
+        xml_lines.append(
+            f'  <Header CreatorName="PSF_TOOL" CreationDate={creation_q} '
+            f'TimerName={timer_q} TimerIP="" LinePC={npt_q} '
+            f'SchemaVersion="12" BaseFirmwareVersion="1.11.11.2" ApplicationVersion="1000_1.2.0" '
+            f'ConfigurationVersion="Cfg_1000_1.0.8" ApplicationIdentifier="1000" DataManagerVersion="1.11.11.0" />'
+        )
+        xml_lines.append('  <WeldJobs>')
+
+        for _, row in group_df.iterrows():
+            spot = str(row['SpotName'])
+            psf  = float(row['adjusted_psf'])
+
+            vals = band_for_psf(psf, thr)
+            if vals is None:
+                continue
+
+            spot_name = f"WJ_{spot}"
+            spot_q = quoteattr(spot_name)
+
+            xml_lines.append(f'    <WeldJob Name={spot_q}>')
+            xml_lines.append(f'      <Param No="100001" Name="WJ_WeldJobName" Value={spot_q} Unit="" />')
+            xml_lines.append('      <SequenceBlocks>')
+            xml_lines.append('        <SequenceBlock Name="">')
+            xml_lines.append('          <WeldBlocks>')
+            xml_lines.append('            <WeldBlock Name="1">')
+            xml_lines.append('            </WeldBlock>')
+            xml_lines.append('          </WeldBlocks>')
+            xml_lines.append('          <MonitoringBlocks>')
+            xml_lines.append('            <MonitoringBlock Name="1">')
+            xml_lines.append(f'              <Param No="130003" Name="MB_MonitorValue" Value="{vals["v3"]}" Unit="" />')
+            xml_lines.append(f'              <Param No="130004" Name="MB_MonitorMode" Value="{vals["v4"]}" Unit="" />')
+            xml_lines.append('              <Param No="130005" Name="MB_MonitorReferenceValue" Value="10000" Unit="depends on MonitorValue:0=A1=mV2=(%*100)3=ms4=uOhm5=17=N6=7=8=13=(%*100)9=11=14=15=16=18=20(mm*10000)10=(kNm*1000)12=Ws" />')
+            xml_lines.append('              <Param No="130008" Name="MB_UpperToleranceBandPerc" Value="100.00" Unit="%" />')
+            xml_lines.append(f'              <Param No="130009" Name="MB_LowerToleranceBandPerc" Value="{vals["v9"]}" Unit="%" />')
+            xml_lines.append(f'              <Param No="130010" Name="MB_CondUpperToleranceBandPerc" Value="{vals["v10"]}" Unit="%" />')
+            xml_lines.append(f'              <Param No="130011" Name="MB_CondLowerToleranceBandPerc" Value="{vals["v11"]}" Unit="%" />')
+            xml_lines.append('            </MonitoringBlock>')
+            xml_lines.append('            <MonitoringBlock Name="2">')
+            xml_lines.append('            </MonitoringBlock>')
+            xml_lines.append('          </MonitoringBlocks>')
+            xml_lines.append('          <ReferenceCurves>')
+            xml_lines.append('            <ReferenceCurve Name="1">')
+            xml_lines.append('            </ReferenceCurve>')
+            xml_lines.append('          </ReferenceCurves>')
+            xml_lines.append('        </SequenceBlock>')
+            xml_lines.append('      </SequenceBlocks>')
+            xml_lines.append('    </WeldJob>')
+
+        xml_lines.append('  </WeldJobs>')
+
+    xml_lines.append('</nwsXml:InternalTimerWeldingData>')
+
+    return "\n".join(xml_lines)
+
+# ==============================
+# Drill-down: PSF-reeks per las
+# ==============================
+# Aanname: rt_weldmeasureprotddw bevat één rij per las met de PSF in stabilisationFactor.
+# DESC + TOP: bij afkappen blijven de recentste lassen over.
+SERIES_SQL = """
+SELECT TOP (?) w._timestamp AS ts, w.stabilisationFactor AS psf
+FROM WELDING2.rt_weldmeasureprotddw AS w
+WHERE w.rt_spot_id IN ({ids}) AND w._timestamp >= ? AND w._timestamp < ?
+ORDER BY w._timestamp DESC
+"""
+
+class SeriesUnavailable(Exception):
+    """De databron heeft geen PSF-reeks per las (bv. een replay-snapshot)."""
+
+class UnknownSpot(Exception):
+    """De spot (eventueel binnen de gekozen timer) zit niet in de huidige snapshot."""
+
+_series_lock = threading.Lock()
+_series_cache = OrderedDict()   # (spot, timer, uren, punten) -> (tijdstip, resultaat); LRU + TTL
+
+def fetch_spot_series(spot_ids, start, end, limit=SERIES_MAX_ROWS):
+    """Lassen (ts, psf) van de gegeven rt_spot_ids in [start, end), oplopend in tijd."""
+    if DATA_SOURCE is not None:
+        if not hasattr(DATA_SOURCE, 'series'):
+            raise SeriesUnavailable(f"{type(DATA_SOURCE).__name__} heeft geen PSF-reeks per las")
+        t0 = time.perf_counter()
+        df = DATA_SOURCE.series(spot_ids, start, end, limit)
+        psf_metrics.observe_fetch(type(DATA_SOURCE).__name__ + "-series", None, time.perf_counter() - t0, len(df))
+    else:
+        sql = SERIES_SQL.format(ids=",".join("?" * len(spot_ids)))
+        df = run_query(sql, (int(limit), *map(int, spot_ids), start, end), source="sql-series")
+    df = df.assign(ts=pd.to_datetime(df['ts']), psf=pd.to_numeric(df['psf'], errors='coerce'))
+    return df.dropna().sort_values('ts', ignore_index=True)
+
+def lttb(x, y, n_out):
+    """Largest-Triangle-Three-Buckets: indices van n_out punten die de vorm van (x, y) bewaren."""
+    n = len(x)
+    if n_out >= n or n_out < 3:
+        return np.arange(n)
+    # n_out - 2 emmers tussen het eerste en laatste punt (die blijven altijd)
+    edges = np.linspace(1, n - 1, n_out - 1).astype(int)
+    keep = np.empty(n_out, dtype=int)
+    keep[0], keep[-1] = 0, n - 1
+    a = 0
+    for i in range(n_out - 2):
+        lo, hi = edges[i], edges[i + 1]
+        nxt_hi = edges[i + 2] if i + 2 < len(edges) else n
+        avg_x, avg_y = x[hi:nxt_hi].mean(), y[hi:nxt_hi].mean()
+        area = np.abs((x[a] - avg_x) * (y[lo:hi] - y[a]) - (x[a] - x[lo:hi]) * (avg_y - y[a]))
+        a = lo + int(area.argmax())
+        keep[i + 1] = a
+    return keep
+
+def _series_cache_get(key):
+    with _series_lock:
+        hit = _series_cache.get(key)
+        if hit is None or time.monotonic() - hit[0] > SERIES_CACHE_TTL:
             return None
+        _series_cache.move_to_end(key)
+        return hit[1]
+
+def _series_cache_put(key, result):
+    with _series_lock:
+        _series_cache[key] = (time.monotonic(), result)
+        _series_cache.move_to_end(key)
+        while len(_series_cache) > SERIES_CACHE_SIZE:
+            _series_cache.popitem(last=False)
+
+def spot_series(spot, timer=None, hours=24, points=SERIES_POINTS):
+    """
+    Gedownsamplede PSF-reeks voor één spot (optioneel één timer) over de laatste `hours` uur.
+    UnknownSpot als de spot niet in de snapshot zit.
+    """
+    hours = min(max(float(hours), 1.0), SERIES_MAX_HOURS)
+    points = min(max(int(points), 10), 5000)
+    key = (str(spot), timer or None, hours, points)
+    cached = _series_cache_get(key)
+    if cached is not None:
+        return dict(cached, cached=True)
+
+    df = current_snapshot()["df"]
+    rows = df[df['SpotName'].astype(str) == str(spot)]
+    if timer:
+        rows = rows[rows['TimerName'] == timer]
+    spot_ids = sorted(rows['rt_spot_id'].dropna().astype(int).unique())
+    if not spot_ids:
+        raise UnknownSpot(spot)
+
+    end = datetime.now()
+    start = end - timedelta(hours=hours)
+    raw = fetch_spot_series(spot_ids, start, end)
+
+    with psf_metrics.stage('downsample'):
+        x = raw['ts'].to_numpy(dtype='datetime64[ns]').astype('int64') / 1e9
+        keep = lttb(x, raw['psf'].to_numpy(dtype=float), points)
+        series = raw.iloc[keep]
+
+    result = {
+        'spot': str(spot), 'timer': timer or None, 'hours': hours,
+        'start': start.isoformat(), 'end': end.isoformat(),
+        'raw_points': len(raw), 'points': len(series),
+        'truncated': len(raw) >= SERIES_MAX_ROWS,
+        'cond_tol': _nullable(rows['uirPsfCondTol'].head(1))[0],
+        'lower_tol': _nullable(rows['uirPsfLowerTol'].head(1))[0],
+        'ts': series['ts'].dt.strftime('%Y-%m-%dT%H:%M:%S').tolist(),
+        'psf': series['psf'].round(3).tolist(),
+    }
+    _series_cache_put(key, result)
+    return dict(result, cached=False)
+
+# ==============================
+# REST: headless XML export
+# ==============================
+def _arg_bool(args, name, default):
+    raw = args.get(name)
+    if raw is None or raw == '':
+        return default
+    return raw.strip().lower() in {'1', 'true', 'yes', 'ja', 'on'}
+
+def _arg_float(args, name):
+    raw = args.get(name)
+    if raw is None or raw == '':
+        return None
+    value = float(raw)
+    if not math.isfinite(value):
+        # nan/inf zouden elke vergelijking in de filters stil laten mislukken
+        raise ValueError(f"Ongeldige waarde voor {name}: {raw}")
+    return value
+
+def filters_from_args(args):
+    """Zelfde filterparameters als de UI, als query-argumenten."""
+    tolband = args.get('tolband', 'all')
+    if tolband not in {'all', 'not_switched', 'switched'}:
+        raise ValueError(f"Ongeldige tolband: {tolband}")
+    return dict(
+        selected_timer=args.get('timer') or None,
+        selected_npt=args.get('npt') or None,
+        nok_only=_arg_bool(args, 'nok', False),
+        adaptief=_arg_bool(args, 'adaptief', True),
+        tolband_filter=tolband,
+        min_welds=_arg_float(args, 'min_welds'),
+        max_welds=_arg_float(args, 'max_welds'),
+        min_psf=_arg_float(args, 'min_psf'),
+        max_psf=_arg_float(args, 'max_psf'),
+        apply_sigma=_arg_bool(args, 'sigma', False),
+        sigma_threshold=_arg_float(args, 'threshold'),
+    )
+
+def export_etag(version, filters):
+    key = repr((version, sorted(filters.items())))
+    return hashlib.sha1(key.encode()).hexdigest()
+
+@server.get("/api/export-xml")
+def api_export_xml():
+    try:
+        filters = filters_from_args(request.args)
+    except ValueError as e:
+        return {"error": str(e)}, 400
+
+    try:
+        snap = current_snapshot()
+    except Exception as e:
+        return {"error": f"DB-fout: {e}"}, 503
+
+    etag = export_etag(snap["version"], filters)
+    if request.if_none_match.contains(etag):
+        resp = Response(status=304)
+        resp.set_etag(etag)
+        return resp
+
+    grouped, thr = export_grouping(snap["df"], **filters)
+    if grouped.empty:
+        resp = Response(status=204)
+    else:
+        filename = f"{filters['selected_npt'] or 'all'}.xml"
+        resp = Response(build_tolband_xml(grouped, thr), mimetype="application/xml")
+        resp.headers["Content-Disposition"] = f'attachment; filename="{filename}"'
+    resp.set_etag(etag)
+    resp.headers["Cache-Control"] = "no-cache"
+    resp.headers["X-Data-Version"] = snap["version"]
+    return resp
+
+# ==============================
+# REST: bulk data-export (uit de snapshot, nooit GADATA)
+# ==============================
+EXPORT_FORMATS = {
+    'csv': ("text/csv", "csv"),
+    'parquet': ("application/vnd.apache.parquet", "parquet"),
+}
+
+def export_frame(df, level, filters):
+    """level='filtered': per NPT/timer/spot/kwaliteit zoals de XML-export; 'raw': snapshotrijen na de rij-filters."""
+    if level == 'raw':
+        return filter_rows(df, filters['selected_timer'], filters['selected_npt'], filters['nok_only'],
+                           filters['adaptief'], filters['tolband_filter'], filters['apply_sigma'])
+    grouped, thr = export_grouping(df, **filters)
+    return add_band_advice(grouped, thr)
+
+def iter_csv(df, chunk_rows=EXPORT_CHUNK_ROWS):
+    """CSV per chunk; hooguit één chunk tegelijk als tekst in het geheugen."""
+    for start in range(0, max(len(df), 1), chunk_rows):
+        yield df.iloc[start:start + chunk_rows].to_csv(index=False, header=start == 0)
+
+def iter_parquet(df, chunk_rows=EXPORT_CHUNK_ROWS, block_size=1 << 20):
+    """
+    Parquet met één row group per chunk, geschreven naar een spooled tempfile
+    (boven 8 MB naar schijf) en daarna in blokken gestreamd.
+    """
+    schema = pa.Schema.from_pandas(df, preserve_index=False)
+    with tempfile.SpooledTemporaryFile(max_size=8 << 20) as tmp:
+        writer = pq.ParquetWriter(pa.PythonFile(tmp, mode='w'), schema, compression='zstd')
+        for start in range(0, len(df), chunk_rows):
+            chunk = df.iloc[start:start + chunk_rows]
+            writer.write_table(pa.Table.from_pandas(chunk, schema=schema, preserve_index=False))
+        writer.close()
+        tmp.seek(0)
+        while block := tmp.read(block_size):
+            yield block
+
+@server.get("/api/export-data")
+def api_export_data():
+    fmt = request.args.get('format', 'parquet')
+    level = request.args.get('level', 'filtered')
+    if fmt not in EXPORT_FORMATS:
+        return {"error": f"Ongeldig format: {fmt} (csv | parquet)"}, 400
+    if level not in {'filtered', 'raw'}:
+        return {"error": f"Ongeldig level: {level} (filtered | raw)"}, 400
+    try:
+        filters = filters_from_args(request.args)
+    except ValueError as e:
+        return {"error": str(e)}, 400
+
+    try:
+        snap = current_snapshot()
+    except Exception as e:
+        return {"error": f"DB-fout: {e}"}, 503
+
+    etag = export_etag(snap["version"], dict(filters, format=fmt, level=level))
+    if request.if_none_match.contains(etag):
+        resp = Response(status=304)
+        resp.set_etag(etag)
+        return resp
+
+    df = export_frame(snap["df"], level, filters)
+    mimetype, ext = EXPORT_FORMATS[fmt]
+    body = iter_csv(df) if fmt == 'csv' else iter_parquet(df)
+    resp = Response(body, mimetype=mimetype)
+    filename = f"psf_{level}_{filters['selected_npt'] or 'all'}_{snap['version']}.{ext}"
+    resp.headers["Content-Disposition"] = f'attachment; filename="{filename}"'
+    resp.set_etag(etag)
+    resp.headers["Cache-Control"] = "no-cache"
+    resp.headers["X-Data-Version"] = snap["version"]
+    resp.headers["X-Row-Count"] = str(len(df))
+    return resp
+
+@server.get("/api/snapshot")
+def api_snapshot_status():
+    snap = get_snapshot()
+    return {
+        "version": snap["version"] if snap else None,
+        "loaded_at": snap["loaded_at"].isoformat() if snap else None,
+        "age_seconds": round(snapshot_age(snap), 1) if snap else None,
+        "rows": len(snap["df"]) if snap else 0,
+        "refreshing": refresh_in_progress(),
+        "last_error": _last_refresh_error[1] if _last_refresh_error else None,
+        "scopes": snap["scopes"] if snap else [],
+    }, 200
+
+# ==============================
+# REST: trends uit de lokale historiek (nooit GADATA)
+# ==============================
+def _trend_start(args):
+    """Begin van het trendvenster uit ?days= (standaard 30); ValueError buiten (0, retentie]."""
+    raw = args.get('days') or '30'
+    try:
+        days = float(raw)
+    except ValueError:
+        raise ValueError(f"Ongeldig aantal dagen: {raw}")
+    if not 0 < days <= psf_history.HISTORY_RETENTION_DAYS:
+        raise ValueError(f"days moet tussen 0 en {psf_history.HISTORY_RETENTION_DAYS} liggen")
+    return datetime.now() - timedelta(days=days)
+
+@server.get("/api/trend/spot/<spot>")
+def api_spot_trend(spot):
+    try:
+        start = _trend_start(request.args)
+    except ValueError as e:
+        return {"error": str(e)}, 400
+    trend = psf_history.spot_trend(spot, start, timer=request.args.get('timer') or None)
+    return Response(trend.to_json(orient='records', date_format='iso'), mimetype="application/json")
+
+@server.get("/api/trend/timer/<timer>")
+def api_timer_trend(timer):
+    try:
+        start = _trend_start(request.args)
+    except ValueError as e:
+        return {"error": str(e)}, 400
+    trend = psf_history.timer_trend(timer, start)
+    return Response(trend.to_json(orient='records', date_format='iso'), mimetype="application/json")
+
+@server.get("/api/series/spot/<spot>")
+def api_spot_series(spot):
+    try:
+        result = spot_series(spot, request.args.get('timer') or None,
+                             float(request.args.get('hours') or 24),
+                             int(request.args.get('points') or SERIES_POINTS))
+    except ValueError as e:
+        return {"error": str(e)}, 400
+    except UnknownSpot:
+        return {"error": f"Spot {spot} niet in de huidige snapshot"}, 404
+    except SeriesUnavailable as e:
+        return {"error": str(e)}, 501
+    except Exception as e:
+        return {"error": f"DB-fout: {e}"}, 503
+    return result, 200
+
+@server.post("/api/refresh/cancel")
+def api_refresh_cancel():
+    return {"cancelled_queries": cancel_running_queries()}, 200
+
+# ==============================
+# Callbacks
+# ==============================
+def snapshot_status_div(snap):
+    """Statusregel: leeftijd van de getoonde data + lopende/mislukte refresh."""
+    age_min = int(snapshot_age(snap) // 60)
+    parts = [html.Span(f"✅ Data geladen uit database — stand van {snap['loaded_at']:%H:%M:%S} ({age_min} min oud)",
+                       style={"fontWeight":"bold","color":"green"})]
+    if refresh_in_progress():
+        parts.append(html.Span("  🔄 verversen op de achtergrond...", style={"color":"#555"}))
+    for r in snap["scopes"]:
+        if r["error"]:
+            parts.append(html.Div(f"⚠️ Lijn {r['scope']} niet geladen: {r['error']}", style={"color":"#cc7a00"}))
+    if _last_refresh_error:
+        when, msg = _last_refresh_error
+        parts.append(html.Div(f"⚠️ Laatste refresh mislukt om {when:%H:%M:%S}: {msg}",
+                              style={"color":"#cc7a00"}))
+    return html.Div(parts, style={"textAlign":"Center"})
+
+@app.callback(
+    Output('file-info', 'children'),
+    Output('dropdown-index', 'data'),
+    Output('timer-dropdown', 'value'),
+    Output('npt-dropdown', 'value'),
+    Output('df-store', 'data'),
+    Output('snapshot-version', 'data'),
+    Input('refresh-db', 'n_clicks'),
+    Input('auto-refresh', 'n_intervals'),
+    Input('snapshot-poll', 'n_intervals'),
+    State('snapshot-version', 'data'),
+)
+def load_from_db(n_clicks, n_intervals, n_polls, shown_version):
+    return load_snapshot_outputs(ctx.triggered_id, shown_version)
+
+def load_snapshot_outputs(trigger, shown_version):
+    """Body van load_from_db, los van de Dash callback-context (ook gebruikt door psf_loadtest)."""
+    # Enkel de knop forceert een refresh; auto-refresh/poll volgen de max-age in current_snapshot()
+    if trigger == 'refresh-db' and get_snapshot() is not None:
+        request_refresh()
+
+    try:
+        snap = current_snapshot()
+    except ValueError as e:
+        return (html.Div(f"❌ {e}"), {}, None, None, None, None)
+    except Exception as e:
+        return (html.Div(f"❌ DB-fout: {e}"), {}, None, None, None, None)
+
+    status = snapshot_status_div(snap)
+    if snap["version"] == shown_version:
+        # Niets nieuws: alleen de statusregel (leeftijd) bijwerken
+        return (status, no_update, no_update, no_update, no_update, no_update)
+
+    # Selectie alleen resetten bij een expliciete refresh (store is al per versie geëncodeerd)
+    reset = None if trigger == 'refresh-db' else no_update
+    return (status, snap["index"], reset, reset, snap["store"], snap["version"])
 
-    def _aanbevolen_row(psf):
-        vals = _aanbevolen_vals(psf)
-        if not vals:
-            return pd.Series({
-                'aanbevolen_lower':  pd.NA,
-                'aanbevolen_cond':   pd.NA,
-                'aanbevolen_label':  '—'
-            })
-        return pd.Series({
-            'aanbevolen_lower':  vals['v9'],   # 60 of 40
-            'aanbevolen_cond':   vals['v11'],  # 30 of 20
-            'aanbevolen_label':  f"{vals['v9']}/{vals['v11']}"
-        })
-
-    grouped = pd.concat([grouped, grouped['adjusted_psf'].apply(_aanbevolen_row)], axis=1)
+# Afhankelijke dropdowns: opties (met NOK-tellingen) komen uit de index, niet uit het data frame.
+# Een NPT-keuze beperkt de timers; een timer die niet bij de gekozen NPT hoort wordt gewist.
+app.clientside_callback(
+    ClientsideFunction(namespace='psf', function_name='dropdownOptions'),
+    Output('timer-dropdown', 'options'),
+    Output('npt-dropdown', 'options'),
+    Output('timer-dropdown', 'value', allow_duplicate=True),
+    Input('dropdown-index', 'data'),
+    Input('npt-dropdown', 'value'),
+    Input('timer-dropdown', 'value'),
+    prevent_initial_call=True
+)
+
+def add_band_advice(grouped, thr):
+    """Aanbevolen tolerantieband en match/mismatch vs huidige banden (zelfde logica als XML)."""
+    psf = grouped['adjusted_psf']
+    low  = (psf > thr) & (psf < PSF_THRESH_HI)
+    high = ~low & (psf >= PSF_THRESH_HI) & (psf <= 100)
+    grouped = grouped.assign(
+        aanbevolen_lower=np.select([low, high], [LOW_BAND['v9'], HIGH_BAND['v9']], np.nan),    # 60 of 40
+        aanbevolen_cond=np.select([low, high], [LOW_BAND['v11'], HIGH_BAND['v11']], np.nan),   # 30 of 20
+        aanbevolen_label=np.select([low, high], [f"{LOW_BAND['v9']}/{LOW_BAND['v11']}",
+                                                 f"{HIGH_BAND['v9']}/{HIGH_BAND['v11']}"], '—'),
+    )
 
     # match/mismatch vs huidige tol-banden (NA veilig vergelijken)
     match_mask = (
@@ -432,8 +1277,19 @@ def update_chart(df_json, selected_timer, selected_npt, nok_only, adaptief_value
         (grouped['cond_tol'].fillna(-9999)  == grouped['aanbevolen_cond'].fillna(-9999))
     )
     grouped['band_match'] = match_mask.map({True: 'match', False: 'mismatch'})
+    return grouped
+
+def rank_spots(grouped):
+    """Worst-first: meeste NOK-lassen eerst, daarna laagste adjusted PSF."""
+    nok_count = grouped['count'].where(grouped['kwaliteit'] == 'nok', 0)
+    per_spot = grouped.assign(nok_count=nok_count).groupby('SpotName').agg(
+        nok=('nok_count', 'sum'), adj=('adjusted_psf', 'min'))
+    return per_spot.sort_values(['nok', 'adj'], ascending=[False, True]).index.tolist()
+
+def chart_title(apply_sigma, thr):
+    return 'Aantal lassen per SpotName (OK/NOK)' + (f' — Sigma (NOK) actief, drempel {thr}' if apply_sigma else '')
 
-    # === Plot ===
+def build_full_chart(grouped, apply_sigma, thr):
     fig = px.bar(
         grouped,
         x='SpotName',
@@ -441,7 +1297,7 @@ def update_chart(df_json, selected_timer, selected_npt, nok_only, adaptief_value
         color='kwaliteit',
         barmode='stack',
         text='count',
-        title=('Aantal lassen per SpotName (OK/NOK)' + (f' — Sigma (NOK) actief, drempel {thr}' if apply_sigma else '')),
+        title=chart_title(apply_sigma, thr),
         labels={'kwaliteit': 'Kwaliteit', 'count': 'Aantal lassen'},
         category_orders={'kwaliteit': ['ok', 'nok']},
         color_discrete_map={'ok': 'green', 'nok': 'red'},
@@ -458,8 +1314,44 @@ def update_chart(df_json, selected_timer, selected_npt, nok_only, adaptief_value
             'kwaliteit': True
         }
     )
-
     fig.update_traces(textposition='outside', textfont_size=14, cliponaxis=False)
+    return fig
+
+def build_paged_chart(grouped, spots, apply_sigma, thr):
+    """Slanke figuur: geen tekstlabels, alleen adjusted PSF per punt; details via hover-callback."""
+    fig = go.Figure()
+    for kwaliteit, color in (('ok', 'green'), ('nok', 'red')):
+        part = grouped[grouped['kwaliteit'] == kwaliteit]
+        fig.add_bar(
+            name=kwaliteit, x=part['SpotName'], y=part['count'], marker_color=color,
+            customdata=part['adjusted_psf'].round(1),
+            hovertemplate='%{x}<br>lassen: %{y}<br>adjusted PSF: %{customdata}<extra>%{fullData.name}</extra>'
+        )
+    fig.update_layout(
+        barmode='stack',
+        title=chart_title(apply_sigma, thr),
+        xaxis=dict(categoryorder='array', categoryarray=spots),
+    )
+    return fig
+
+def build_chart(grouped, apply_sigma, thr, page=1):
+    """
+    Figuur + info-tekst + modus. Tot CHART_MAX_SPOTS spots: volledige grafiek met alle hover-velden.
+    Daarboven: worst-first gesorteerd, per CHART_PAGE_SIZE spots gepagineerd.
+    """
+    n_spots = grouped['SpotName'].nunique()
+    if n_spots <= CHART_MAX_SPOTS:
+        fig = build_full_chart(add_band_advice(grouped, thr), apply_sigma, thr)
+        info = f"{n_spots} spots"
+        mode = {'scalable': False}
+    else:
+        pages = math.ceil(n_spots / CHART_PAGE_SIZE)
+        page = min(max(int(page or 1), 1), pages)
+        spots = rank_spots(grouped)[(page - 1) * CHART_PAGE_SIZE:page * CHART_PAGE_SIZE]
+        fig = build_paged_chart(grouped[grouped['SpotName'].isin(spots)], spots, apply_sigma, thr)
+        info = f"{n_spots} spots (slechtste eerst) — pagina {page}/{pages}, hover voor details"
+        mode = {'scalable': True}
+
     fig.update_layout(
         font=dict(family="Arial, sans-serif", size=15, color="black"),
         xaxis_tickangle=45,
@@ -469,9 +1361,267 @@ def update_chart(df_json, selected_timer, selected_npt, nok_only, adaptief_value
         legend_title_text='Kwaliteit',
         autosize=True
     )
+    return fig, info, mode
+
+# plotly importeert orjson pas bij de eerste to_json(); gelijktijdig vanuit meerdere
+# threads geeft dat een half geïnitialiseerde module. Eén keer vooraf in de hoofdthread.
+go.Figure().to_json()
+
+def chart_output(fig, info='', mode=None):
+    """Callback-output met de payloadgrootte van de figuur erbij."""
+    kb = len(fig.to_json()) / 1024
+    return fig, f"{info}{' — ' if info else ''}figuur {kb:,.0f} kB", mode or {'scalable': False}
+
+CHART_OUTPUTS = [
+    Output('bar-chart', 'figure'),
+    Output('chart-info', 'children'),
+    Output('chart-mode', 'data'),
+]
+CHART_FILTER_INPUTS = [
+    Input('timer-dropdown', 'value'),
+    Input('npt-dropdown', 'value'),
+    Input('nok-only', 'value'),
+    Input('adaptief-checkbox', 'value'),
+    Input('tolband-filter', 'value'),
+    Input('min-welds-input', 'value'),
+    Input('max-welds-input', 'value'),
+    Input('min-psf-input', 'value'),
+    Input('max-psf-input', 'value'),
+    Input('sigma-threshold', 'value'),
+    Input('sigma-button', 'n_clicks'),
+    Input('chart-page', 'value')
+]
+
+def update_chart(df_store, selected_timer, selected_npt, nok_only, adaptief_value, tolband_filter,
+                 min_welds, max_welds, min_psf, max_psf, sigma_threshold, sigma_click, page=1):
+    if not df_store:
+        return chart_output(px.bar(title="⚠️ Geen geldige data geladen"))
+
+    with psf_metrics.stage('store_decode'):
+        df = decode_store(df_store)
+    if df.empty:
+        return chart_output(px.bar(title="⚠️ Geen data gevonden"))
+
+    # Sigma toggle
+    apply_sigma = (sigma_click or 0) % 2 == 1
+    thr = resolve_threshold(sigma_threshold)
+
+    df = filter_rows(df, selected_timer, selected_npt, 'nok' in (nok_only or []),
+                     'adaptief' in (adaptief_value or []), tolband_filter, apply_sigma)
+
+    if df.empty:
+        return chart_output(px.bar(title="⚠️ Geen data na filters"))
+
+    with psf_metrics.stage('groupby'):
+        grouped = aggregate_spots(df, ['SpotName', 'kwaliteit'], min_welds, max_welds,
+                                  min_psf, max_psf, apply_sigma, thr)
+
+    if grouped.empty:
+        return chart_output(px.bar(title="ℹ️ Geen rijen na (extra) filters"))
+
+    with psf_metrics.stage('figure_build'):
+        fig, info, mode = build_chart(grouped, apply_sigma, thr, page)
+    return chart_output(fig, info, mode)
+
+def _codes(series):
+    codes, uniques = pd.factorize(series, sort=True)
+    return codes.tolist(), uniques.tolist()
+
+def _nullable(series):
+    return [None if pd.isna(v) else v for v in series.tolist()]
+
+def spot_cells(df, version=None):
+    """
+    Compacte, kolomsgewijze pre-aggregatie voor de browser: één cel per
+    (timer, NPT, spot, kwaliteit, adaptief, switched). Sommen + aantallen i.p.v.
+    gemiddelden, zodat de client na filteren exact kan her-stapelen per spot.
+    """
+    keys = ['TimerName', 'NPTName', 'SpotName', 'Tol=OK', 'uirRegulationActive', 'TolBands_switched']
+    d = df.assign(SpotName=df['SpotName'].astype(str), _row=np.arange(len(df)))
+    cells = d.groupby(keys, dropna=False, sort=False).agg(
+        count=('cnt_welds_lastShift', 'sum'),
+        psf_sum=('AVG_PSF_last_shift', 'sum'),
+        psf_n=('AVG_PSF_last_shift', 'count'),
+        sd_sum=('STDEV_stabilisationFactor', 'sum'),
+        sd_n=('STDEV_stabilisationFactor', 'count'),
+        cond=('uirPsfCondTol', 'first'),
+        lower=('uirPsfLowerTol', 'first'),
+        first_row=('_row', 'min'),
+    ).reset_index().sort_values('first_row')   # 'first' tol-waarde = eerste rij, zoals op de server
+
+    timer_codes, timers = _codes(cells['TimerName'])
+    npt_codes, npts = _codes(cells['NPTName'])
+    spot_codes, spots = _codes(cells['SpotName'])
+    return {
+        'version': version,
+        'timers': timers, 'npts': npts, 'spots': spots,
+        'min_thr': MIN_SIGMA_THRESHOLD, 'default_thr': DEFAULT_SIGMA_THRESHOLD, 'psf_hi': PSF_THRESH_HI,
+        'low_band': LOW_BAND, 'high_band': HIGH_BAND,
+        'max_spots': CHART_MAX_SPOTS, 'page_size': CHART_PAGE_SIZE,
+        'cells': {
+            'timer': timer_codes, 'npt': npt_codes, 'spot': spot_codes,
+            'ok': cells['Tol=OK'].astype(int).tolist(),
+            'active': _nullable(cells['uirRegulationActive']),
+            'switched': _nullable(cells['TolBands_switched']),
+            'count': cells['count'].round(6).tolist(),
+            'psf_sum': cells['psf_sum'].round(6).tolist(), 'psf_n': cells['psf_n'].tolist(),
+            'sd_sum': cells['sd_sum'].round(6).tolist(), 'sd_n': cells['sd_n'].tolist(),
+            'cond': _nullable(cells['cond']), 'lower': _nullable(cells['lower']),
+        },
+    }
+
+if CLIENTSIDE_CHART:
+    @app.callback(
+        Output('agg-store', 'data'),
+        Input('snapshot-version', 'data'),
+    )
+    def build_agg_store(version):
+        """Eén keer per dataversie naar de browser; alle filterklikken blijven daarna lokaal."""
+        if not version:
+            raise PreventUpdate
+        try:
+            snap = current_snapshot()
+        except Exception:
+            raise PreventUpdate
+        if snap['version'] != version:
+            # De browser heeft df-store/index van `version`: precies die versie aggregeren
+            snap = snapshot_for_version(version)
+            if snap is None:
+                # Versie niet meer beschikbaar: de volgende snapshot-poll stuurt de huidige versie
+                raise PreventUpdate
+        with psf_metrics.stage('spot_cells'):
+            return spot_cells(snap['df'], version)
+
+    app.clientside_callback(
+        ClientsideFunction(namespace='psf', function_name='renderChart'),
+        *CHART_OUTPUTS,
+        Input('agg-store', 'data'),
+        *CHART_FILTER_INPUTS,
+    )
+else:
+    app.callback(*CHART_OUTPUTS, Input('df-store', 'data'), *CHART_FILTER_INPUTS)(update_chart)
 
+@app.callback(
+    Output('spot-detail', 'children'),
+    Input('bar-chart', 'hoverData'),
+    State('chart-mode', 'data'),
+    State('timer-dropdown', 'value'),
+    State('npt-dropdown', 'value'),
+    State('nok-only', 'value'),
+    State('adaptief-checkbox', 'value'),
+    State('tolband-filter', 'value'),
+    State('sigma-threshold', 'value'),
+    State('sigma-button', 'n_clicks'),
+    State('min-welds-input', 'value'),
+    State('max-welds-input', 'value'),
+    State('min-psf-input', 'value'),
+    State('max-psf-input', 'value'),
+    State('snapshot-version', 'data'),
+    prevent_initial_call=True
+)
+def show_spot_detail(hover, chart_mode, selected_timer, selected_npt, nok_only, adaptief_value,
+                     tolband_filter, sigma_threshold, sigma_click, min_welds, max_welds, min_psf,
+                     max_psf, version):
+    """Hover-details voor één spot, pas opgehaald als de spot gefocust wordt (schaalbare modus)."""
+    if not hover or not (chart_mode or {}).get('scalable'):
+        return None
+    # Dezelfde dataversie als de grafiek in de browser, niet de intussen nieuwere snapshot
+    snap = snapshot_for_version(version)
+    if snap is None:
+        raise PreventUpdate
+
+    spot = str(hover['points'][0]['x'])
+    df = snap['df']
+    df = df[df['SpotName'].astype(str) == spot]
+
+    apply_sigma = (sigma_click or 0) % 2 == 1
+    thr = resolve_threshold(sigma_threshold)
+    df = filter_rows(df, selected_timer, selected_npt, 'nok' in (nok_only or []),
+                     'adaptief' in (adaptief_value or []), tolband_filter, apply_sigma)
+    if df.empty:
+        return None
+    # Zelfde lassen-/PSF-filters als renderChart, anders tonen de details meer dan de balk
+    grouped = aggregate_spots(df, ['SpotName', 'kwaliteit'], min_welds, max_welds,
+                              min_psf, max_psf, apply_sigma, thr)
+    if grouped.empty:
+        return None
+    grouped = add_band_advice(grouped, thr)
+
+    header = ['kwaliteit', 'lassen', 'avg PSF', 'stdev PSF', 'adjusted PSF',
+              'cond tol', 'lower tol', 'aanbevolen', 'band']
+    body = [
+        html.Tr([html.Td(r.kwaliteit), html.Td(int(r.count)), html.Td(f"{r.avg_psf:.2f}"),
+                 html.Td(f"{r.stdev_psf:.2f}"), html.Td(f"{r.adjusted_psf:.2f}"),
+                 html.Td(r.cond_tol), html.Td(r.lower_tol), html.Td(r.aanbevolen_label),
+                 html.Td(r.band_match)])
+        for r in grouped.itertuples(index=False)
+    ]
+    return html.Div([
+        html.H4(f"Spot {spot}"),
+        html.Table([html.Tr([html.Th(h) for h in header])] + body)
+    ])
+
+
+@app.callback(
+    Output('spot-series', 'figure'),
+    Input('bar-chart', 'clickData'),
+    Input('series-hours', 'value'),
+    State('timer-dropdown', 'value'),
+    prevent_initial_call=True
+)
+def show_spot_series(click, hours, selected_timer):
+    """Drill-down: PSF per las voor de aangeklikte spot (gedownsampled op de server)."""
+    if not click:
+        raise PreventUpdate
+    spot = str(click['points'][0]['x'])
+    try:
+        s = spot_series(spot, selected_timer, hours or 24)
+    except UnknownSpot:
+        return go.Figure(layout=dict(title=f"Spot {spot} niet gevonden in de huidige data"))
+    except Exception as e:
+        return go.Figure(layout=dict(title=f"❌ PSF-reeks niet beschikbaar: {e}"))
+
+    fig = go.Figure(go.Scattergl(x=s['ts'], y=s['psf'], mode='lines+markers', marker=dict(size=4),
+                                 name='PSF', hovertemplate='%{x}<br>PSF %{y:.1f}<extra></extra>'))
+    fig.add_hline(y=PSF_THRESH_HI, line_dash='dot', line_color='grey',
+                  annotation_text=f"PSF {PSF_THRESH_HI}")
+    shown = f"{s['points']} van {s['raw_points']} lassen" + (" (afgekapt)" if s['truncated'] else "")
+    fig.update_layout(
+        title=f"Spot {spot}{' — ' + selected_timer if selected_timer else ''}: PSF per las "
+              f"({shown}, cond tol {s['cond_tol']}, lower tol {s['lower_tol']})",
+        yaxis_title='PSF', margin=dict(l=40, r=40, t=60, b=40),
+    )
     return fig
 
+@app.callback(
+    Output('export-csv-link', 'href'),
+    Output('export-parquet-link', 'href'),
+    Output('export-raw-link', 'href'),
+    Input('timer-dropdown', 'value'),
+    Input('npt-dropdown', 'value'),
+    Input('nok-only', 'value'),
+    Input('adaptief-checkbox', 'value'),
+    Input('tolband-filter', 'value'),
+    Input('sigma-button', 'n_clicks'),
+    Input('min-welds-input', 'value'),
+    Input('max-welds-input', 'value'),
+    Input('min-psf-input', 'value'),
+    Input('max-psf-input', 'value'),
+    Input('sigma-threshold', 'value'),
+)
+def export_data_links(selected_timer, selected_npt, nok_only, adaptief_value, tolband_filter,
+                      sigma_click, min_welds, max_welds, min_psf, max_psf, sigma_threshold):
+    """Download-links naar /api/export-data met dezelfde filters als grafiek en XML-export."""
+    args = {
+        'timer': selected_timer or '', 'npt': selected_npt or '',
+        'nok': int('nok' in (nok_only or [])), 'adaptief': int('adaptief' in (adaptief_value or [])),
+        'tolband': tolband_filter or 'all', 'sigma': (sigma_click or 0) % 2,
+        'min_welds': '' if min_welds is None else min_welds, 'max_welds': '' if max_welds is None else max_welds,
+        'min_psf': '' if min_psf is None else min_psf, 'max_psf': '' if max_psf is None else max_psf,
+        'threshold': '' if sigma_threshold is None else sigma_threshold,
+    }
+    return tuple(f"/api/export-data?{urlencode(dict(args, format=fmt, level=level))}"
+                 for fmt, level in (('csv', 'filtered'), ('parquet', 'filtered'), ('parquet', 'raw')))
 
 
 # ===== XML export =====
@@ -493,136 +1643,31 @@ def update_chart(df_json, selected_timer, selected_npt, nok_only, adaptief_value
     State('sigma-threshold', 'value'),
     prevent_initial_call=True
 )
-def export_xml(n_clicks, df_json, selected_timer, selected_npt, nok_only, adaptief_value, tolband_filter,
+def export_xml(n_clicks, df_store, selected_timer, selected_npt, nok_only, adaptief_value, tolband_filter,
                sigma_click, min_welds, max_welds, min_psf, max_psf, sigma_threshold):
-    if not n_clicks or not df_json:
+    if not n_clicks or not df_store:
         raise PreventUpdate
 
-    df = pd.read_json(StringIO(df_json), orient='split')
+    with psf_metrics.stage('store_decode'):
+        df = decode_store(df_store)
     if df.empty:
         raise PreventUpdate
 
-    df['kwaliteit'] = df['Tol=OK'].map({1: 'ok', 0: 'nok'})
-
     # Zelfde filters als in grafiek
-    if selected_timer:
-        df = df[df['TimerName'] == selected_timer]
-    if selected_npt:
-        df = df[df['NPTName'] == selected_npt]
-    if 'nok' in (nok_only or []):
-        df = df[df['kwaliteit'] == 'nok']
-
-    apply_sigma = (sigma_click or 0) % 2 == 1
-    thr = sigma_threshold if (sigma_threshold is not None and sigma_threshold >= MIN_SIGMA_THRESHOLD) else DEFAULT_SIGMA_THRESHOLD
-
-    adaptief = 'adaptief' in (adaptief_value or [])
-    if apply_sigma:
-        df = df[df['uirRegulationActive'] == 1]  # in sigma altijd adaptief
-    else:
-        df = df[df['uirRegulationActive'] == (1 if adaptief else 0)]
-
-    if tolband_filter == 'not_switched':
-        df = df[df['TolBands_switched'] == 0]
-    elif tolband_filter == 'switched':
-        df = df[df['TolBands_switched'] == 1]
-
-    if df.empty:
-        raise PreventUpdate
-
-    df['SpotName'] = df['SpotName'].astype(str)
-
-    grouped = df.groupby(['NPTName', 'TimerName', 'SpotName', 'kwaliteit'], as_index=False).agg(
-        count=('cnt_welds_lastShift', 'sum'),
-        avg_psf=('AVG_PSF_last_shift', 'mean'),
-        stdev_psf=('STDEV_stabilisationFactor', 'mean'),
+    grouped, thr = export_grouping(
+        df, selected_timer, selected_npt,
+        nok_only='nok' in (nok_only or []),
+        adaptief='adaptief' in (adaptief_value or []),
+        tolband_filter=tolband_filter,
+        min_welds=min_welds, max_welds=max_welds, min_psf=min_psf, max_psf=max_psf,
+        apply_sigma=(sigma_click or 0) % 2 == 1,
+        sigma_threshold=sigma_threshold,
     )
-    grouped['stdev_psf'] = grouped['stdev_psf'].fillna(0.0)
-    grouped['avg_psf']   = grouped['avg_psf'].fillna(0.0)
-    grouped['adjusted_psf'] = grouped['avg_psf'] - 6 * grouped['stdev_psf']
-
-    # Numerieke UI-filters
-    min_val = min_welds if min_welds is not None else 0
-    max_val = max_welds if max_welds is not None else float('inf')
-    grouped = grouped[(grouped['count'] >= min_val) & (grouped['count'] <= max_val)]
-    min_psf_val = min_psf if min_psf is not None else 0
-    max_psf_val = max_psf if max_psf is not None else float('inf')
-    grouped = grouped[(grouped['avg_psf'] >= min_psf_val) & (grouped['avg_psf'] <= max_psf_val)]
-
-    # Sigma: ENKEL NOK + adjusted_psf > drempel
-    if apply_sigma:
-        grouped = grouped[(grouped['adjusted_psf'] > thr) & (grouped['kwaliteit'] == 'nok')]
 
     if grouped.empty:
         raise PreventUpdate
 
-    creation = datetime.now().strftime("%Y-%m-%d--%H:%M:%S.%f")[:-3]
-
-    xml_lines = [
-        '<?xml version="1.0" encoding="utf-8" standalone="yes"?>',
-        '<nwsXml:InternalTimerWeldingData xmlns:nwsXml="nwsXML">'
-    ]
-
-    for (npt, timer), group_df in grouped.groupby(['NPTName', 'TimerName']):
-        timer_q = quoteattr(str(timer))
-        npt_q   = quoteattr(str(npt))
-        creation_q = quoteattr(creation)
-
-        xml_lines.append(
-            f'  <Header CreatorName="PSF_TOOL" CreationDate={creation_q} '
-            f'TimerName={timer_q} TimerIP="" LinePC={npt_q} '
-            f'SchemaVersion="12" BaseFirmwareVersion="1.11.11.2" ApplicationVersion="1000_1.2.0" '
-            f'ConfigurationVersion="Cfg_1000_1.0.8" ApplicationIdentifier="1000" DataManagerVersion="1.11.11.0" />'
-        )
-        xml_lines.append('  <WeldJobs>')
-
-        for _, row in group_df.iterrows():
-            spot = str(row['SpotName'])
-            psf  = float(row['adjusted_psf'])
-
-            if thr < psf < PSF_THRESH_HI:
-                vals = LOW_BAND
-            elif PSF_THRESH_HI <= psf <= 100:
-                vals = HIGH_BAND
-            else:
-                continue
-
-            spot_name = f"WJ_{spot}"
-            spot_q = quoteattr(spot_name)
-
-            xml_lines.append(f'    <WeldJob Name={spot_q}>')
-            xml_lines.append(f'      <Param No="100001" Name="WJ_WeldJobName" Value={spot_q} Unit="" />')
-            xml_lines.append('      <SequenceBlocks>')
-            xml_lines.append('        <SequenceBlock Name="">')
-            xml_lines.append('          <WeldBlocks>')
-            xml_lines.append('            <WeldBlock Name="1">')
-            xml_lines.append('            </WeldBlock>')
-            xml_lines.append('          </WeldBlocks>')
-            xml_lines.append('          <MonitoringBlocks>')
-            xml_lines.append('            <MonitoringBlock Name="1">')
-            xml_lines.append(f'              <Param No="130003" Name="MB_MonitorValue" Value="{vals["v3"]}" Unit="" />')
-            xml_lines.append(f'              <Param No="130004" Name="MB_MonitorMode" Value="{vals["v4"]}" Unit="" />')
-            xml_lines.append('              <Param No="130005" Name="MB_MonitorReferenceValue" Value="10000" Unit="depends on MonitorValue:0=A1=mV2=(%*100)3=ms4=uOhm5=17=N6=7=8=13=(%*100)9=11=14=15=16=18=20(mm*10000)10=(kNm*1000)12=Ws" />')
-            xml_lines.append('              <Param No="130008" Name="MB_UpperToleranceBandPerc" Value="100.00" Unit="%" />')
-            xml_lines.append(f'              <Param No="130009" Name="MB_LowerToleranceBandPerc" Value="{vals["v9"]}" Unit="%" />')
-            xml_lines.append(f'              <Param No="130010" Name="MB_CondUpperToleranceBandPerc" Value="{vals["v10"]}" Unit="%" />')
-            xml_lines.append(f'              <Param No="130011" Name="MB_CondLowerToleranceBandPerc" Value="{vals["v11"]}" Unit="%" />')
-            xml_lines.append('            </MonitoringBlock>')
-            xml_lines.append('            <MonitoringBlock Name="2">')
-            xml_lines.append('            </MonitoringBlock>')
-            xml_lines.append('          </MonitoringBlocks>')
-            xml_lines.append('          <ReferenceCurves>')
-            xml_lines.append('            <ReferenceCurve Name="1">')
-            xml_lines.append('            </ReferenceCurve>')
-            xml_lines.append('          </ReferenceCurves>')
-            xml_lines.append('        </SequenceBlock>')
-            xml_lines.append('      </SequenceBlocks>')
-            xml_lines.append('    </WeldJob>')
-
-        xml_lines.append('  </WeldJobs>')
-
-    xml_lines.append('</nwsXml:InternalTimerWeldingData>')
-
-    xml_content = "\n".join(xml_lines)
+    xml_content = build_tolband_xml(grouped, thr)
     fname_base = selected_npt or 'all'
     filename = f"{fname_base}.xml"
 
@@ -632,5 +1677,3 @@ def export_xml(n_clicks, df_json, selected_timer, selected_npt, nok_only, adapti
 if __name__ == '__main__':
     port = int(os.environ.get("PORT", "8080"))
     app.run(debug=False, host='0.0.0.0', port=port)
-
-
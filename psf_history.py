@@ -0,0 +1,182 @@
+"""
+Lokale historiek van PSF-snapshots.
+
+Elke ververste snapshot wordt als Parquet-bestand weggeschreven in een
+dag-gepartitioneerde map (hive-stijl):
+
+    <PSF_HISTORY_DIR>/date=YYYY-MM-DD/part-HHMMSS-<versie>.parquet
+
+Afgesloten dagen worden gecompacteerd tot één bestand (gesorteerd op timer/spot/tijd,
+zodat row-group statistieken filters goed afschermen), dagen ouder dan de
+retentie worden verwijderd. Trendvragen lezen alleen deze map en raken GADATA niet.
+"""
+import os
+import shutil
+import time
+from datetime import datetime, timedelta
+from pathlib import Path
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+
+HISTORY_DIR            = Path(os.getenv("PSF_HISTORY_DIR", "psf_history"))
+HISTORY_RETENTION_DAYS = int(os.getenv("PSF_HISTORY_RETENTION_DAYS", "180"))
+MAINTENANCE_INTERVAL   = 3600  # sec tussen compactie/retentie-rondes
+
+# Kolommen die we bewaren (de rest van de snapshot is niet nodig voor trends)
+HISTORY_COLUMNS = [
+    'scope', 'TimerName', 'NPTName', 'SpotName',
+    'cnt_welds_lastShift', 'AVG_PSF_last_shift', 'STDEV_stabilisationFactor',
+    'uirPsfCondTol', 'uirPsfLowerTol', 'uirRegulationActive', 'Tol=OK', 'TolBands_switched',
+]
+
+PARTITIONING = ds.partitioning(pa.schema([('date', pa.string())]), flavor='hive')
+COMPACTED_NAME = "compacted.parquet"
+LOCK_NAME = ".maintenance.lock"
+
+_last_maintenance = 0.0
+
+
+def _day_dir(day):
+    return HISTORY_DIR / f"date={day:%Y-%m-%d}"
+
+
+def append_snapshot(df, loaded_at, version):
+    """
+    Schrijf een snapshot weg. Dezelfde versie op dezelfde dag wordt maar één keer
+    bewaard (meerdere gunicorn-workers verversen elk hun eigen snapshot).
+    """
+    day_dir = _day_dir(loaded_at)
+    day_dir.mkdir(parents=True, exist_ok=True)
+    if any(day_dir.glob(f"part-*-{version}.parquet")):
+        return None
+
+    cols = [c for c in HISTORY_COLUMNS if c in df.columns]
+    hist = df[cols].assign(
+        SpotName=df['SpotName'].astype(str),
+        snapshot_ts=pd.Timestamp(loaded_at),
+        version=version,
+    )
+    path = day_dir / f"part-{loaded_at:%H%M%S}-{version}.parquet"
+    tmp = path.with_suffix(".tmp")
+    pq.write_table(pa.Table.from_pandas(hist, preserve_index=False), tmp, compression="zstd")
+    os.replace(tmp, path)
+
+    if time.time() - _last_maintenance > MAINTENANCE_INTERVAL:
+        maintain()
+    return path
+
+
+def _acquire_lock():
+    lock = HISTORY_DIR / LOCK_NAME
+    try:
+        fd = os.open(lock, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+    except FileExistsError:
+        # Achtergebleven lock van een gecrasht proces negeren na een uur
+        if time.time() - lock.stat().st_mtime < MAINTENANCE_INTERVAL:
+            return None
+        lock.unlink(missing_ok=True)
+        return _acquire_lock()
+    os.close(fd)
+    return lock
+
+
+def compact_day(day_dir):
+    """Voeg alle part-bestanden van een afgesloten dag samen tot één gesorteerd bestand."""
+    parts = sorted(day_dir.glob("part-*.parquet"))
+    if not parts:
+        return 0
+    files = parts + ([day_dir / COMPACTED_NAME] if (day_dir / COMPACTED_NAME).exists() else [])
+    table = pa.concat_tables([pq.read_table(f) for f in files], promote_options="default")
+    table = table.sort_by([('TimerName', 'ascending'), ('SpotName', 'ascending'), ('snapshot_ts', 'ascending')])
+
+    tmp = day_dir / (COMPACTED_NAME + ".tmp")
+    pq.write_table(table, tmp, compression="zstd", row_group_size=64 * 1024)
+    os.replace(tmp, day_dir / COMPACTED_NAME)
+    for f in parts:
+        f.unlink(missing_ok=True)
+    return len(parts)
+
+
+def maintain(now=None):
+    """Retentie + compactie van afgesloten dagen. Eén proces tegelijk (lock-bestand)."""
+    global _last_maintenance
+    _last_maintenance = time.time()
+    if not HISTORY_DIR.exists():
+        return
+    lock = _acquire_lock()
+    if lock is None:
+        return
+    try:
+        now = now or datetime.now()
+        oldest = f"date={(now - timedelta(days=HISTORY_RETENTION_DAYS)):%Y-%m-%d}"
+        today = _day_dir(now).name
+        for day_dir in sorted(HISTORY_DIR.glob("date=*")):
+            if day_dir.name < oldest:
+                shutil.rmtree(day_dir, ignore_errors=True)
+            elif day_dir.name < today:
+                compact_day(day_dir)
+    finally:
+        lock.unlink(missing_ok=True)
+
+
+def _read(filter_expr, start, end, columns):
+    if not HISTORY_DIR.exists():
+        return pd.DataFrame(columns=columns)
+    dataset = ds.dataset(HISTORY_DIR, format="parquet", partitioning=PARTITIONING,
+                         exclude_invalid_files=True)
+    # Partitie-filter (date) laat hele dagen vallen, snapshot_ts filtert binnen de dag
+    expr = (
+        (ds.field('date') >= f"{start:%Y-%m-%d}") & (ds.field('date') <= f"{end:%Y-%m-%d}") &
+        (ds.field('snapshot_ts') >= pa.scalar(pd.Timestamp(start), pa.timestamp('ns'))) &
+        (ds.field('snapshot_ts') <= pa.scalar(pd.Timestamp(end), pa.timestamp('ns'))) &
+        filter_expr
+    )
+    return dataset.to_table(columns=columns, filter=expr).to_pandas()
+
+
+def _trend(raw, keys):
+    if raw.empty:
+        return pd.DataFrame(columns=keys + ['welds', 'avg_psf', 'stdev_psf', 'adjusted_psf'])
+    out = raw.groupby(keys, as_index=False).agg(
+        welds=('cnt_welds_lastShift', 'sum'),
+        avg_psf=('AVG_PSF_last_shift', 'mean'),
+        stdev_psf=('STDEV_stabilisationFactor', 'mean'),
+    )
+    out['adjusted_psf'] = out['avg_psf'].fillna(0.0) - 6 * out['stdev_psf'].fillna(0.0)
+    return out.sort_values(keys)
+
+
+def spot_trend(spot, start, end=None, timer=None):
+    """Verloop van PSF per snapshot voor één spot (optioneel beperkt tot één timer)."""
+    end = end or datetime.now()
+    expr = ds.field('SpotName') == str(spot)
+    if timer:
+        expr = expr & (ds.field('TimerName') == timer)
+    raw = _read(expr, start, end, ['snapshot_ts', 'TimerName', 'cnt_welds_lastShift',
+                                   'AVG_PSF_last_shift', 'STDEV_stabilisationFactor',
+                                   'uirPsfCondTol', 'uirPsfLowerTol'])
+    trend = _trend(raw, ['snapshot_ts', 'TimerName'])
+    if not raw.empty:
+        tol = raw.groupby(['snapshot_ts', 'TimerName'], as_index=False).agg(
+            cond_tol=('uirPsfCondTol', 'first'), lower_tol=('uirPsfLowerTol', 'first'))
+        trend = trend.merge(tol, on=['snapshot_ts', 'TimerName'], how='left')
+    return trend
+
+
+def timer_trend(timer, start, end=None):
+    """Verloop per snapshot voor één timer: lassen, gemiddelde PSF en aantal NOK-spots."""
+    end = end or datetime.now()
+    raw = _read(ds.field('TimerName') == timer, start, end,
+                ['snapshot_ts', 'SpotName', 'cnt_welds_lastShift', 'AVG_PSF_last_shift',
+                 'STDEV_stabilisationFactor', 'Tol=OK'])
+    trend = _trend(raw, ['snapshot_ts'])
+    if not raw.empty:
+        spots = pd.DataFrame({
+            'spots': raw.groupby('snapshot_ts')['SpotName'].nunique(),
+            'nok_spots': raw[raw['Tol=OK'] == 0].groupby('snapshot_ts')['SpotName'].nunique(),
+        }).fillna(0).astype(int).reset_index()
+        trend = trend.merge(spots, on='snapshot_ts', how='left')
+    return trend
@@ -0,0 +1,227 @@
+"""
+Load-test voor de PSF dashboard callbacks zonder SQL Server.
+
+Start het dashboard met een lokale databron (synthetisch of een opgenomen
+snapshot) en laat gesimuleerde gebruikers realistische filterreeksen doorlopen
+over load_from_db, build_agg_store en export_xml. Met PSF_CLIENTSIDE_CHART=1
+(default) filtert de browser zelf en is build_agg_store (spot_cells) de
+server-kost per paginabezoek; met PSF_CLIENTSIDE_CHART=0 wordt update_chart per
+filterklik gemeten. Rapporteert latency-percentielen per callback, de grootte
+van de agg-store payload en het geheugengebruik.
+
+    python psf_loadtest.py --users 8 --sessions 20 --timers 80 --spots 60
+    python psf_loadtest.py --source replay:snapshots/ga5.parquet --max-p95 build_agg_store=800
+    python psf_loadtest.py --record snapshots/ga5.parquet      # opnemen uit GADATA
+"""
+import argparse
+import json
+import os
+import random
+import resource
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+
+def parse_args(argv=None):
+    p = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    p.add_argument("--source", default="synthetic", help="synthetic | replay:<pad> (default: synthetic)")
+    p.add_argument("--users", type=int, default=8, help="gelijktijdige gebruikers")
+    p.add_argument("--sessions", type=int, default=10, help="filterreeksen per gebruiker")
+    p.add_argument("--lines", default="GA-5", help="synthetisch: lijnen, komma-gescheiden")
+    p.add_argument("--timers", type=int, default=40, help="synthetisch: timers per lijn")
+    p.add_argument("--spots", type=int, default=60, help="synthetisch: spots per timer")
+    p.add_argument("--rows-per-spot", type=int, default=3, help="synthetisch: rijen per spot")
+    p.add_argument("--seed", type=int, default=0)
+    p.add_argument("--tracemalloc", action="store_true", help="Python-allocaties meten (trager)")
+    p.add_argument("--json", action="store_true", help="rapport als JSON")
+    p.add_argument("--max-p95", action="append", default=[], metavar="CALLBACK=MS",
+                   help="faal (exit 1) als p95 van CALLBACK boven MS ligt")
+    p.add_argument("--record", metavar="PAD", help="huidige fetch (PSF_DATA_SOURCE) opnemen als replay-bestand en stoppen")
+    return p.parse_args(argv)
+
+
+def configure_env(args):
+    # Moet gezet zijn vóór psf_dashboard geïmporteerd wordt (DATA_SOURCE wordt bij import gekozen)
+    if not args.record:
+        os.environ["PSF_DATA_SOURCE"] = args.source
+    # CLI wint van een eventueel al gezette omgeving
+    os.environ["PSF_SYNTH_LINES"] = args.lines
+    os.environ["PSF_SYNTH_TIMERS"] = str(args.timers)
+    os.environ["PSF_SYNTH_SPOTS"] = str(args.spots)
+    os.environ["PSF_SYNTH_ROWS_PER_SPOT"] = str(args.rows_per_spot)
+    os.environ["PSF_SYNTH_SEED"] = str(args.seed)
+    # Load-test mag de lokale historiek niet vervuilen
+    os.environ.setdefault("PSF_HISTORY_DIR", os.path.join("/tmp", "psf_loadtest_history"))
+    # Eigen snapshotmap per run: anders adopteert het dashboard de gedeelde snapshot van een vorige run
+    os.environ["PSF_SNAPSHOT_DIR"] = tempfile.mkdtemp(prefix="psf_loadtest_snapshot_")
+
+
+class Recorder:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.samples = defaultdict(list)
+        self.errors = defaultdict(int)
+
+    def timed(self, name, fn, *args):
+        t0 = time.perf_counter()
+        try:
+            return fn(*args)
+        except Exception as e:
+            # PreventUpdate (lege export) is normaal gedrag, geen fout
+            if type(e).__name__ != "PreventUpdate":
+                with self._lock:
+                    self.errors[name] += 1
+            return None
+        finally:
+            ms = (time.perf_counter() - t0) * 1000
+            with self._lock:
+                self.samples[name].append(ms)
+
+
+def percentile(values, q):
+    values = sorted(values)
+    if not values:
+        return None
+    k = (len(values) - 1) * q / 100
+    lo, hi = int(k), min(int(k) + 1, len(values) - 1)
+    return values[lo] + (values[hi] - values[lo]) * (k - lo)
+
+
+def user_session(dash_mod, rec, rng, df_store, index, version):
+    """Eén realistische reeks: pagina laden, lijn kiezen, timer kiezen, NOK/sigma togglen, drempel, export."""
+    state = dict(timer=None, npt=None, nok=[], adaptief=['adaptief'], tolband='all',
+                 min_w=0, max_w=9999, min_psf=0, max_psf=9999, thr=dash_mod.DEFAULT_SIGMA_THRESHOLD,
+                 sigma=0, page=1)
+
+    def load_page():
+        # Client-side: de browser haalt de agg-store één keer per dataversie op
+        if dash_mod.CLIENTSIDE_CHART:
+            rec.timed("build_agg_store", dash_mod.build_agg_store, version)
+
+    def chart():
+        # Client-side blijven filterklikken in de browser: geen serverwerk
+        if dash_mod.CLIENTSIDE_CHART:
+            return
+        rec.timed("update_chart", dash_mod.update_chart, df_store, state['timer'], state['npt'],
+                  state['nok'], state['adaptief'], state['tolband'], state['min_w'], state['max_w'],
+                  state['min_psf'], state['max_psf'], state['thr'], state['sigma'], state['page'])
+
+    def export():
+        rec.timed("export_xml", dash_mod.export_xml, 1, df_store, state['timer'], state['npt'],
+                  state['nok'], state['adaptief'], state['tolband'], state['sigma'], state['min_w'],
+                  state['max_w'], state['min_psf'], state['max_psf'], state['thr'])
+
+    load_page()
+    chart()                                     # eerste render, alles open
+    npts = sorted(n for n in index if n)
+
+    def pick_timer():
+        # Zoals de afhankelijke dropdown: alleen timers binnen de gekozen NPT
+        per_npt = index.get(state['npt']) if state['npt'] else {t: 0 for n in index.values() for t in n}
+        state.update(timer=rng.choice(sorted(per_npt)))
+
+    steps = [
+        lambda: state.update(npt=rng.choice(npts), timer=None),
+        pick_timer,
+        lambda: state.update(nok=['nok']),
+        lambda: state.update(tolband=rng.choice(['all', 'not_switched', 'switched'])),
+        lambda: state.update(sigma=state['sigma'] + 1),
+        lambda: state.update(thr=rng.randint(dash_mod.MIN_SIGMA_THRESHOLD, 85)),
+        lambda: state.update(min_w=rng.choice([0, 10, 50])),
+        lambda: state.update(timer=None, npt=None, page=rng.randint(1, 5)),
+    ]
+    for step in rng.sample(steps, k=rng.randint(3, len(steps))):
+        step()
+        chart()
+    export()
+
+
+def run(args):
+    configure_env(args)
+    import psf_dashboard as dash_mod
+    import psf_sources
+
+    if args.record:
+        df, report = dash_mod.fetch_scopes(dash_mod.SCOPES)
+        path = psf_sources.record_snapshot(df.drop(columns=['scope']), args.record)
+        print(f"{len(df)} rijen opgenomen naar {path} ({report})")
+        return 0
+
+    if args.tracemalloc:
+        tracemalloc.start()
+
+    rec = Recorder()
+    out = rec.timed("load_from_db", dash_mod.load_snapshot_outputs, "refresh-db", None)
+    if out is None or out[4] is None:
+        print("load_from_db gaf geen data terug", file=sys.stderr)
+        return 2
+    index, df_store = out[1], out[4]
+    snap = dash_mod.get_snapshot()
+    rows, version = len(snap["df"]), snap["version"]
+    # Wat de browser per dataversie binnenkrijgt i.p.v. een figuur per filterklik
+    agg_bytes = len(json.dumps(dash_mod.spot_cells(snap["df"], version)))
+
+    def user(uid):
+        rng = random.Random(args.seed * 1000 + uid)
+        for _ in range(args.sessions):
+            # Poll zoals de browser (versie ongewijzigd -> enkel statusregel)
+            rec.timed("load_from_db", dash_mod.load_snapshot_outputs, "snapshot-poll", version)
+            user_session(dash_mod, rec, rng, df_store, index, version)
+
+    t0 = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.users) as pool:
+        list(pool.map(user, range(args.users)))
+    wall = time.perf_counter() - t0
+
+    report = {
+        "rows": rows,
+        "store_bytes": len(df_store),
+        "agg_store_bytes": agg_bytes,
+        "clientside_chart": dash_mod.CLIENTSIDE_CHART,
+        "users": args.users,
+        "wall_seconds": round(wall, 2),
+        # ru_maxrss: kB op Linux
+        "peak_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+        "callbacks": {},
+    }
+    if args.tracemalloc:
+        report["tracemalloc_peak_mb"] = round(tracemalloc.get_traced_memory()[1] / 2**20, 1)
+    for name, samples in sorted(rec.samples.items()):
+        report["callbacks"][name] = {
+            "n": len(samples),
+            "errors": rec.errors[name],
+            "p50_ms": round(percentile(samples, 50), 1),
+            "p95_ms": round(percentile(samples, 95), 1),
+            "p99_ms": round(percentile(samples, 99), 1),
+            "max_ms": round(max(samples), 1),
+        }
+
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        print(f"{rows} rijen, store {len(df_store) / 1024:,.0f} kB, agg-store {agg_bytes / 1024:,.0f} kB, "
+              f"{'client-side' if dash_mod.CLIENTSIDE_CHART else 'server-side'} chart, {args.users} gebruikers, "
+              f"{wall:.1f}s, piek RSS {report['peak_rss_mb']} MB"
+              + (f", tracemalloc piek {report['tracemalloc_peak_mb']} MB" if args.tracemalloc else ""))
+        print(f"{'callback':<16}{'n':>6}{'fout':>6}{'p50':>10}{'p95':>10}{'p99':>10}{'max':>10}")
+        for name, r in report["callbacks"].items():
+            print(f"{name:<16}{r['n']:>6}{r['errors']:>6}{r['p50_ms']:>10}{r['p95_ms']:>10}"
+                  f"{r['p99_ms']:>10}{r['max_ms']:>10}")
+
+    failed = any(rec.errors.values())
+    for limit in args.max_p95:
+        name, _, ms = limit.partition("=")
+        p95 = report["callbacks"].get(name, {}).get("p95_ms")
+        if p95 is not None and p95 > float(ms):
+            print(f"REGRESSIE: {name} p95 {p95} ms > {ms} ms", file=sys.stderr)
+            failed = True
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(run(parse_args()))
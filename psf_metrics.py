@@ -0,0 +1,123 @@
+"""
+Prometheus-metrics voor het PSF dashboard (/metrics).
+
+Elke Dash server-callback loopt via POST /_dash-update-component; install() meet
+daar per callback de duur en de request/response payload. De DB-laag en de
+zware stappen in de callbacks (store, groupby, figuur) melden zich via stage();
+de JSON-serialisatie van de callback-response telt als stage "json_encode".
+
+Met gunicorn -w N: zet PROMETHEUS_MULTIPROC_DIR (lege map) zodat /metrics de
+tellers van alle workers samenvoegt.
+"""
+import json
+import logging
+import os
+import time
+from contextlib import contextmanager
+
+import dash._callback
+from flask import Response, g, request
+from prometheus_client import (CONTENT_TYPE_LATEST, CollectorRegistry, Counter, Histogram,
+                               generate_latest, multiprocess, REGISTRY)
+
+SLOW_CALLBACK_MS = float(os.getenv("PSF_SLOW_CALLBACK_MS", "0"))   # 0 = slow-log uit
+
+log = logging.getLogger("psf.slow")
+
+SECONDS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+BYTES = (1e3, 1e4, 5e4, 1e5, 5e5, 1e6, 5e6, 1e7, 5e7)
+ROWS = (10, 100, 1e3, 5e3, 1e4, 5e4, 1e5, 5e5)
+
+DB_CONNECT = Histogram("psf_db_connect_seconds", "Tijd om een DB-verbinding te openen", buckets=SECONDS)
+DB_QUERY = Histogram("psf_db_query_seconds", "Duur van een data-fetch per bron", ["source"], buckets=SECONDS)
+DB_ROWS = Histogram("psf_db_rows_fetched", "Rijen per fetch (_sum = totaal)", ["source"], buckets=ROWS)
+STAGE = Histogram("psf_stage_seconds", "Duur per verwerkingsstap", ["stage"], buckets=SECONDS)
+CALLBACK = Histogram("psf_callback_seconds", "Duur per Dash callback (server)", ["callback"], buckets=SECONDS)
+CALLBACK_REQ = Histogram("psf_callback_request_bytes", "Request payload per Dash callback", ["callback"], buckets=BYTES)
+CALLBACK_RESP = Histogram("psf_callback_response_bytes", "Response payload per Dash callback", ["callback"], buckets=BYTES)
+SLOW = Counter("psf_callback_slow_total", "Callbacks boven PSF_SLOW_CALLBACK_MS", ["callback"])
+
+
+@contextmanager
+def stage(name):
+    """Meet een stap: with stage('groupby'): ..."""
+    t0 = time.perf_counter()
+    try:
+        yield
+    finally:
+        STAGE.labels(name).observe(time.perf_counter() - t0)
+
+
+def observe_fetch(source, connect_seconds, query_seconds, rows):
+    if connect_seconds is not None:
+        DB_CONNECT.observe(connect_seconds)
+    DB_QUERY.labels(source).observe(query_seconds)
+    DB_ROWS.labels(source).observe(rows)
+
+
+def _callback_name(body):
+    # Dash zet de output(s) in "output", bv. "..bar-chart.figure...chart-info.children.."
+    output = (body or {}).get("output", "?")
+    ids = [part.split(".")[0] for part in output.strip(".").split("...") if part]
+    return "+".join(ids) or "?"
+
+
+def _short(value, limit=200):
+    text = json.dumps(value, default=str)
+    return text if len(text) <= limit else f"<{len(text)} bytes>"
+
+
+def _timed_to_json(to_json):
+    def timed(*args, **kwargs):
+        with stage("json_encode"):
+            return to_json(*args, **kwargs)
+    timed.psf_timed = True
+    return timed
+
+
+def install(server, path="/metrics"):
+    """Hooks op de Flask server + /metrics endpoint."""
+
+    # Dash serialiseert de response binnen zijn eigen callback-wrapper (dash._callback.to_json);
+    # vóór after_request is er geen ander haakje om json_encode apart te meten.
+    if not getattr(dash._callback.to_json, "psf_timed", False):
+        dash._callback.to_json = _timed_to_json(dash._callback.to_json)
+
+    @server.before_request
+    def _start_timer():
+        if request.path.endswith("/_dash-update-component"):
+            g.psf_t0 = time.perf_counter()
+
+    @server.after_request
+    def _observe_callback(response):
+        t0 = g.pop("psf_t0", None)
+        if t0 is None:
+            return response
+        seconds = time.perf_counter() - t0
+        body = request.get_json(silent=True)
+        if not isinstance(body, dict):
+            body = {}   # geen/ongeldige JSON: enkel duur en groottes meten
+        name = _callback_name(body)
+        CALLBACK.labels(name).observe(seconds)
+        CALLBACK_REQ.labels(name).observe(request.content_length or 0)
+        size = response.calculate_content_length()
+        if size is not None:
+            CALLBACK_RESP.labels(name).observe(size)
+
+        if SLOW_CALLBACK_MS and seconds * 1000 > SLOW_CALLBACK_MS:
+            SLOW.labels(name).inc()
+            inputs = {f"{i.get('id')}.{i.get('property')}": _short(i.get("value"))
+                      for key in ("inputs", "state") if isinstance(body.get(key), list)
+                      for i in body[key] if isinstance(i, dict)}
+            log.warning("Trage callback %s: %.0f ms, request %s B, response %s B, inputs %s",
+                        name, seconds * 1000, request.content_length, size, inputs)
+        return response
+
+    @server.get(path)
+    def metrics():
+        if os.getenv("PROMETHEUS_MULTIPROC_DIR"):
+            registry = CollectorRegistry()
+            multiprocess.MultiProcessCollector(registry)
+        else:
+            registry = REGISTRY
+        return Response(generate_latest(registry), mimetype=CONTENT_TYPE_LATEST)
@@ -0,0 +1,198 @@
+"""
+Databronnen voor het PSF dashboard.
+
+Standaard haalt psf_dashboard alles uit GADATA (SQL). Via PSF_DATA_SOURCE kan
+een lokale vervanger ingeplugd worden met hetzelfde schema als SQL_TEXT:
+
+    PSF_DATA_SOURCE=synthetic            -> SyntheticSource (schaal via PSF_SYNTH_*)
+    PSF_DATA_SOURCE=replay:<pad>         -> ReplaySource (opgenomen snapshot, .parquet of .csv)
+"""
+import os
+import re
+from datetime import datetime, timedelta
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+# Kolommen (en volgorde) zoals SQL_TEXT ze teruggeeft
+SQL_COLUMNS = [
+    'TimerName', 'ResponsibleWeldMaster', 'NPTName', 'SpotName',
+    'AVG_PSF_last_shift', 'STDEV_stabilisationFactor', 'cnt_welds_lastShift',
+    'uirPsfCondTol', 'uirPsfLowerTol', 'rt_spot_id', 'Lastweld', 'uirRegulationActive',
+    'CondTol<40', 'LowerTol<60', 'Tol=OK', 'TolBands_switched',
+]
+
+
+def like_to_regex(pattern):
+    """SQL LIKE patroon -> gecompileerde regex (case-insensitive, zoals SQL Server)."""
+    parts = []
+    for ch in pattern:
+        if ch == '%':
+            parts.append('.*')
+        elif ch == '_':
+            parts.append('.')
+        else:
+            parts.append(re.escape(ch))
+    return re.compile('^' + ''.join(parts) + '$', re.IGNORECASE)
+
+
+def apply_sql_filters(df, timer_like, not_like1, not_like2, hours_back, spot_not_like):
+    """Zelfde WHERE-clausule als SQL_TEXT, maar op een lokaal frame."""
+    timers = df['TimerName'].astype(str)
+    mask = (
+        timers.str.match(like_to_regex(timer_like)) &
+        ~timers.str.match(like_to_regex(not_like1)) &
+        ~timers.str.match(like_to_regex(not_like2)) &
+        ~df['SpotName'].astype(str).str.match(like_to_regex(spot_not_like))
+    )
+    if 'Lastweld' in df.columns and hours_back is not None:
+        since = pd.Timestamp(datetime.now() - timedelta(hours=int(hours_back)))
+        lastweld = pd.to_datetime(df['Lastweld'])
+        # Opgenomen snapshots zijn ouder dan "nu": venster relatief t.o.v. de laatste las
+        if len(lastweld) and lastweld.max() < since:
+            since = lastweld.max() - timedelta(hours=int(hours_back))
+        mask &= lastweld > since
+    return df[mask].reset_index(drop=True)
+
+
+class SyntheticSource:
+    """
+    Reproduceerbare kunstmatige dataset met het SQL_TEXT-schema.
+    Schaal: lines x timers x spots x rows_per_spot rijen.
+    """
+
+    def __init__(self, lines=("GA-5",), timers=40, spots=60, rows_per_spot=3, seed=0):
+        self.lines = list(lines)
+        self.timers = timers
+        self.spots = spots
+        self.rows_per_spot = rows_per_spot
+        self.seed = seed
+        self._universe = None
+
+    @classmethod
+    def from_env(cls):
+        return cls(
+            lines=[l.strip() for l in os.getenv("PSF_SYNTH_LINES", "GA-5").split(",") if l.strip()],
+            timers=int(os.getenv("PSF_SYNTH_TIMERS", "40")),
+            spots=int(os.getenv("PSF_SYNTH_SPOTS", "60")),
+            rows_per_spot=int(os.getenv("PSF_SYNTH_ROWS_PER_SPOT", "3")),
+            seed=int(os.getenv("PSF_SYNTH_SEED", "0")),
+        )
+
+    def universe(self):
+        if self._universe is None:
+            self._universe = self._generate()
+        return self._universe
+
+    def _generate(self):
+        rng = np.random.default_rng(self.seed)
+        timer_names, npt_names = [], []
+        for line in self.lines:
+            for t in range(self.timers):
+                timer_names.append(f"{line}{t:02d}TW{t % 4 + 1}")
+                npt_names.append(f"{line}{t // 8}")
+        n_timers = len(timer_names)
+        n_spots = n_timers * self.spots
+        n = n_spots * self.rows_per_spot
+
+        spot_idx = np.repeat(np.arange(n_spots), self.rows_per_spot)
+        timer_idx = spot_idx // self.spots
+        # Spot-eigenschappen zijn vast per spot, metingen variëren per rij
+        cond = rng.choice([20, 30, 40, 50], n_spots, p=[0.3, 0.3, 0.25, 0.15])[spot_idx]
+        lower = rng.choice([40, 60, 70], n_spots, p=[0.3, 0.5, 0.2])[spot_idx]
+        adaptive = (rng.random(n_spots) < 0.8).astype(int)[spot_idx]
+        spot_psf = rng.normal(82, 7, n_spots)[spot_idx]
+
+        now = datetime.now()
+        return pd.DataFrame({
+            'TimerName': np.array(timer_names)[timer_idx],
+            'ResponsibleWeldMaster': 'SYNTH',
+            'NPTName': np.array(npt_names)[timer_idx],
+            'SpotName': (100000 + spot_idx).astype(str),
+            'AVG_PSF_last_shift': np.clip(spot_psf + rng.normal(0, 2, n), 30, 100),
+            'STDEV_stabilisationFactor': rng.gamma(2.0, 0.8, n),
+            'cnt_welds_lastShift': rng.poisson(60, n),
+            'uirPsfCondTol': cond,
+            'uirPsfLowerTol': lower,
+            'rt_spot_id': spot_idx,
+            'Lastweld': pd.Timestamp(now) - pd.to_timedelta(rng.integers(0, 16 * 3600, n), unit='s'),
+            'uirRegulationActive': adaptive,
+            'CondTol<40': (cond <= 40).astype(int),
+            'LowerTol<60': (lower <= 60).astype(int),
+            'Tol=OK': ((cond <= 40) & (lower <= 60)).astype(int),
+            'TolBands_switched': (cond > lower).astype(int),
+        }, columns=SQL_COLUMNS)
+
+    def fetch(self, timer_like, not_like1, not_like2, hours_back, spot_not_like):
+        return apply_sql_filters(self.universe(), timer_like, not_like1, not_like2, hours_back, spot_not_like)
+
+    def series(self, spot_ids, start, end, limit, weld_interval=40):
+        """
+        PSF per las (ts, psf) zoals SERIES_SQL: ongeveer één las per `weld_interval` sec,
+        rond het shiftgemiddelde van de spot met een trage drift. Reproduceerbaar per spot.
+        """
+        universe = self.universe()
+        frames = []
+        for spot_id in spot_ids:
+            mean = universe.loc[universe['rt_spot_id'] == spot_id, 'AVG_PSF_last_shift'].mean()
+            # Vast tijdsraster (epoch-gebaseerd) zodat overlappende vensters dezelfde lassen geven
+            first = int(pd.Timestamp(start).timestamp()) // weld_interval + 1
+            last = int(pd.Timestamp(end).timestamp()) // weld_interval
+            ticks = np.arange(first, last + 1)
+            if not len(ticks):
+                continue
+            rng = np.random.default_rng([self.seed, int(spot_id)])
+            phase = rng.uniform(0, 2 * np.pi)
+            drift = 3 * np.sin(ticks * weld_interval / 86400 * 2 * np.pi + phase)
+            noise = np.random.default_rng([self.seed, int(spot_id), int(first)]).normal(0, 2.5, len(ticks))
+            frames.append(pd.DataFrame({
+                'ts': pd.to_datetime(ticks * weld_interval, unit='s'),
+                'psf': np.clip((82 if np.isnan(mean) else mean) + drift + noise, 30, 100),
+            }))
+        if not frames:
+            return pd.DataFrame(columns=['ts', 'psf'])
+        df = pd.concat(frames, ignore_index=True)
+        return df.sort_values('ts', ascending=False).head(limit).reset_index(drop=True)
+
+
+class ReplaySource:
+    """Opgenomen snapshot (zie record_snapshot) terugspelen met dezelfde filters als SQL_TEXT."""
+
+    def __init__(self, path):
+        self.path = Path(path)
+        self._df = None
+
+    def frame(self):
+        if self._df is None:
+            if self.path.suffix == '.csv':
+                self._df = pd.read_csv(self.path, parse_dates=['Lastweld'])
+            else:
+                self._df = pd.read_parquet(self.path)
+        return self._df
+
+    def fetch(self, timer_like, not_like1, not_like2, hours_back, spot_not_like):
+        return apply_sql_filters(self.frame(), timer_like, not_like1, not_like2, hours_back, spot_not_like)
+
+
+def record_snapshot(df, path):
+    """Bewaar een ruw fetch-resultaat als replay-bestand."""
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    if path.suffix == '.csv':
+        df.to_csv(path, index=False)
+    else:
+        df.to_parquet(path, index=False)
+    return path
+
+
+def source_from_env():
+    """None = live SQL Server (standaard)."""
+    spec = os.getenv("PSF_DATA_SOURCE", "sql").strip()
+    if spec == "sql":
+        return None
+    if spec == "synthetic":
+        return SyntheticSource.from_env()
+    if spec.startswith("replay:"):
+        return ReplaySource(spec.split(":", 1)[1])
+    raise ValueError(f"Onbekende PSF_DATA_SOURCE: {spec}")
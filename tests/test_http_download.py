@@ -0,0 +1,138 @@
+"""Directe ZIP-download (stream_to_file/http_download) tegen een lokale stand-in van de ARO-server."""
+import hashlib
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+import pytest
+
+requests = pytest.importorskip("requests")
+arorip = pytest.importorskip("arorip")
+
+PAYLOAD = bytes(range(256)) * 1200   # ~300 kB: meerdere chunks van ARO_HTTP_CHUNK
+
+
+class AroStandIn(BaseHTTPRequestHandler):
+    """Variantpagina -> 'tableau' frame -> Download-formulier -> ZIP, zoals docs.arotechnologies.com."""
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        query = parse_qs(url.query)
+        if url.path == "/menu.php":
+            self._html(f'<frameset><frame name="tableau" src="frame.php?v={query["numvariante"][0]}"></frameset>')
+        elif url.path == "/frame.php":
+            self._html(f'<form action="zip.php" method="get"><input type="hidden" name="v" value="{query["v"][0]}">'
+                       '<input type="submit" value="Download"></form>')
+        elif url.path == "/zip.php":
+            self._zip()
+        else:
+            self.send_error(404)
+
+    def _html(self, body):
+        data = body.encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "text/html")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _zip(self):
+        state = self.server.state
+        state["ranges"].append(self.headers.get("Range"))
+        start = 0
+        if self.headers.get("Range") and state["honor_range"]:
+            start = int(self.headers["Range"].removeprefix("bytes=").rstrip("-"))
+        body = PAYLOAD[start:]
+        self.send_response(206 if start else 200)
+        self.send_header("Content-Type", "application/zip")
+        self.send_header("Content-Length", str(len(body)))
+        if start:
+            self.send_header("Content-Range", f"bytes {start}-{len(PAYLOAD) - 1}/{len(PAYLOAD)}")
+        if state["sha256"]:
+            self.send_header("X-Checksum-Sha256", state["sha256"])
+        self.end_headers()
+        if state["drops"]:
+            # Verbinding halverwege weg: Content-Length belooft meer dan er komt
+            state["drops"] -= 1
+            self.wfile.write(body[:len(body) // 2])
+            self.close_connection = True
+            return
+        self.wfile.write(body)
+
+
+@pytest.fixture
+def aro(monkeypatch):
+    server = ThreadingHTTPServer(("127.0.0.1", 0), AroStandIn)
+    server.state = {"ranges": [], "honor_range": True, "drops": 0,
+                    "sha256": hashlib.sha256(PAYLOAD).hexdigest()}
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    base = f"http://127.0.0.1:{server.server_address[1]}"
+    monkeypatch.setattr(arorip, "ARO_URL", base)
+    monkeypatch.setattr(arorip.time, "sleep", lambda seconds: None)
+    try:
+        yield base, server.state
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+def fetch(base, dest):
+    with requests.Session() as http:
+        return arorip.stream_to_file(http, "get", f"{base}/zip.php", [("v", "X1")], dest)
+
+
+def test_resume_with_206_after_a_dropped_connection(aro, tmp_path):
+    base, state = aro
+    state["drops"] = 1
+    dest = tmp_path / "_X1.zip"
+    info = fetch(base, dest)
+
+    assert state["ranges"][0] is None
+    assert state["ranges"][1].startswith("bytes=") and state["ranges"][1] != "bytes=0-"
+    assert dest.read_bytes() == PAYLOAD
+    assert info["size"] == len(PAYLOAD)
+    assert info["sha256"] == hashlib.sha256(PAYLOAD).hexdigest()
+    assert not dest.with_name(dest.name + ".part").exists()
+
+
+def test_server_ignoring_range_restarts_from_zero(aro, tmp_path):
+    base, state = aro
+    state.update(drops=1, honor_range=False)
+    dest = tmp_path / "_X1.zip"
+    info = fetch(base, dest)
+
+    assert state["ranges"][1] is not None   # hervatting gevraagd, maar 200 met alles gekregen
+    assert dest.read_bytes() == PAYLOAD     # .part afgekapt, niet aangevuld
+    assert info["sha256"] == hashlib.sha256(PAYLOAD).hexdigest()
+
+
+def test_sha_mismatch_deletes_the_partial_file(aro, tmp_path, monkeypatch):
+    base, state = aro
+    state["sha256"] = hashlib.sha256(b"iets anders").hexdigest()
+    monkeypatch.setattr(arorip, "ARO_HTTP_RETRIES", 1)
+    dest = tmp_path / "_X1.zip"
+    with pytest.raises(arorip.ChecksumMismatch):
+        fetch(base, dest)
+
+    assert len(state["ranges"]) == 2
+    assert state["ranges"][1] is None       # na de mismatch van voor af aan, niet hervat
+    assert not dest.exists()
+    assert not dest.with_name(dest.name + ".part").exists()
+
+
+def test_http_download_follows_the_download_form(aro, tmp_path):
+    base, state = aro
+
+    class Session:
+        def http_session(self):
+            return requests.Session()
+
+    dest = tmp_path / "_X1.zip"
+    info = arorip.http_download(Session(), "X1", dest)
+    assert dest.read_bytes() == PAYLOAD
+    assert info["size"] == len(PAYLOAD)
+    assert state["ranges"] == [None]
@@ -0,0 +1,64 @@
+"""Gedeelde snapshot: elke gunicorn-worker serveert dezelfde versie (ETag, snapshot-poll, agg-store)."""
+import importlib
+import os
+
+import pytest
+
+
+@pytest.fixture(scope="module")
+def dash_mod(tmp_path_factory):
+    pytest.importorskip("dash")
+    root = tmp_path_factory.mktemp("psf")
+    env = dict(PSF_DATA_SOURCE="synthetic", PSF_HISTORY_DIR=str(root / "history"),
+               PSF_SNAPSHOT_DIR=str(root / "snapshot"))
+    saved = {k: os.environ.get(k) for k in env}
+    os.environ.update(env)   # wordt bij import gelezen
+    try:
+        yield importlib.import_module("psf_dashboard")
+    finally:
+        for k, v in saved.items():
+            if v is None:
+                os.environ.pop(k, None)
+            else:
+                os.environ[k] = v
+
+
+def as_other_worker(d):
+    """Vergeet de snapshot in dit proces, zoals een tweede worker die nog niets geladen heeft."""
+    with d._snapshot_lock:
+        d._snapshot.update(df=None, version=None, loaded_at=None, scopes=[], index={}, store=None)
+        d._recent.clear()
+    d._shared_seen = None
+
+
+def test_export_etag_is_the_same_on_every_worker(dash_mod):
+    client = dash_mod.server.test_client()
+    first = client.get("/api/export-xml")
+    assert first.status_code == 200
+    refresh = dash_mod._refresh_future
+
+    as_other_worker(dash_mod)
+    again = client.get("/api/export-xml", headers={"If-None-Match": first.headers["ETag"]})
+    assert again.status_code == 304
+    assert dash_mod._refresh_future is refresh   # overgenomen, niet opnieuw uit de bron gehaald
+
+
+def test_snapshot_poll_does_not_reship_on_another_worker(dash_mod):
+    version = dash_mod.current_snapshot()["version"]
+    refresh = dash_mod._refresh_future
+    as_other_worker(dash_mod)
+    outputs = dash_mod.load_snapshot_outputs("snapshot-poll", version)
+    assert all(o is dash_mod.no_update for o in outputs[1:])
+    assert dash_mod._refresh_future is refresh
+
+
+def test_agg_store_matches_the_version_in_the_browser(dash_mod):
+    old = dash_mod.current_snapshot()
+    df = old["df"].assign(cnt_welds_lastShift=old["df"]["cnt_welds_lastShift"] + 1)
+    dash_mod.publish_snapshot(dash_mod.set_snapshot(df))
+    assert dash_mod.current_snapshot()["version"] != old["version"]
+
+    as_other_worker(dash_mod)
+    if not dash_mod.CLIENTSIDE_CHART:
+        pytest.skip("agg-store enkel bij PSF_CLIENTSIDE_CHART=1")
+    assert dash_mod.build_agg_store(old["version"]) == dash_mod.spot_cells(old["df"], old["version"])
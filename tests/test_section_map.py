@@ -0,0 +1,71 @@
+"""SectionMap: column-G section boundaries, kept in step with planned inserts/deletes."""
+from openpyxl import Workbook
+
+from bom_merge import SectionMap
+
+
+def sheet(g_values):
+    ws = Workbook().active
+    for row, value in enumerate(g_values, start=1):
+        ws.cell(row=row, column=7, value=value)
+    return ws
+
+
+G = [None, "Moving Arm", None, None, "FIXED ARM", None, "Console", None, None]
+
+
+def test_scan_and_find():
+    sections = SectionMap(sheet(G))
+    assert sections.rows == [2, 5, 7]
+    assert sections.find("moving arm") == 2
+    assert sections.find("Fixed Arm") == 5   # hoofdletterongevoelig
+    assert sections.find("console") == 7
+    assert sections.find("Frame") is None
+
+
+def test_find_ignores_non_text_values():
+    sections = SectionMap(sheet([None, 42, "Console"]))
+    assert sections.rows == [2, 3]
+    assert sections.find("42") is None
+    assert sections.find("console") == 3
+
+
+def test_next_boundary():
+    sections = SectionMap(sheet(G))
+    assert sections.next_boundary(2) == 5
+    assert sections.next_boundary(3) == 5
+    assert sections.next_boundary(5) == 7
+    # Laatste sectie loopt tot het einde van de sheet
+    assert sections.next_boundary(7) == 10
+
+
+def test_end_row_callback():
+    rows = list(range(20))
+    sections = SectionMap(sheet(G), end_row=lambda: len(rows))
+    assert sections.next_boundary(7) == 21
+
+
+def test_rows_inserted_and_deleted():
+    sections = SectionMap(sheet(G))
+    sections.rows_inserted(5, 3)
+    assert sections.rows == [2, 8, 10]
+    sections.rows_deleted(3, 2)
+    assert sections.rows == [2, 6, 8]
+    # Een verwijderde G-rij verdwijnt, ook uit de find-cache
+    assert sections.find("fixed arm") == 6
+    sections.rows_deleted(6)
+    assert sections.rows == [2, 7]
+    assert sections.find("fixed arm") is None
+    assert sections.find("console") == 7
+
+
+def test_refresh_with_copied_g_values():
+    sections = SectionMap(sheet(G))
+    assert sections.find("console") == 7
+    # Gekopieerde rijen 3..4 bevatten zelf een G-waarde; Console verdwijnt op rij 7
+    sections.refresh(3, 4, [None, "Sub Assembly"])
+    sections.refresh(7, 7, [None])
+    assert sections.rows == [2, 4, 5]
+    assert sections.values == ["Moving Arm", "Sub Assembly", "FIXED ARM"]
+    assert sections.find("console") is None
+    assert sections.next_boundary(2) == 4
@@ -0,0 +1,154 @@
+"""SheetLayout: plan section replacements, then rebuild the sheet in one pass."""
+import io
+
+from openpyxl import Workbook
+from openpyxl.styles import Font, PatternFill
+
+import bom_merge
+from bom_merge import SheetLayout, find_section_row
+
+
+class NullLog:
+    def write(self, message, level=None):
+        pass
+
+    def enabled(self, level):
+        return False
+
+
+def main_sheet():
+    """
+    Main BOM sheet with three sections (keyword in column G):
+    row 1 header, 2 Moving Arm + 3 rows, 6 Fixed Arm + 2 rows, 9 Console + 2 rows.
+    """
+    wb = Workbook()
+    ws = wb.active
+    ws.title = "GA-5001-A"
+    ws["A1"] = "Header"
+    ws.merge_cells("A1:C1")
+    for row, keyword in ((2, "Moving Arm"), (6, "Fixed Arm"), (9, "Console")):
+        ws.cell(row=row, column=7, value=keyword)
+    for row in (3, 4, 5, 7, 8, 10, 11):
+        ws.cell(row=row, column=1, value=f"old{row}")
+        ws.cell(row=row, column=4, value=f"keep-style{row}").font = Font(italic=True)
+    ws.merge_cells("A7:B7")
+    ws.merge_cells("A10:B10")
+    ws.row_dimensions[10].height = 30
+    return wb, ws
+
+
+def source_sheet(rows, merge=None):
+    wb = Workbook()
+    ws = wb.active
+    for i in range(1, rows + 1):
+        ws.cell(row=i, column=1, value=f"new{i}")
+        ws.cell(row=i, column=2, value=i)
+    ws["A1"].font = Font(bold=True, color="FF112233")
+    ws["A1"].fill = PatternFill("solid", fgColor="FFFFFF00")
+    ws["B1"].number_format = "0.000"
+    if merge:
+        ws.merge_cells(merge)
+    return ws
+
+
+def column(ws, col, first, last):
+    return [ws.cell(row=r, column=col).value for r in range(first, last + 1)]
+
+
+def replace(ws, keyword, source):
+    layout = SheetLayout(ws)
+    start = find_section_row(layout.sections, keyword, NullLog())
+    layout.replace_section(source, start, NullLog())
+    layout.apply()
+    return layout
+
+
+def test_grow_section_shifts_rows_merges_and_heights():
+    wb, ws = main_sheet()
+    replace(ws, "Moving Arm", source_sheet(5, merge="A1:B1"))
+
+    assert ws.max_row == 13
+    assert column(ws, 7, 1, 13) == [None, "Moving Arm"] + [None] * 5 + ["Fixed Arm", None, None, "Console", None, None]
+    assert column(ws, 1, 3, 7) == ["new1", "new2", "new3", "new4", "new5"]
+    assert column(ws, 1, 9, 13) == ["old7", "old8", None, "old10", "old11"]
+    # Oude rijen die hergebruikt worden: waarde weg, stijl blijft
+    assert ws["D3"].value is None and ws["D3"].font.i
+    assert ws["D6"].value is None and not ws["D6"].font.i
+    assert sorted(str(r) for r in ws.merged_cells.ranges) == ["A12:B12", "A1:C1", "A3:B3", "A9:B9"]
+    assert ws.row_dimensions[12].height == 30
+    assert ws.row_dimensions[10].height is None
+
+
+def test_shrink_section_drops_rows_and_their_merges():
+    wb, ws = main_sheet()
+    replace(ws, "Fixed Arm", source_sheet(1))
+
+    assert ws.max_row == 10
+    assert column(ws, 7, 6, 10) == ["Fixed Arm", None, "Console", None, None]
+    assert column(ws, 1, 7, 10) == ["new1", None, "old10", "old11"]
+    # A7:B7 ligt op een hergebruikte rij en blijft; A10:B10 schuift één rij op
+    assert sorted(str(r) for r in ws.merged_cells.ranges) == ["A1:C1", "A7:B7", "A9:B9"]
+    assert ws.row_dimensions[9].height == 30
+
+
+def test_three_sections_in_one_plan():
+    wb, ws = main_sheet()
+    layout = SheetLayout(ws)
+    for keyword, rows in (("Moving Arm", 1), ("Fixed Arm", 4), ("Console", 3)):
+        start = find_section_row(layout.sections, keyword, NullLog())
+        layout.replace_section(source_sheet(rows), start, NullLog())
+    layout.apply()
+
+    assert column(ws, 7, 1, ws.max_row) == [None, "Moving Arm", None, "Fixed Arm"] + [None] * 4 + ["Console"] + [None] * 3
+    assert column(ws, 1, 3, 3) == ["new1"]
+    assert column(ws, 1, 5, 8) == ["new1", "new2", "new3", "new4"]
+    assert column(ws, 1, 10, 12) == ["new1", "new2", "new3"]
+
+
+def test_copied_styles_survive_save_and_reload():
+    wb, ws = main_sheet()
+    replace(ws, "Moving Arm", source_sheet(3))
+    buf = io.BytesIO()
+    wb.save(buf)
+    ws = bom_merge.load_workbook(io.BytesIO(buf.getvalue()))["GA-5001-A"]
+
+    assert ws["A3"].font.b and ws["A3"].font.color.rgb == "FF112233"
+    assert ws["A3"].fill.fgColor.rgb == "FFFFFF00"
+    assert ws["B3"].number_format == "0.000"
+    assert not ws["A4"].font.b
+
+
+def test_untouched_layout_leaves_sheet_alone():
+    wb, ws = main_sheet()
+    layout = SheetLayout(ws)
+    cells = dict(ws._cells)
+    layout.apply()
+    assert ws._cells == cells
+
+
+def test_merge_end_to_end(tmp_path):
+    wb, ws = main_sheet()
+    wb.create_sheet("GA-5002-A")["G1"] = "Console"
+    wb.save(tmp_path / "main.xlsx")
+    conv = Workbook()
+    conv.active.title = "111"
+    conv["111"]["A1"] = "moving"
+    conv.create_sheet("333")["A1"] = "console"
+    conv.save(tmp_path / "conv.xlsx")
+    equipment = Workbook()
+    equipment.active.append(["MachineNumber", "Completemov.Arm", "Completefix.Arm", "CONSOLE"])
+    equipment.active.append(["5001-A", 111, "n/a", 333])
+    equipment.active.append(["5002-A", None, None, None])
+    equipment.active.append(["5003-A", 111, 111, 111])
+    equipment.active.append(["4000-A", 111, 111, 111])
+    equipment.save(tmp_path / "equipment.xlsx")
+
+    results = bom_merge.merge(tmp_path / "equipment.xlsx", [tmp_path / "conv.xlsx"], tmp_path / "main.xlsx",
+                              tmp_path / "out.xlsx")
+
+    assert [(r["machine"], r["status"]) for r in results] == [
+        ("GA-5001-A", "partial"), ("GA-5002-A", "missing"), ("GA-5003-A", "not_found")]
+    out = bom_merge.load_workbook(tmp_path / "out.xlsx")
+    assert out["GA-5001-A"]["A3"].value == "moving"
+    assert out["GA-5001-A"].sheet_properties.tabColor.rgb == bom_merge.TAB_COLOR_PARTIAL.rgb
+    assert out["GA-5002-A"].sheet_properties.tabColor.rgb == bom_merge.TAB_COLOR_MISSING.rgb
@@ -0,0 +1,94 @@
+"""StyleMap / copy_cell_style: source style ids mapped once onto the target workbook."""
+from copy import copy
+
+from openpyxl import Workbook
+from openpyxl.cell.cell import Cell
+from openpyxl.styles import Alignment, Border, Font, PatternFill, Protection, Side
+
+from bom_merge import StyleMap, copy_cell_style
+
+
+def styled_source():
+    ws = Workbook().active
+    ws["A1"].font = Font(bold=True, color="FF112233")
+    ws["A1"].fill = PatternFill("solid", fgColor="FFFFFF00")
+    ws["B1"].border = Border(left=Side(style="thin"), bottom=Side(style="double"))
+    ws["B1"].alignment = Alignment(horizontal="center", wrap_text=True)
+    ws["C1"].number_format = "0.000"           # ingebouwd formaat
+    ws["D1"].number_format = "#,##0.0 \"kg\""   # eigen formaat
+    ws["E1"].protection = Protection(locked=False)
+    ws["F1"].font = Font(bold=True, color="FF112233")   # zelfde stijl als A1
+    ws["F1"].fill = PatternFill("solid", fgColor="FFFFFF00")
+    return ws
+
+
+def reference_copy(source, target):
+    """Wat openpyxl zelf doet via de publieke attributen."""
+    target.font = copy(source.font)
+    target.fill = copy(source.fill)
+    target.border = copy(source.border)
+    target.alignment = copy(source.alignment)
+    target.number_format = source.number_format
+    target.protection = copy(source.protection)
+
+
+STYLE_ATTRS = ("font", "fill", "border", "alignment", "number_format", "protection")
+
+
+def style(cell, attr):
+    # copy() haalt het echte stijlobject uit openpyxl's StyleProxy (die zelf niet vergelijkt)
+    return copy(getattr(cell, attr))
+
+
+def test_copy_matches_openpyxl_attribute_copy():
+    source = styled_source()
+    target = Workbook().active
+    reference = Workbook().active
+    for col in "ABCDEF":
+        copy_cell_style(source[f"{col}1"], target[f"{col}2"])
+        reference_copy(source[f"{col}1"], reference[f"{col}2"])
+        for attr in STYLE_ATTRS:
+            assert style(target[f"{col}2"], attr) == style(reference[f"{col}2"], attr), (col, attr)
+
+
+def test_each_source_style_added_once():
+    source = styled_source()
+    target_wb = Workbook()
+    target = target_wb.active
+    copy_cell_style(source["A1"], target["A1"])
+    sizes = [len(target_wb._fonts), len(target_wb._fills), len(target_wb._number_formats)]
+    for row in range(2, 50):
+        copy_cell_style(source["A1"], target.cell(row=row, column=1))
+        copy_cell_style(source["F1"], target.cell(row=row, column=2))
+    assert [len(target_wb._fonts), len(target_wb._fills), len(target_wb._number_formats)] == sizes
+    assert target["A1"]._style == target["B49"]._style
+
+
+def test_cached_ids_per_source_style():
+    source = styled_source()
+    source_wb, target_wb = source.parent, Workbook()
+    style_map = StyleMap()
+    first = style_map.target_ids(source["D1"]._style, source_wb, target_wb)
+    assert style_map.target_ids(source["D1"]._style, source_wb, target_wb) is first
+    ids = dict(first)
+    # Eigen formaat komt in de formatenlijst van het doel terecht
+    assert target_wb._number_formats[ids["numFmtId"] - 164] == "#,##0.0 \"kg\""
+
+
+def test_new_cell_without_style_array():
+    source = styled_source()
+    target = Workbook().active
+    cell = Cell(target, row=1, column=1)
+    assert cell._style is None
+    copy_cell_style(source["A1"], cell)
+    assert cell.font.b and cell.fill.fgColor.rgb == "FFFFFF00"
+
+
+def test_separate_maps_per_target_workbook():
+    source = styled_source()
+    first, second = Workbook().active, Workbook().active
+    second.parent._fonts.add(Font(italic=True))   # andere font-ids in het tweede doel
+    copy_cell_style(source["A1"], first["A1"])
+    copy_cell_style(source["A1"], second["A1"])
+    assert style(first["A1"], "font") == style(second["A1"], "font")
+    assert first["A1"]._style.fontId != second["A1"]._style.fontId